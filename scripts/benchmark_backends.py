@@ -0,0 +1,108 @@
+"""
+Compara la latencia y la memoria pico (RSS) de los backends de inferencia sobre planos de ejemplo.
+
+Uso:
+    python scripts/benchmark_backends.py planos/*.png --backends pytorch onnx openvino --runs 10
+
+Cada backend se mide en un subproceso propio para que la RSS pico no se contamine
+con los modelos cargados por los otros backends.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+def _rss_pico_mb():
+    try:
+        import resource
+        # En Linux ru_maxrss viene en KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024.0 * 1024.0)
+
+def medir_backend(backend, model_path, export_dir, imagenes, runs, conf, iou):
+    """Se ejecuta en el subproceso: carga el backend, calienta y mide cada predicción."""
+    import numpy as np
+    from src.services.imagenes import decodificar_imagen
+    from src.services.modelo import cargar_modelo
+    from src.services.cache_detecciones import identificador_modelo
+    from src.services.recursos import extraer_detecciones
+
+    t0 = time.perf_counter()
+    model = cargar_modelo(model_path, backend=backend, export_dir=export_dir, id_modelo=identificador_modelo(model_path))
+    carga_s = time.perf_counter() - t0
+
+    planos = []
+    for path in imagenes:
+        with open(path, 'rb') as f:
+            planos.append(decodificar_imagen(f.read()))
+
+    # Calentamiento (la primera llamada incluye inicializaciones perezosas)
+    model.predict(source=planos[0], conf=conf, iou=iou, save=False, verbose=False)
+
+    latencias_ms = []
+    num_detecciones = []
+    for _ in range(runs):
+        for img in planos:
+            t0 = time.perf_counter()
+            results = model.predict(source=img, conf=conf, iou=iou, save=False, verbose=False)[0]
+            latencias_ms.append((time.perf_counter() - t0) * 1000.0)
+            num_detecciones.append(len(extraer_detecciones(results)['conf']))
+
+    lat = np.array(latencias_ms)
+    return {
+        'backend': backend,
+        'carga_s': round(carga_s, 3),
+        'latencia_media_ms': round(float(lat.mean()), 2),
+        'latencia_p50_ms': round(float(np.percentile(lat, 50)), 2),
+        'latencia_p95_ms': round(float(np.percentile(lat, 95)), 2),
+        'imagenes_por_s': round(1000.0 / float(lat.mean()), 2),
+        'detecciones_media': round(float(np.mean(num_detecciones)), 1),
+        'rss_pico_mb': round(_rss_pico_mb(), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('imagenes', nargs='+', help='Planos de ejemplo (JPEG/PNG).')
+    parser.add_argument('--backends', nargs='+', default=['pytorch', 'onnx', 'openvino'])
+    parser.add_argument('--model', default='weights/best.pt')
+    parser.add_argument('--export-dir', default='weights/exported')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--iou', type=float, default=0.45)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        resultado = medir_backend(args.worker, args.model, args.export_dir, args.imagenes, args.runs, args.conf, args.iou)
+        print(json.dumps(resultado))
+        return
+
+    filas = []
+    for backend in args.backends:
+        cmd = [sys.executable, os.path.abspath(__file__), *args.imagenes,
+               '--model', args.model, '--export-dir', args.export_dir, '--runs', str(args.runs),
+               '--conf', str(args.conf), '--iou', str(args.iou), '--worker', backend]
+        proc = subprocess.run(cmd, capture_output=True, text=True, cwd=RAIZ)
+        if proc.returncode != 0:
+            print(f"ERROR en backend '{backend}':\n{proc.stderr.strip()[-2000:]}")
+            continue
+        filas.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    if not filas:
+        sys.exit(1)
+
+    columnas = list(filas[0].keys())
+    print(' | '.join(f"{c:>18}" for c in columnas))
+    for fila in filas:
+        print(' | '.join(f"{str(fila[c]):>18}" for c in columnas))
+
+if __name__ == '__main__':
+    main()
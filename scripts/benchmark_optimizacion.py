@@ -0,0 +1,125 @@
+"""
+Mide cómo escala optimizar_layout_completo con el número de mesas.
+
+Uso:
+    python scripts/benchmark_optimizacion.py --mesas 10 25 50 100 250 500 --motores rejilla raster
+    python scripts/benchmark_optimizacion.py --mesas 10 50 200 --densidad 4 --limite-s 120
+    python scripts/benchmark_optimizacion.py --mesas 50 100 --motores rejilla --refinamiento 0.05 8 2000
+    python scripts/benchmark_optimizacion.py --mesas 20 50 --densidad 3 --busqueda-local 2000 0
+    python scripts/benchmark_optimizacion.py --mesas 100 250 --motores rejilla --procesos 8
+    python scripts/benchmark_optimizacion.py --mesas 25 50 --angulos 0 15 30 45 60 75 90 105 120 135 150 165
+
+Genera salas sintéticas cuadradas cuya superficie crece con el número de mesas (--densidad m² por mesa),
+con mesas de 2 sillas en posiciones aleatorias (el optimizador las recoloca todas). Para cada motor
+imprime el tiempo total, las mesas colocadas y el exponente de escalado entre tamaños consecutivos
+(pendiente log-log: 1 = lineal, 2 = cuadrático) y la menor separación entre mesas colocadas. Un motor deja de medirse en tamaños mayores
+cuando una ejecución supera --limite-s.
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import sys
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+M_TO_PX = 20.0
+
+def generar_layout(num_mesas, densidad_m2, semilla):
+    """Layout sintético con el formato de /api/layout (coordenadas en metros y perímetro en píxeles)."""
+    import numpy as np
+
+    rng = np.random.default_rng(semilla)
+    lado = math.sqrt(num_mesas * densidad_m2)
+    objetos = {}
+    for i in range(num_mesas):
+        ancho = float(rng.uniform(0.6, 1.0))
+        x, y = rng.uniform(0.5, lado - ancho - 0.5, size=2)
+        sillas = [
+            {'id_silla': f's{i}_a', 'coords_metros': [x - 0.45, y + 0.1, x - 0.05, y + 0.5]},
+            {'id_silla': f's{i}_b', 'coords_metros': [x + ancho + 0.05, y + 0.1, x + ancho + 0.45, y + 0.5]},
+        ]
+        objetos[f'mesa_{i}'] = {
+            'id': f'mesa_{i}', 'tipo': 'mesa_cuadrada',
+            'coords_mesa_metros': [x, y, x + ancho, y + ancho], 'sillas_asignadas': sillas,
+        }
+    lado_px = lado * M_TO_PX
+    return {
+        'dimensions': {'width_m': lado, 'width_px': lado_px},
+        'm_to_px': M_TO_PX,
+        'perimeter': {'points': [[0, 0], [lado_px, 0], [lado_px, lado_px], [0, lado_px]]},
+        'objects': objetos,
+    }
+
+def medir(layout, motor, resolucion_cm, refinamiento=None, busqueda_local=None, pool=None, angulos=(0, 90)):
+    import shapely
+    from src.services.optimizador import optimizar_layout_completo, _get_object_footprint
+
+    # El optimizador informa por stdout de cada mesa; aquí solo interesa el tiempo
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        resultado = optimizar_layout_completo(
+            layout, motor=motor, resolucion_cm=resolucion_cm, refinamiento=refinamiento, busqueda_local=busqueda_local,
+            pool=pool, angulos=angulos
+        )
+        segundos = time.perf_counter() - t0
+    # Calidad: separación mínima entre las mesas colocadas (con sus sillas)
+    huellas = [_get_object_footprint(mesa) for mesa in resultado['objects'].values()]
+    separacion = min(
+        (shapely.distance(h, huellas[j + 1:]).min() for j, h in enumerate(huellas[:-1])), default=float('nan')
+    )
+    return segundos, len(resultado['objects']), float(separacion)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mesas', nargs='+', type=int, default=[10, 25, 50, 100, 250, 500])
+    parser.add_argument('--motores', nargs='+', default=['rejilla', 'raster'])
+    parser.add_argument('--densidad', type=float, default=6.0, help="Superficie de sala por mesa (m²).")
+    parser.add_argument('--resolucion-cm', type=float, default=5.0, help="Tamaño de celda del motor raster.")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--limite-s', type=float, default=300.0)
+    parser.add_argument('--refinamiento', nargs=3, type=float, metavar=('PRECISION_M', 'TOP_K', 'PRESUPUESTO'),
+                        help="Búsqueda de grueso a fino del motor rejilla (por defecto, solo la rejilla).")
+    parser.add_argument('--busqueda-local', nargs=2, type=int, metavar=('ITERACIONES', 'SEMILLA'),
+                        help="Búsqueda local tras la pasada voraz (por defecto, desactivada).")
+    parser.add_argument('--procesos', type=int, default=0,
+                        help="Procesos del pool de colocación del motor rejilla (0 = en este proceso).")
+    parser.add_argument('--angulos', nargs='+', type=float, default=[0, 90],
+                        help="Giros (grados) que se prueban para cada mesa.")
+    args = parser.parse_args()
+
+    from src.services.busqueda_local import BusquedaLocal
+    from src.services.colocacion import Refinamiento
+    from src.services.pool_colocacion import PoolColocacion
+    pool = PoolColocacion(args.procesos) if args.procesos > 0 else None
+    busqueda_local = BusquedaLocal(*args.busqueda_local) if args.busqueda_local else None
+    refinamiento = None
+    if args.refinamiento:
+        precision, top_k, presupuesto = args.refinamiento
+        refinamiento = Refinamiento(precision, int(top_k), int(presupuesto))
+
+    print(f"{'motor':>10} | {'mesas':>6} | {'colocadas':>9} | {'segundos':>9} | {'exponente':>9} | {'separación':>10}")
+    for motor in args.motores:
+        anterior = None
+        for num_mesas in sorted(args.mesas):
+            layout = generar_layout(num_mesas, args.densidad, args.semilla)
+            segundos, colocadas, separacion = medir(
+                layout, motor, args.resolucion_cm, refinamiento, busqueda_local, pool, tuple(args.angulos)
+            )
+            exponente = ''
+            if anterior is not None and anterior[1] > 0:
+                exponente = f"{math.log(segundos / anterior[1]) / math.log(num_mesas / anterior[0]):.2f}"
+            print(f"{motor:>10} | {num_mesas:>6} | {colocadas:>9} | {segundos:>9.2f} | {exponente:>9} | {separacion:>10.3f}",
+                  flush=True)
+            anterior = (num_mesas, segundos)
+            if segundos > args.limite_s:
+                print(f"{motor:>10} | se omiten tamaños mayores (superado --limite-s={args.limite_s:g})")
+                break
+    if pool is not None:
+        pool.cerrar()
+
+if __name__ == '__main__':
+    main()
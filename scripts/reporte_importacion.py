@@ -0,0 +1,71 @@
+"""
+Informe del tiempo de importación por módulo al crear la aplicación, y comprobación
+de que ningún módulo pesado se carga en el arranque (solo en los caminos que lo usan).
+
+Uso:
+    python scripts/reporte_importacion.py --top 25
+    python scripts/reporte_importacion.py --max-ms 1500   # falla si el arranque supera 1.5 s
+
+Es una comprobación manual (nada la ejecuta automáticamente): sale con código 1 si se
+importa algún módulo de MODULOS_DIFERIDOS o se supera --max-ms.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Módulos que solo deben cargarse al detectar, agrupar o depurar, nunca al crear la app
+MODULOS_DIFERIDOS = ('ultralytics', 'torch', 'matplotlib', 'cv2', 'scipy', 'PIL')
+
+_CODIGO_ARRANQUE = "from src import create_app; create_app('development')"
+_LINEA = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def medir_importaciones():
+    """Ejecuta el arranque con `python -X importtime` y devuelve [(modulo, propio_us, acumulado_us, nivel)]."""
+    entorno = dict(os.environ, WARMUP_ON_STARTUP='0', PYTHONPATH=RAIZ)
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CODIGO_ARRANQUE],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"La aplicación no arrancó:\n{proceso.stderr[-2000:]}")
+    modulos = []
+    for linea in proceso.stderr.splitlines():
+        m = _LINEA.match(linea)
+        if m:
+            propio, acumulado, sangria, nombre = m.groups()
+            modulos.append((nombre, int(propio), int(acumulado), len(sangria) // 2))
+    return modulos
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=20, help="Módulos de primer nivel a listar.")
+    parser.add_argument('--max-ms', type=float, default=None, help="Tiempo total máximo de importación.")
+    args = parser.parse_args()
+
+    modulos = medir_importaciones()
+    total_ms = sum(propio for _, propio, _, _ in modulos) / 1000.0
+
+    print(f"{'acumulado ms':>13} {'propio ms':>10}  módulo")
+    primer_nivel = sorted((m for m in modulos if m[3] <= 1), key=lambda m: m[2], reverse=True)
+    for nombre, propio, acumulado, _ in primer_nivel[:args.top]:
+        print(f"{acumulado / 1000.0:13.1f} {propio / 1000.0:10.1f}  {nombre}")
+    print(f"\nTotal de importación: {total_ms:.1f} ms ({len(modulos)} módulos)")
+
+    errores = []
+    cargados = {nombre.split('.')[0] for nombre, _, _, _ in modulos}
+    for pesado in MODULOS_DIFERIDOS:
+        if pesado in cargados:
+            errores.append(f"'{pesado}' se importa al crear la app; debería importarse solo donde se usa.")
+    if args.max_ms is not None and total_ms > args.max_ms:
+        errores.append(f"El arranque importa durante {total_ms:.1f} ms (máximo {args.max_ms:.1f} ms).")
+
+    for error in errores:
+        print(f"ERROR: {error}")
+    sys.exit(1 if errores else 0)
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,15 @@ from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 import os
-from ultralytics import YOLO
+from concurrent.futures import ThreadPoolExecutor
 from .config import config_by_name
+from .services.cache_detecciones import CacheDetecciones
+from .services.trabajos import AlmacenTrabajos, GestorTrabajos
+from .services.gestor_modelo import GestorModelo, RecargaCompartida
+from .services.servidor_inferencia import ClienteInferencia, GestorModeloRemoto
+from .services.almacen_subidas import AlmacenSubidas
+from .services.admision import crear_limitadores
+from .services.pool_colocacion import PoolColocacion
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -23,16 +30,76 @@ def create_app(config_name='default'):
     CORS(app, resources={r"/api/*": {"origins": ["*"]}})
     
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    app.upload_store = AlmacenSubidas(
+        app.config['UPLOAD_FOLDER'],
+        max_bytes=app.config['MAX_UPLOAD_MB'] * 1024 * 1024,
+        ttl_s=app.config['UPLOAD_TTL_S'],
+        max_total_bytes=app.config['UPLOAD_STORE_MAX_MB'] * 1024 * 1024
+    )
 
-    try:
-        model_path = app.config['MODEL_PATH']
-        app.model = YOLO(model_path)
-        print(f"INFO: Modelo YOLO cargado correctamente desde '{model_path}'.")
-    except Exception as e:
-        print(f"ERROR: No se pudo cargar el modelo YOLO: {e}")
-        app.model = None
+    # El estado de ejecución compartido entre workers va en la carpeta instance, no junto al código
+    os.makedirs(app.instance_path, exist_ok=True)
+    app.limitadores = crear_limitadores(
+        app.config['ADMISSION_LIMITS'],
+        app.config['ADMISSION_DIR'] or os.path.join(app.instance_path, 'admision'),
+        retry_after_s=app.config['ADMISSION_RETRY_AFTER_S']
+    )
+
+    model_path = app.config['MODEL_PATH']
+    backend = app.config['INFERENCE_BACKEND']
+    servidor = app.config['INFERENCE_MODE'] == 'servidor'
+    if servidor:
+        if not app.config['INFERENCE_AUTHKEY']:
+            raise RuntimeError("INFERENCE_MODE=servidor requiere definir INFERENCE_AUTHKEY en el entorno.")
+        # El modelo vive en el servidor de inferencia; este worker solo guarda un cliente
+        app.model_manager = GestorModeloRemoto(
+            ClienteInferencia(app.config['INFERENCE_SOCKET'], app.config['INFERENCE_AUTHKEY'].encode())
+        )
+        print(f"INFO: Usando el servidor de inferencia en '{app.config['INFERENCE_SOCKET']}'.")
+    else:
+        # Carga perezosa: el modelo (y torch) se carga en la primera detección o en el calentamiento
+        app.model_manager = GestorModelo(
+            backend=backend,
+            export_dir=app.config['MODEL_EXPORT_DIR'],
+            imgsz=app.config['MODEL_IMGSZ'],
+            num_hilos=app.config['TORCH_THREADS'],
+            model_path=model_path,
+            recarga_compartida=RecargaCompartida(
+                app.config['MODEL_RELOAD_STATE_PATH'] or os.path.join(app.instance_path, 'recarga_modelo.json')
+            ),
+            intervalo_vigilancia_s=app.config['MODEL_RELOAD_POLL_S']
+        )
 
     app.layout_cache = {}
+    app.pipeline_executor = ThreadPoolExecutor(
+        max_workers=app.config['PIPELINE_THREADS'], thread_name_prefix='pipeline'
+    ) if app.config['PIPELINE_THREADS'] > 0 else None
+    app.placement_pool = PoolColocacion(
+        app.config['PLACEMENT_WORKERS']
+    ) if app.config['PLACEMENT_WORKERS'] > 0 else None
+    app.detection_cache = CacheDetecciones(
+        max_entradas=app.config['DETECTION_CACHE_MAX_ENTRIES'],
+        max_bytes=app.config['DETECTION_CACHE_MAX_MB'] * 1024 * 1024
+    )
+    app.job_manager = GestorTrabajos(
+        AlmacenTrabajos(
+            app.config['JOBS_DB_PATH'] or os.path.join(app.instance_path, 'jobs.db'), ttl_s=app.config['JOBS_TTL_S']
+        ),
+        model_path,
+        backend=backend,
+        export_dir=app.config['MODEL_EXPORT_DIR'],
+        socket_inferencia=app.config['INFERENCE_SOCKET'] if servidor else None,
+        authkey=app.config['INFERENCE_AUTHKEY'].encode() if servidor else b'',
+        num_workers=app.config['DETECTION_WORKERS'],
+        conf=app.config['DETECTION_CONF'],
+        iou=app.config['DETECTION_IOU'],
+        num_hilos_torch=app.config['TORCH_THREADS'],
+        max_pixeles=app.config['MAX_IMAGE_PIXELS'],
+        tam_lote_teselas=app.config['TILE_BATCH_SIZE']
+    )
+    if not servidor:
+        # Al activar un modelo en caliente, los trabajos asíncronos nuevos también lo usan
+        app.model_manager.al_activar = lambda activo: app.job_manager.actualizar_modelo(activo.ruta)
 
     from .routes.layout_routes import layout_bp
     from .routes.reserva_routes import reserva_bp
@@ -42,5 +109,13 @@ def create_app(config_name='default'):
     app.register_blueprint(layout_bp, url_prefix='/api/layout')
     app.register_blueprint(reserva_bp, url_prefix='/api/reserva')
     app.register_blueprint(test_bp,url_prefix='/api/test')
+
+    from .cli import registrar_comandos
+    registrar_comandos(app)
+
+    # Los comandos de `flask` (migraciones, etc.) no necesitan el modelo ni los cachés calientes
+    if app.config['WARMUP_ON_STARTUP'] and not os.environ.get('FLASK_RUN_FROM_CLI'):
+        from .services.calentamiento import calentar_aplicacion
+        calentar_aplicacion(app)
     
     return app
\ No newline at end of file
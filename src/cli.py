@@ -0,0 +1,51 @@
+import json
+import time
+import urllib.error
+import urllib.request
+
+import click
+
+def registrar_comandos(app):
+    """Comandos de administración disponibles con `flask <comando>`."""
+
+    @app.cli.command('recargar-modelo')
+    @click.option('--url', default='http://127.0.0.1:8000', show_default=True, help="URL base de la API en ejecución.")
+    @click.option('--model-path', default=None, help="Pesos a cargar (por defecto MODEL_PATH).")
+    @click.option('--esperar/--no-esperar', default=True, show_default=True, help="Esperar a que termine la recarga.")
+    @click.option('--timeout', default=300, show_default=True, help="Segundos máximos de espera.")
+    def recargar_modelo(url, model_path, esperar, timeout):
+        """Pide a la API en ejecución que cargue y active unos pesos nuevos sin reiniciarla."""
+        token = app.config.get('ADMIN_TOKEN')
+        if not token:
+            raise click.ClickException("ADMIN_TOKEN no está configurado.")
+        cabeceras = {'Content-Type': 'application/json', 'X-Admin-Token': token}
+        cuerpo = json.dumps({'model_path': model_path} if model_path else {}).encode()
+
+        base = url.rstrip('/') + '/api/layout/model'
+        try:
+            with urllib.request.urlopen(urllib.request.Request(base + '/reload', data=cuerpo, headers=cabeceras)) as r:
+                respuesta = json.loads(r.read())
+        except urllib.error.HTTPError as e:
+            raise click.ClickException(f"{e.code}: {e.read().decode(errors='replace')}")
+        esperada = respuesta['version']
+        click.echo(f"{respuesta['message']} Versión esperada: {esperada}.")
+
+        if not esperar:
+            return
+        limite = time.time() + timeout
+        while time.time() < limite:
+            time.sleep(1.0)
+            with urllib.request.urlopen(base) as r:
+                estado = json.loads(r.read())
+            # Con INFERENCE_MODE=local hay que esperar a que cada worker active la versión pedida
+            workers = estado.get('workers') or {'servidor': {
+                'estado': estado['estado'], 'error': estado['error'], 'version': estado['version'],
+                'version_fallida': esperada if estado['estado'] == 'error' else None
+            }}
+            fallidos = {pid: w['error'] for pid, w in workers.items() if w.get('version_fallida') == esperada}
+            if fallidos:
+                raise click.ClickException(f"La recarga falló: {fallidos}")
+            if all(w['version'] == esperada for w in workers.values()):
+                click.echo(f"Modelo activo en {len(workers)} proceso(s): {respuesta['model_path']} (versión {esperada}).")
+                return
+        raise click.ClickException("Tiempo de espera agotado; consulta GET /api/layout/model.")
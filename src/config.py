@@ -11,7 +11,107 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'un-valor-por-defecto-solo-para-emergencias')
     
     MODEL_PATH = "weights/best.pt"
+    # Backend de inferencia: 'pytorch', 'onnx' u 'openvino' (los dos últimos se exportan una vez)
+    INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'pytorch')
+    MODEL_EXPORT_DIR = "weights/exported"
+    MODEL_IMGSZ = 640
+    # Cargar el modelo y recorrer los caminos pesados al crear la app (ver services/calentamiento.py).
+    # Desactivado, el modelo se carga en la primera detección.
+    WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', '0') == '1'
+    # 'local': cada worker carga su modelo. 'servidor': los workers usan el servidor de
+    # inferencia compartido (python -m src.services.servidor_inferencia) por un socket Unix.
+    INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'local')
+    # El socket se crea dentro de un directorio privado (0700) del usuario del servidor
+    INFERENCE_SOCKET = os.getenv('INFERENCE_SOCKET', '/tmp/deteccion_inferencia/inferencia.sock')
+    # Clave compartida entre el servidor de inferencia y los workers; obligatoria con INFERENCE_MODE=servidor
+    INFERENCE_AUTHKEY = os.getenv('INFERENCE_AUTHKEY')
+    # Con INFERENCE_MODE=local, archivo donde se publican las recargas del modelo para que lleguen a todos
+    # los workers; por defecto '<instance>/recarga_modelo.json' (carpeta instance de Flask)
+    MODEL_RELOAD_STATE_PATH = os.getenv('MODEL_RELOAD_STATE_PATH')
+    # Segundos entre comprobaciones de ese archivo en cada worker (solo un stat si no ha cambiado)
+    MODEL_RELOAD_POLL_S = float(os.getenv('MODEL_RELOAD_POLL_S', '1'))
+    # Token para /api/layout/model/reload (cabecera X-Admin-Token); sin token el endpoint queda deshabilitado
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
     UPLOAD_FOLDER = "uploads"
+    # Guardar una copia de cada plano subido en UPLOAD_FOLDER (solo para depuración).
+    # Las copias se nombran por su SHA-256 y se purgan por antigüedad y espacio.
+    SAVE_UPLOADS = False
+    UPLOAD_TTL_S = 3600
+    UPLOAD_STORE_MAX_MB = 512
+    # Límites de subida: cuerpo completo de la petición, cada imagen y píxeles por imagen
+    MAX_CONTENT_LENGTH = 128 * 1024 * 1024
+    MAX_UPLOAD_MB = 32
+    MAX_IMAGE_PIXELS = 120_000_000
+
+    # Parámetros de la detección YOLO
+    DETECTION_CONF = 0.25
+    DETECTION_IOU = 0.45
+    # Número de imágenes por llamada al modelo en /api/layout/detect/batch
+    DETECTION_BATCH_SIZE = 8
+    # Hilos del pool compartido que corre el perímetro en paralelo a YOLO, y hilos intra-op
+    # de torch. Conviene que PIPELINE_THREADS + TORCH_THREADS no supere los núcleos disponibles.
+    PIPELINE_THREADS = 2
+    TORCH_THREADS = int(os.getenv('TORCH_THREADS', '0')) or None
+    # Caché LRU de detecciones crudas y perímetros (por hash de imagen, pesos, conf e iou)
+    DETECTION_CACHE_MAX_ENTRIES = 128
+    DETECTION_CACHE_MAX_MB = 64
+    # Inferencia por teselas (se activa por petición con "teselado" en el JSON de config)
+    TILE_SIZE = 1024
+    TILE_OVERLAP = 0.2
+    # Teselas por llamada al modelo (independiente del lote de imágenes de /detect/batch)
+    TILE_BATCH_SIZE = 8
+    # Detección del perímetro (se pueden sobrescribir por petición con "perimetro" en el JSON de config)
+    PERIMETER_THRESHOLD = 200
+    PERIMETER_EPSILON = 0.01
+    PERIMETER_MULTIRES = False
+    PERIMETER_MAX_SIDE = 1024
+    # Motor de colocación de mesas/clústeres: 'rejilla', 'cspace' (región factible exacta) o
+    # 'raster' (rejilla de ocupación + transformada de distancia, con celdas de RASTER_RESOLUTION_CM).
+    # /optimize admite "motor" en el cuerpo para elegirlo por petición.
+    PLACEMENT_ENGINE = os.getenv('PLACEMENT_ENGINE', 'rejilla')
+    RASTER_RESOLUTION_CM = float(os.getenv('RASTER_RESOLUTION_CM', '5'))
+    # Búsqueda de grueso a fino del motor 'rejilla': tras la rejilla se refina alrededor de los
+    # PLACEMENT_REFINE_TOP_K mejores centros dividiendo el paso entre dos hasta PLACEMENT_REFINE_PRECISION_M,
+    # evaluando como mucho PLACEMENT_REFINE_BUDGET candidatos más por búsqueda. Desactivado por defecto:
+    # cambia las posiciones que devuelven /optimize y /reservar_cluster y añade tiempo a cada búsqueda.
+    PLACEMENT_REFINE = os.getenv('PLACEMENT_REFINE', '0') == '1'
+    PLACEMENT_REFINE_PRECISION_M = float(os.getenv('PLACEMENT_REFINE_PRECISION_M', '0.05'))
+    PLACEMENT_REFINE_TOP_K = int(os.getenv('PLACEMENT_REFINE_TOP_K', '8'))
+    PLACEMENT_REFINE_BUDGET = int(os.getenv('PLACEMENT_REFINE_BUDGET', '2000'))
+    # Giros (grados, separados por comas) que prueba /optimize para cada mesa, p. ej. cada 15°:
+    # "0,15,30,45,60,75,90,105,120,135,150,165". Cada petición puede fijar los suyos con "angulos".
+    PLACEMENT_ANGLES = tuple(float(a) for a in os.getenv('PLACEMENT_ANGLES', '0,90').split(','))
+    # Procesos entre los que se reparte la búsqueda del motor 'rejilla' (orientaciones × franjas de la sala);
+    # 0 = en el propio proceso. El resultado no depende del número de procesos.
+    PLACEMENT_WORKERS = int(os.getenv('PLACEMENT_WORKERS', '0'))
+    # Tiempo máximo (ms) de /optimize por defecto; cada petición puede fijar el suyo con "time_budget_ms".
+    # Con presupuesto se devuelve la mejor distribución encontrada a tiempo (ver optimizar_layout_con_presupuesto).
+    OPTIMIZE_TIME_BUDGET_MS = float(os.getenv('OPTIMIZE_TIME_BUDGET_MS', '0')) or None
+    # Búsqueda local (recocido simulado) tras la pasada voraz de /optimize; 0 iteraciones la desactiva.
+    # Con la misma semilla el resultado es reproducible. Se puede fijar por petición con "busqueda_local".
+    LOCAL_SEARCH_ITERATIONS = int(os.getenv('LOCAL_SEARCH_ITERATIONS', '0'))
+    LOCAL_SEARCH_SEED = int(os.getenv('LOCAL_SEARCH_SEED', '0'))
+
+    # Control de admisión para los endpoints que ocupan CPU durante segundos. Los límites son
+    # para todos los workers que comparten ADMISSION_DIR (los huecos son bloqueos de archivo;
+    # por defecto, '<instance>/admision' en la carpeta instance de Flask).
+    # Las peticiones que no caben esperan en una cola acotada; si la cola está llena se
+    # responde 429 y si se agota la espera, 503 (ambos con Retry-After).
+    ADMISSION_LIMITS = {
+        'detect': {'max_concurrentes': 2, 'max_cola': 4, 'espera_max_s': 10.0},
+        'optimize': {'max_concurrentes': 2, 'max_cola': 8, 'espera_max_s': 5.0},
+    }
+    ADMISSION_RETRY_AFTER_S = 5
+    ADMISSION_DIR = os.getenv('ADMISSION_DIR')
+
+    # Trabajos de detección asíncronos (/api/layout/detect/jobs). DETECTION_WORKERS son los procesos
+    # del pool de cada worker de la API; con INFERENCE_MODE=local cada uno carga su propia copia del
+    # modelo, así que con gunicorn -w 4 y 2 procesos hay 8 copias en memoria (más la de cada worker si
+    # también atiende /detect). Con INFERENCE_MODE=servidor los procesos del pool no cargan el modelo.
+    DETECTION_WORKERS = int(os.getenv('DETECTION_WORKERS', '1'))
+    # Base SQLite de los trabajos; por defecto '<instance>/jobs.db' (carpeta instance de Flask)
+    JOBS_DB_PATH = os.getenv('JOBS_DB_PATH')
+    JOBS_TTL_S = 24 * 3600
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
     # Lee la URL de la base de datos desde el entorno.
@@ -26,6 +126,8 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     """Configuración para el entorno de producción."""
     DEBUG = False
+    # Cada worker de gunicorn llega caliente a su primera petición
+    WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', '1') == '1'
     # En producción, podrías construir la URL de la BD con las otras variables
     # SQLALCHEMY_DATABASE_URI = f"postgresql://{os.getenv('DATABASE_USER')}:{os.getenv('DATABASE_PASSWORD')}@{os.getenv('DATABASE_HOST')}/{os.getenv('DATABASE_NAME')}"
 
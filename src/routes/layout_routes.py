@@ -1,96 +1,344 @@
 from flask import Blueprint, request, jsonify, current_app
-from PIL import Image
-import os
+import hmac
 import json
+import math
+import time
 from datetime import datetime
+from functools import wraps
 
-from ..services.recursos import procesar_detecciones, agrupar_mesas_sillas
-from ..services.perimetro import detectar_perimetro
-from ..services.optimizador import optimizar_layout_completo
+from ..services.admision import ColaLlena, EsperaAgotada
+from ..services.almacen_subidas import SubidaDemasiadoGrande
+from ..services.deteccion import (
+    parsear_config, parsear_teselado, parsear_agrupacion, parsear_opciones_perimetro, detectar_planos,
+    construir_layout
+)
+from ..services.optimizador import (
+    optimizar_layout_completo, optimizar_layout_con_presupuesto, refinamiento_desde_config, busqueda_local_desde_config,
+    MOTORES_COLOCACION, cache_plantillas_cluster
+)
+from ..services.busqueda_local import BusquedaLocal
 
 from .. import db
 from ..models import Layout, Mesa, Silla
 
 layout_bp = Blueprint('layout_bp', __name__)
 
+def _con_admision(nombre):
+    """
+    Aplica el limitador de concurrencia 'nombre' de la app a la vista.
+    Responde 429 si la cola de espera está llena y 503 si se agota la espera.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            limitador = current_app.limitadores[nombre]
+            try:
+                with limitador.admitir():
+                    return vista(*args, **kwargs)
+            except (ColaLlena, EsperaAgotada) as e:
+                codigo = 429 if isinstance(e, ColaLlena) else 503
+                current_app.logger.warning(f"Petición rechazada por control de admisión ({codigo}): {e}")
+                respuesta = jsonify({"error": str(e)})
+                respuesta.headers['Retry-After'] = str(limitador.retry_after_s)
+                return respuesta, codigo
+        return envoltura
+    return decorador
+
 @layout_bp.route('/detect', methods=['POST'])
+@_con_admision('detect')
 def detect_objects():
     if 'plano_imagen' not in request.files:
         return jsonify({"error": "No se envió ninguna imagen"}), 400
 
     file = request.files['plano_imagen']
-    model = current_app.model
-    if model is None:
+    # Referencia fija al modelo activo: si se recarga en mitad de la petición, esta termina con el anterior
+    activo = current_app.model_manager.actual()
+    if activo is None:
         return jsonify({"error": "Modelo YOLO no disponible en el servidor."}), 503
 
-    filename = file.filename
-    path_guardado = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    file.save(path_guardado)
+    try:
+        config_data = json.loads(request.form['config'])
+        local_ancho_m, local_alto_m, filtros_m = parsear_config(config_data)
+        teselado = parsear_teselado(
+            config_data.get('teselado'),
+            current_app.config['TILE_SIZE'],
+            current_app.config['TILE_OVERLAP']
+        )
+        agrupacion = parsear_agrupacion(config_data.get('agrupacion'))
+        opciones_perimetro = parsear_opciones_perimetro(config_data.get('perimetro'), _defectos_perimetro())
+    except Exception as e:
+        return jsonify({"error": f"Error al parsear la configuración: {e}"}), 400
 
-    img = Image.open(path_guardado)
-    ancho_plano_pixeles = img.width
-    alto_plano_pixeles = img.height
+    try:
+        hash_img, datos_imagen = _leer_subida(file)
+    except SubidaDemasiadoGrande as e:
+        return jsonify({"error": str(e)}), 413
+
+    # Detecciones crudas y perímetro (desde la caché si el plano ya se procesó)
+    try:
+        plano = detectar_planos(
+            activo.modelo,
+            [datos_imagen],
+            1,
+            conf=current_app.config['DETECTION_CONF'],
+            iou=current_app.config['DETECTION_IOU'],
+            cache=current_app.detection_cache,
+            id_modelo=activo.version,
+            teselado=teselado,
+            opciones_perimetro=opciones_perimetro,
+            executor=current_app.pipeline_executor,
+            hashes=[hash_img],
+            max_pixeles=current_app.config['MAX_IMAGE_PIXELS'],
+            tam_lote_teselas=current_app.config['TILE_BATCH_SIZE']
+        )[0]
+    except SubidaDemasiadoGrande as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if 'tiempos_ms' in plano:
+        current_app.logger.info(f"Tiempos de detección (ms): {plano['tiempos_ms']}")
+
+    t0 = time.perf_counter()
+    layout_data = construir_layout(
+        plano['detecciones'], plano['perimetro'], local_ancho_m, local_alto_m, filtros_m, agrupacion=agrupacion
+    )
+    layout_data['model_version'] = activo.version
+
+    if teselado:
+        # Tiempos por fase para ajustar tamaño de tesela y solape
+        tiempos = dict(plano.get('tiempos_ms', {}))
+        tiempos['post_proceso'] = round((time.perf_counter() - t0) * 1000.0, 2)
+        layout_data['timings_ms'] = tiempos
+        layout_data['tiles'] = plano.get('teselas', 0)
+
+    return jsonify(layout_data), 200
+
+@layout_bp.route('/detect/batch', methods=['POST'])
+@_con_admision('detect')
+def detect_objects_batch():
+    """
+    Detecta mesas y sillas en varios planos con una sola pasada por lotes del modelo.
+    Espera 'planos_imagenes' (varios archivos) y 'configs' (lista JSON, una por imagen)
+    o un único 'config' aplicado a todas. Devuelve un layout por imagen, en el mismo orden.
+    """
+    files = request.files.getlist('planos_imagenes')
+    if not files:
+        return jsonify({"error": "No se envió ninguna imagen"}), 400
+
+    # Referencia fija al modelo activo: si se recarga en mitad de la petición, esta termina con el anterior
+    activo = current_app.model_manager.actual()
+    if activo is None:
+        return jsonify({"error": "Modelo YOLO no disponible en el servidor."}), 503
+
+    try:
+        if 'configs' in request.form:
+            configs = json.loads(request.form['configs'])
+        else:
+            configs = [json.loads(request.form['config'])] * len(files)
+        if len(configs) != len(files):
+            raise ValueError(f"Se recibieron {len(files)} imágenes y {len(configs)} configuraciones.")
+        configs_parseadas = [parsear_config(c) for c in configs]
+        agrupaciones = [parsear_agrupacion(c.get('agrupacion')) for c in configs]
+        opciones_perimetro = [parsear_opciones_perimetro(c.get('perimetro'), _defectos_perimetro()) for c in configs]
+    except Exception as e:
+        return jsonify({"error": f"Error al parsear la configuración: {e}"}), 400
+
+    hashes, datos_imagenes = [], []
+    for file in files:
+        try:
+            hash_img, datos_imagen = _leer_subida(file)
+        except SubidaDemasiadoGrande as e:
+            return jsonify({"error": f"{file.filename}: {e}"}), 413
+        hashes.append(hash_img)
+        datos_imagenes.append(datos_imagen)
+
+    try:
+        planos = detectar_planos(
+            activo.modelo,
+            datos_imagenes,
+            current_app.config['DETECTION_BATCH_SIZE'],
+            conf=current_app.config['DETECTION_CONF'],
+            iou=current_app.config['DETECTION_IOU'],
+            cache=current_app.detection_cache,
+            id_modelo=activo.version,
+            opciones_perimetro=opciones_perimetro,
+            executor=current_app.pipeline_executor,
+            hashes=hashes,
+            max_pixeles=current_app.config['MAX_IMAGE_PIXELS']
+        )
+    except SubidaDemasiadoGrande as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    layouts = []
+    for plano, agrupacion, (local_ancho_m, local_alto_m, filtros_m) in zip(planos, agrupaciones, configs_parseadas):
+        layout_data = construir_layout(
+            plano['detecciones'], plano['perimetro'], local_ancho_m, local_alto_m, filtros_m, agrupacion=agrupacion
+        )
+        layout_data['model_version'] = activo.version
+        layouts.append(layout_data)
+
+    return jsonify({"layouts": layouts}), 200
+
+@layout_bp.route('/detect/jobs', methods=['POST'])
+def submit_detection_job():
+    """
+    Encola la detección de un plano en el pool de procesos y devuelve inmediatamente un job_id.
+    Acepta los mismos campos que /detect ('plano_imagen' y 'config').
+    """
+    if 'plano_imagen' not in request.files:
+        return jsonify({"error": "No se envió ninguna imagen"}), 400
 
     try:
         config_data = json.loads(request.form['config'])
-        local_ancho_m = config_data['local_ancho_m']
-        local_alto_m = config_data['local_alto_m']
-        filtros_m = config_data['filtros_m']
+        parsear_config(config_data)
+        parsear_agrupacion(config_data.get('agrupacion'))
+        teselado = parsear_teselado(
+            config_data.get('teselado'),
+            current_app.config['TILE_SIZE'],
+            current_app.config['TILE_OVERLAP']
+        )
+        opciones_perimetro = parsear_opciones_perimetro(config_data.get('perimetro'), _defectos_perimetro())
     except Exception as e:
         return jsonify({"error": f"Error al parsear la configuración: {e}"}), 400
 
-    # Ejecutar predicción
-    results_list = model.predict(source=path_guardado, conf=0.25, iou=0.45, save=False)
-    results = results_list[0]
+    try:
+        _, datos_imagen = _leer_subida(request.files['plano_imagen'])
+    except SubidaDemasiadoGrande as e:
+        return jsonify({"error": str(e)}), 413
 
-    poligono_perimetro = detectar_perimetro(path_guardado)
+    job_id = current_app.job_manager.enviar(datos_imagen, config_data, teselado, opciones_perimetro)
+    return jsonify({"job_id": job_id, "status": "pendiente"}), 202
 
-    lista_mesas, lista_sillas = procesar_detecciones(
-        results,
-        local_ancho_m, 
-        local_alto_m, 
-        filtros_m
-    )
+@layout_bp.route('/detect/jobs/<job_id>', methods=['GET'])
+def get_detection_job(job_id):
+    """
+    Devuelve el estado de un trabajo de detección y, si terminó, el layout detectado.
+    """
+    trabajo = current_app.job_manager.almacen.obtener(job_id)
+    if trabajo is None:
+        return jsonify({"error": f"No existe el trabajo '{job_id}'."}), 404
+    return jsonify(trabajo), 200
+
+@layout_bp.route('/model', methods=['GET'])
+def get_model_status():
+    """
+    Versión del modelo activo y estado de la última recarga en caliente de este worker.
+    Con INFERENCE_MODE=local incluye la última solicitud de recarga y la versión de cada worker.
+    """
+    try:
+        return jsonify(current_app.model_manager.estado()), 200
+    except Exception as e:
+        return jsonify({"error": f"No se pudo consultar el modelo: {e}"}), 502
 
-    layout_ordenado = agrupar_mesas_sillas(lista_mesas, lista_sillas)
+@layout_bp.route('/model/reload', methods=['POST'])
+def reload_model():
+    """
+    Carga unos pesos nuevos en segundo plano, los calienta y los activa sin reiniciar.
+    Cuerpo opcional: {"model_path": "weights/best.pt"} (por defecto MODEL_PATH).
+    Requiere la cabecera X-Admin-Token con el valor de ADMIN_TOKEN.
+    Con INFERENCE_MODE=local cada worker tiene su propio modelo: el que atiende la petición publica
+    la recarga y el resto la aplica en un segundo (ver RecargaCompartida); con INFERENCE_MODE=servidor
+    se recarga el modelo del servidor. La respuesta incluye la versión que quedará activa.
+    """
+    token = current_app.config.get('ADMIN_TOKEN')
+    if not token:
+        return jsonify({"error": "Endpoint de administración deshabilitado (ADMIN_TOKEN no configurado)."}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+        return jsonify({"error": "Token de administración inválido."}), 401
 
-    # Calcular el factor de conversión de metros a píxeles.
+    body = request.get_json(silent=True) or {}
+    model_path = body.get('model_path') or current_app.config['MODEL_PATH']
     try:
-        m_to_px_scale = float(ancho_plano_pixeles) / float(local_ancho_m)
-    except (TypeError, ZeroDivisionError):
-        m_to_px_scale = 20.0 
-
-    layout_data = {
-        "dimensions": {
-            "width_px": ancho_plano_pixeles,
-            "height_px": alto_plano_pixeles,
-            "width_m": local_ancho_m,
-            "height_m": local_alto_m,
-        },
-        "objects": layout_ordenado,
-        "perimeter": {
-            "points": poligono_perimetro
-        },
-        "m_to_px": m_to_px_scale 
+        version = current_app.model_manager.recargar(model_path)
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error al solicitar la recarga del modelo: {e}")
+        return jsonify({"error": f"No se pudo iniciar la recarga: {e}"}), 502
+    if version is None:
+        return jsonify({"error": "Ya hay una recarga del modelo en curso."}), 409
+    return jsonify({
+        "message": f"Recargando el modelo desde '{model_path}'.", "model_path": model_path, "version": version
+    }), 202
+
+def _defectos_perimetro():
+    """Parámetros por defecto de detectar_perimetro tomados de la configuración."""
+    return {
+        'umbral': current_app.config['PERIMETER_THRESHOLD'],
+        'epsilon': current_app.config['PERIMETER_EPSILON'],
+        'multiresolucion': current_app.config['PERIMETER_MULTIRES'],
+        'lado_max': current_app.config['PERIMETER_MAX_SIDE'],
     }
 
-    return jsonify(layout_data), 200
+def _leer_subida(file):
+    """
+    Lee la subida por bloques con hash incremental y límite de tamaño.
+    Solo se guarda en disco (almacén direccionado por contenido) si SAVE_UPLOADS está activo.
+    """
+    return current_app.upload_store.leer(file.stream, persistir=current_app.config.get('SAVE_UPLOADS'))
 
 @layout_bp.route('/optimize', methods=['POST'])
+@_con_admision('optimize')
 def optimize_current_layout():
     """
     Toma un layout enviado en el cuerpo de la petición, lo optimiza y lo devuelve.
+    Con "time_budget_ms" (o OPTIMIZE_TIME_BUDGET_MS) responde en ese tiempo con la mejor distribución
+    encontrada, completa o parcial, y añade al layout 'optimizacion' con el estado de cada mesa y la calidad.
+    "busqueda_local": {"iteraciones": n, "semilla": s} activa (o ajusta) la búsqueda local tras la pasada voraz.
+    "angulos": [0, 15, 30, ...] fija los giros (grados) que se prueban para cada mesa (PLACEMENT_ANGLES).
     """
     body = request.get_json()
     if not body:
         return jsonify({"error": "No se enviaron datos de layout en el cuerpo de la petición."}), 400
     
     layout_a_optimizar = body.get('layout', body)
+    motor = body.get('motor', current_app.config['PLACEMENT_ENGINE'])
+    if motor not in MOTORES_COLOCACION:
+        return jsonify({"error": f"Motor de colocación desconocido '{motor}'. Opciones: {', '.join(MOTORES_COLOCACION)}."}), 400
+    tiempo_ms = body.get('time_budget_ms', current_app.config['OPTIMIZE_TIME_BUDGET_MS'])
+    if tiempo_ms is not None and (isinstance(tiempo_ms, bool) or not isinstance(tiempo_ms, (int, float)) or tiempo_ms <= 0):
+        return jsonify({"error": "'time_budget_ms' debe ser un número de milisegundos mayor que 0."}), 400
     
-    layout_optimizado = optimizar_layout_completo(layout_a_optimizar)
+    angulos = body.get('angulos', current_app.config['PLACEMENT_ANGLES'])
+    if (not isinstance(angulos, (list, tuple)) or not angulos
+            or any(isinstance(a, bool) or not isinstance(a, (int, float)) or not math.isfinite(a) for a in angulos)):
+        return jsonify({"error": "'angulos' debe ser una lista no vacía de giros en grados."}), 400
+    
+    busqueda_local = busqueda_local_desde_config(current_app.config)
+    if body.get('busqueda_local') is not None:
+        try:
+            opciones = body['busqueda_local']
+            busqueda_local = BusquedaLocal(
+                iteraciones=int(opciones.get('iteraciones', current_app.config['LOCAL_SEARCH_ITERATIONS'])),
+                semilla=int(opciones.get('semilla', current_app.config['LOCAL_SEARCH_SEED']))
+            )
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({"error": "'busqueda_local' debe ser un objeto con 'iteraciones' y 'semilla' enteros."}), 400
+    
+    parametros = dict(
+        motor=motor, resolucion_cm=current_app.config['RASTER_RESOLUTION_CM'],
+        refinamiento=refinamiento_desde_config(current_app.config), busqueda_local=busqueda_local,
+        pool=current_app.placement_pool, angulos=tuple(angulos)
+    )
+    if tiempo_ms is None:
+        layout_optimizado = optimizar_layout_completo(layout_a_optimizar, **parametros)
+    else:
+        layout_optimizado = optimizar_layout_con_presupuesto(layout_a_optimizar, tiempo_ms, **parametros)
     
     return jsonify(layout_optimizado), 200
 
+@layout_bp.route('/stats', methods=['GET'])
+def get_stats():
+    """Contadores de admisión por endpoint (de todos los workers) y estado de las cachés de detecciones y de plantillas de este proceso."""
+    return jsonify({
+        "admision": {nombre: l.estadisticas() for nombre, l in current_app.limitadores.items()},
+        "cache_detecciones": current_app.detection_cache.estadisticas(),
+        "cache_plantillas": cache_plantillas_cluster.estadisticas()
+    }), 200
+
 @layout_bp.route('', methods=['POST'])
 def save_layout():
     body = request.get_json()
@@ -152,15 +400,11 @@ def save_layout():
 
     db.session.commit()
 
+    # Purga por TTL/LRU: no toca las subidas recientes de otras peticiones en curso
     try:
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        if os.path.exists(upload_folder):
-            for filename in os.listdir(upload_folder):
-                file_path = os.path.join(upload_folder, filename)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
+        current_app.upload_store.purgar()
     except Exception as e:
-        current_app.logger.error(f"Error al limpiar la carpeta de subidas: {e}")
+        current_app.logger.error(f"Error al purgar el almacén de subidas: {e}")
 
     return jsonify({"message": "Layout completo guardado en la base de datos con éxito."}), 201
 
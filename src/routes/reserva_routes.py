@@ -5,7 +5,7 @@ from shapely.geometry import box
 
 from ..services.optimizador import (
     _build_cluster_template, _find_best_placement, _medir_mesas_promedio, 
-    planificar_cluster_para_cliente, _get_geometric_layout, generar_layout_simulado_para_hora
+    planificar_cluster_para_cliente, _get_geometric_layout, generar_layout_simulado_para_hora, refinamiento_desde_config
 )
 from .. import db
 from ..models import Mesa, Reserva, Layout
@@ -198,7 +198,11 @@ def reservar_cluster():
     template_h = _build_cluster_template(len(table_ids), avg_ancho, avg_largo, 'horizontal', sillas_finales_data)
     template_v = _build_cluster_template(len(table_ids), avg_ancho, avg_largo, 'vertical', sillas_finales_data)
     
-    movimiento_destino = _find_best_placement(template_h, template_v, geo_data["perimetro_geom"], geo_data["obstaculos_geom"])
+    movimiento_destino = _find_best_placement(
+        template_h, template_v, geo_data["perimetro_geom"], geo_data["obstaculos_geom"],
+        motor=current_app.config['PLACEMENT_ENGINE'], resolucion_cm=current_app.config['RASTER_RESOLUTION_CM'],
+        refinamiento=refinamiento_desde_config(current_app.config), pool=current_app.placement_pool
+    )
 
     if movimiento_destino is None:
         return jsonify({"error": "No se encontró un espacio adecuado para juntar las mesas en el horario solicitado."}), 400
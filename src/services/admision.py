@@ -0,0 +1,158 @@
+import fcntl
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+class ColaLlena(Exception):
+    """La cola de espera del endpoint está completa: se rechaza sin esperar (429)."""
+
+class EsperaAgotada(Exception):
+    """La petición esperó en cola más de lo permitido sin conseguir un hueco (503)."""
+
+# Contadores acumulados en la cabecera del archivo: cola_maxima, admitidas, rechazadas por cola
+# llena, rechazadas por espera agotada y segundos de espera totales
+_CONTADORES = struct.Struct('<qqqqd')
+# Cada cuánto se vuelve a probar un hueco mientras se espera en cola
+INTERVALO_ESPERA_S = 0.02
+
+class LimitadorConcurrencia:
+    """
+    Limita cuántas peticiones de un endpoint pesado se ejecutan a la vez entre todos los workers
+    que comparten 'directorio' (p. ej. los de gunicorn -w 4, sean síncronos o con hilos).
+    Las que no caben esperan en una cola acotada durante como mucho 'espera_max_s';
+    si la cola está llena se rechazan al instante. Así /detect y /optimize no acaparan
+    todos los núcleos y las rutas ligeras (/api/reserva/*) mantienen su latencia.
+
+    Cada hueco y cada puesto de la cola es un byte del archivo '<nombre>.admision' bloqueado con
+    fcntl.lockf: el sistema libera los bloqueos de un worker que muere, así que no quedan huecos
+    perdidos. Como esos bloqueos son por proceso, los hilos de un mismo worker se reparten los
+    bytes con un conjunto local. Los contadores de estadisticas() también son de todos los workers.
+    """
+
+    def __init__(self, nombre, directorio, max_concurrentes=2, max_cola=4, espera_max_s=10.0, retry_after_s=5):
+        self.nombre = nombre
+        self.max_concurrentes = max(1, int(max_concurrentes))
+        self.max_cola = max(0, int(max_cola))
+        self.espera_max_s = float(espera_max_s)
+        self.retry_after_s = int(retry_after_s)
+        os.makedirs(directorio, exist_ok=True)
+        self.ruta = os.path.join(directorio, f"{nombre}.admision")
+        self._fd = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock = threading.Lock()
+        # Byte 0: candado de los contadores; 1..max_concurrentes: huecos; el resto: puestos de la cola
+        self._huecos = range(1, 1 + self.max_concurrentes)
+        self._puestos = range(1 + self.max_concurrentes, 1 + self.max_concurrentes + self.max_cola)
+        self._propios = set()
+
+    def _tomar_byte(self, posiciones):
+        """Bloquea el primer byte libre de 'posiciones' (sin esperar) y lo devuelve; None si no hay."""
+        with self._lock:
+            for posicion in posiciones:
+                if posicion in self._propios:
+                    continue
+                try:
+                    fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, posicion)
+                except OSError:
+                    continue
+                self._propios.add(posicion)
+                return posicion
+        return None
+
+    def _soltar_byte(self, posicion):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, posicion)
+            self._propios.discard(posicion)
+
+    def _ocupados(self, posiciones):
+        """
+        Bytes de 'posiciones' bloqueados por este o por otro worker. La prueba toma un instante
+        cada byte libre, así que solo se usa para las estadísticas.
+        """
+        ocupados = 0
+        with self._lock:
+            for posicion in posiciones:
+                if posicion in self._propios:
+                    ocupados += 1
+                    continue
+                try:
+                    fcntl.lockf(self._fd, fcntl.LOCK_SH | fcntl.LOCK_NB, 1, posicion)
+                except OSError:
+                    ocupados += 1
+                else:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, posicion)
+        return ocupados
+
+    def _leer_contadores(self):
+        datos = os.pread(self._fd, _CONTADORES.size, 0)
+        return list(_CONTADORES.unpack(datos)) if len(datos) == _CONTADORES.size else [0, 0, 0, 0, 0.0]
+
+    def _sumar(self, cola_maxima=0, admitidas=0, rechazadas_cola=0, rechazadas_espera=0, espera_s=0.0):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, 0)
+            try:
+                contadores = self._leer_contadores()
+                contadores[0] = max(contadores[0], cola_maxima)
+                contadores[1] += admitidas
+                contadores[2] += rechazadas_cola
+                contadores[3] += rechazadas_espera
+                contadores[4] += espera_s
+                os.pwrite(self._fd, _CONTADORES.pack(*contadores), 0)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, 0)
+
+    def _adquirir(self):
+        hueco = self._tomar_byte(self._huecos)
+        if hueco is None:
+            puesto = self._tomar_byte(self._puestos)
+            if puesto is None:
+                self._sumar(rechazadas_cola=1)
+                raise ColaLlena(f"Demasiadas peticiones en curso para '{self.nombre}'.")
+            inicio = time.perf_counter()
+            try:
+                while hueco is None and time.perf_counter() - inicio < self.espera_max_s:
+                    time.sleep(INTERVALO_ESPERA_S)
+                    hueco = self._tomar_byte(self._huecos)
+            finally:
+                self._soltar_byte(puesto)
+            espera_s = time.perf_counter() - inicio
+            cola_maxima = puesto - self._puestos.start + 1
+            if hueco is None:
+                self._sumar(cola_maxima=cola_maxima, rechazadas_espera=1, espera_s=espera_s)
+                raise EsperaAgotada(f"Tiempo de espera agotado para '{self.nombre}'.")
+            self._sumar(cola_maxima=cola_maxima, admitidas=1, espera_s=espera_s)
+        else:
+            self._sumar(admitidas=1)
+        return hueco
+
+    @contextmanager
+    def admitir(self):
+        """Context manager: reserva un hueco (o lanza ColaLlena/EsperaAgotada) y lo libera al salir."""
+        hueco = self._adquirir()
+        try:
+            yield
+        finally:
+            self._soltar_byte(hueco)
+
+    def estadisticas(self):
+        with self._lock:
+            cola_maxima, admitidas, rechazadas_cola, rechazadas_espera, espera_total_s = self._leer_contadores()
+        return {
+            'max_concurrentes': self.max_concurrentes,
+            'max_cola': self.max_cola,
+            'activas': self._ocupados(self._huecos),
+            'en_cola': self._ocupados(self._puestos),
+            'cola_maxima': cola_maxima,
+            'admitidas': admitidas,
+            'rechazadas_cola_llena': rechazadas_cola,
+            'rechazadas_espera_agotada': rechazadas_espera,
+            'espera_total_s': round(espera_total_s, 3)
+        }
+
+def crear_limitadores(limites, directorio, retry_after_s=5):
+    """Crea un LimitadorConcurrencia por endpoint a partir del diccionario ADMISSION_LIMITS."""
+    return {
+        nombre: LimitadorConcurrencia(nombre, directorio, retry_after_s=retry_after_s, **parametros)
+        for nombre, parametros in limites.items()
+    }
@@ -0,0 +1,102 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+
+TAMANO_BLOQUE = 64 * 1024
+
+class SubidaDemasiadoGrande(ValueError):
+    """La subida supera el tamaño o el número de píxeles permitidos."""
+
+class AlmacenSubidas:
+    """
+    Lectura por bloques de las imágenes subidas, con hash incremental y límite de tamaño.
+    Si `persistir` está activo, el archivo se guarda en un almacén temporal direccionado por
+    contenido (el nombre es su SHA-256), que se purga por antigüedad (TTL) y por espacio (LRU)
+    en lugar de vaciar toda la carpeta, así que nunca borra la subida de otra petición en curso.
+    """
+
+    def __init__(self, carpeta, max_bytes, ttl_s=3600, max_total_bytes=512 * 1024 * 1024):
+        self.carpeta = carpeta
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.max_total_bytes = max_total_bytes
+        self._lock = threading.Lock()
+        os.makedirs(carpeta, exist_ok=True)
+
+    def ruta(self, hash_hex):
+        return os.path.join(self.carpeta, hash_hex)
+
+    def leer(self, stream, persistir=False):
+        """
+        Lee el stream de la subida por bloques, calculando el SHA-256 a medida que llegan los datos.
+        Devuelve (hash_hex, datos). Lanza SubidaDemasiadoGrande si se supera max_bytes.
+        Los bloques se acumulan en un BytesIO: getvalue() devuelve sus bytes sin copiarlos, así que
+        la subida ocupa memoria una sola vez (y decodificar_imagen la comparte también sin copia).
+        """
+        sha = hashlib.sha256()
+        datos = io.BytesIO()
+        tamano = 0
+        tmp_path = os.path.join(self.carpeta, f".tmp-{uuid.uuid4().hex}") if persistir else None
+        tmp = open(tmp_path, 'wb') if persistir else None
+        try:
+            while True:
+                bloque = stream.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                tamano += len(bloque)
+                if tamano > self.max_bytes:
+                    raise SubidaDemasiadoGrande(
+                        f"La imagen supera el tamaño máximo permitido ({self.max_bytes // (1024 * 1024)} MB)."
+                    )
+                sha.update(bloque)
+                datos.write(bloque)
+                if tmp is not None:
+                    tmp.write(bloque)
+        except Exception:
+            if tmp is not None:
+                tmp.close()
+                os.remove(tmp_path)
+            raise
+
+        hash_hex = sha.hexdigest()
+        if tmp is not None:
+            tmp.close()
+            # Mismo contenido => mismo nombre: el reemplazo es atómico e idempotente
+            os.replace(tmp_path, self.ruta(hash_hex))
+            self.purgar()
+        return hash_hex, datos.getvalue()
+
+    def purgar(self):
+        """Elimina las subidas caducadas y, si el almacén sigue excedido, las menos recientes."""
+        with self._lock:
+            ahora = time.time()
+            archivos = []
+            for nombre in os.listdir(self.carpeta):
+                path = os.path.join(self.carpeta, nombre)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                # Los temporales solo se purgan por TTL (pueden pertenecer a una subida en curso)
+                if ahora - st.st_mtime > self.ttl_s:
+                    _eliminar(path)
+                elif not nombre.startswith('.tmp-'):
+                    archivos.append((st.st_mtime, st.st_size, path))
+
+            total = sum(tamano for _, tamano, _ in archivos)
+            for _, tamano, path in sorted(archivos):
+                if total <= self.max_total_bytes:
+                    break
+                _eliminar(path)
+                total -= tamano
+
+def _eliminar(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
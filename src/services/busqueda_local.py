@@ -0,0 +1,242 @@
+"""
+Búsqueda local (recocido simulado) sobre una distribución completa de mesas, para después de la
+pasada voraz de optimizar_layout_completo, que coloca cada mesa una vez y no vuelve atrás.
+
+Objetivo explícito (mayor es mejor):
+
+    PESO_MESA · mesas colocadas + separación mínima + PESO_PASILLO · separación media
+
+donde la separación de una mesa es la distancia (huellas con sillas) a su vecina más cercana,
+limitada a ANCHO_PASILLO_M: por encima de un pasillo cómodo no se premia alejarse más.
+
+Movimientos: desplazar una mesa (con un giro ocasional a otro de los ángulos), intercambiar dos mesas e insertar una
+mesa que la pasada voraz no pudo colocar. Cada movimiento se puntúa de forma incremental: se
+mantiene la matriz de separaciones entre mesas y solo se recalcula la fila y la columna de las
+mesas que se mueven, contra las vecinas cuya caja está a menos de ANCHO_PASILLO_M (sin uniones).
+"""
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+import shapely
+from shapely.geometry import Point
+
+from .colocacion import ANGULOS_COLOCACION, plantilla_girada, plantilla_simplificada
+
+# iteraciones del recocido y semilla del generador aleatorio (misma semilla y entrada = mismo resultado)
+BusquedaLocal = namedtuple('BusquedaLocal', ['iteraciones', 'semilla'])
+
+ANCHO_PASILLO_M = 0.9
+PESO_MESA = 100.0
+PESO_PASILLO = 0.5
+# Desviación típica de los desplazamientos (m) y temperatura: decrecen geométricamente del valor
+# inicial al final a lo largo de las iteraciones
+PASO_INICIAL_M = 0.5
+PASO_FINAL_M = 0.02
+TEMPERATURA_INICIAL = 0.05
+TEMPERATURA_FINAL = 0.0005
+# Probabilidad de cada tipo de movimiento (el resto son desplazamientos) y de girar al desplazar
+PROB_INSERCION = 0.15
+PROB_INTERCAMBIO = 0.25
+PROB_GIRO = 0.1
+
+class DistribucionLocal:
+    """
+    Estado de la búsqueda: posición y giro de cada mesa, sus huellas (exactas para comprobar que
+    caben y simplificadas para medir separaciones) y la matriz de separaciones limitadas entre mesas
+    colocadas (ANCHO_PASILLO_M en la diagonal y en las filas de mesas sin colocar).
+    """
+
+    def __init__(self, perimetro, objetos, posiciones, angulos=ANGULOS_COLOCACION):
+        self.perimetro = perimetro
+        self.angulos = tuple(angulos)
+        shapely.prepare(self.perimetro)
+        self.ids = [obj['id'] for obj in objetos]
+        n = len(self.ids)
+        # Huellas centradas de cada mesa en cada giro, como en la colocación voraz (y de la misma caché)
+        self.plantillas = [[plantilla_girada(obj['footprint'], a) for a in self.angulos] for obj in objetos]
+        self.simplificadas = [[plantilla_simplificada(p) for p in giros] for giros in self.plantillas]
+        self.cajas_plantillas = np.array(
+            [[p.bounds for p in giros] for giros in self.plantillas]
+        ).reshape(n, len(self.angulos), 4)
+
+        self.colocada = np.zeros(n, dtype=bool)
+        self.centros = np.zeros((n, 2))
+        self.giros = np.zeros(n, dtype=int)
+        self.huellas = np.empty(n, dtype=object)
+        self.huellas_simplificadas = np.empty(n, dtype=object)
+        self.cajas = np.zeros((n, 4))
+        self.separaciones = np.full((n, n), ANCHO_PASILLO_M)
+
+        for k, mesa_id in enumerate(self.ids):
+            if mesa_id in posiciones:
+                centro = posiciones[mesa_id]['centro']
+                giro = self.angulos.index(posiciones[mesa_id]['angulo'])
+                self._fijar(k, self._mover(k, (centro.x, centro.y), giro))
+        for k in np.flatnonzero(self.colocada):
+            fila = self._fila(self.huellas_simplificadas[k], self.cajas[k], [k])
+            self.separaciones[k, :] = fila
+            self.separaciones[:, k] = fila
+
+    def _mover(self, k, centro, giro):
+        """Huella exacta, simplificada y caja de la mesa k en 'centro' con el giro dado."""
+        desplazamiento = np.asarray(centro, dtype=float)
+        huella = shapely.transform(self.plantillas[k][giro], lambda c: c + desplazamiento)
+        simplificada = shapely.transform(self.simplificadas[k][giro], lambda c: c + desplazamiento)
+        caja = self.cajas_plantillas[k, giro] + np.tile(desplazamiento, 2)
+        return desplazamiento, giro, huella, simplificada, caja
+
+    def _fijar(self, k, movida):
+        if movida is None:
+            self.colocada[k] = False
+            self.huellas[k] = self.huellas_simplificadas[k] = None
+            return
+        self.centros[k], self.giros[k], self.huellas[k], self.huellas_simplificadas[k], self.cajas[k] = movida
+        self.colocada[k] = True
+
+    def _distancia_cajas(self, caja, indices):
+        otras = self.cajas[indices]
+        dx = np.maximum(0.0, np.maximum(otras[:, 0] - caja[2], caja[0] - otras[:, 2]))
+        dy = np.maximum(0.0, np.maximum(otras[:, 1] - caja[3], caja[1] - otras[:, 3]))
+        return np.hypot(dx, dy)
+
+    def _otras(self, excluir):
+        mascara = self.colocada.copy()
+        mascara[list(excluir)] = False
+        return np.flatnonzero(mascara)
+
+    def _fila(self, simplificada, caja, excluir):
+        """Separaciones limitadas de una huella al resto de mesas colocadas (salvo 'excluir')."""
+        fila = np.full(len(self.ids), ANCHO_PASILLO_M)
+        otras = self._otras(excluir)
+        cerca = otras[self._distancia_cajas(caja, otras) < ANCHO_PASILLO_M]
+        if cerca.size:
+            fila[cerca] = np.minimum(shapely.distance(simplificada, self.huellas_simplificadas[cerca]), ANCHO_PASILLO_M)
+        return fila
+
+    def _cabe(self, huella, caja, excluir):
+        """La huella queda dentro del perímetro y no pisa ninguna mesa colocada (salvo 'excluir')."""
+        if not self.perimetro.covers(huella):
+            return False
+        otras = self._otras(excluir)
+        solapadas = otras[self._distancia_cajas(caja, otras) == 0.0]
+        return not (solapadas.size and shapely.intersects(huella, self.huellas[solapadas]).any())
+
+    def objetivo(self):
+        colocadas = np.flatnonzero(self.colocada)
+        if colocadas.size == 0:
+            return 0.0
+        separacion = self.separaciones[colocadas].min(axis=1)
+        return PESO_MESA * colocadas.size + float(separacion.min()) + PESO_PASILLO * float(separacion.mean())
+
+    def aplicar(self, cambios):
+        """
+        Aplica los cambios [(k, centro, giro)] a la vez si todas las mesas caben. Solo se recalculan las
+        filas y columnas de las mesas movidas. Devuelve lo necesario para deshacerlo, o None si no caben.
+        """
+        indices = [k for k, _, _ in cambios]
+        movidas = [self._mover(k, centro, giro) for k, centro, giro in cambios]
+        for i, movida in enumerate(movidas):
+            if not self._cabe(movida[2], movida[4], indices):
+                return None
+            if any(shapely.intersects(movida[2], otra[2]) for otra in movidas[:i]):
+                return None
+
+        anterior = [
+            (k, self.colocada[k], (self.centros[k].copy(), self.giros[k], self.huellas[k],
+                                   self.huellas_simplificadas[k], self.cajas[k].copy()),
+             self.separaciones[k].copy())
+            for k in indices
+        ]
+        filas = [self._fila(movida[3], movida[4], indices) for movida in movidas]
+        for k, movida in zip(indices, movidas):
+            self._fijar(k, movida)
+        for i, (k, fila) in enumerate(zip(indices, filas)):
+            # Separaciones entre las propias mesas movidas
+            for j in range(i):
+                fila[indices[j]] = min(float(shapely.distance(movidas[i][3], movidas[j][3])), ANCHO_PASILLO_M)
+            self.separaciones[k, :] = fila
+            self.separaciones[:, k] = fila
+            self.separaciones[k, k] = ANCHO_PASILLO_M
+        return anterior
+
+    def deshacer(self, anterior):
+        for k, colocada, estado, fila in anterior:
+            self._fijar(k, estado if colocada else None)
+            self.separaciones[k, :] = fila
+            self.separaciones[:, k] = fila
+
+    def solucion(self):
+        """Posiciones ({'centro', 'angulo'}) y huellas de las mesas colocadas, por id."""
+        posiciones, huellas = {}, {}
+        for k in np.flatnonzero(self.colocada):
+            posiciones[self.ids[k]] = {'centro': Point(*self.centros[k]), 'angulo': self.angulos[self.giros[k]]}
+            huellas[self.ids[k]] = self.huellas[k]
+        return posiciones, huellas
+
+def _proponer(estado, rng, paso, limites):
+    """Movimiento aleatorio [(k, centro, giro)] o None si no hay ninguno posible."""
+    colocadas = np.flatnonzero(estado.colocada)
+    libres = np.flatnonzero(~estado.colocada)
+    r = rng.random()
+    if libres.size and r < PROB_INSERCION:
+        k = int(rng.choice(libres))
+        centro = rng.uniform(limites[:2], limites[2:])
+        return [(k, centro, int(rng.integers(len(estado.angulos))))]
+    if colocadas.size >= 2 and r < PROB_INSERCION + PROB_INTERCAMBIO:
+        k1, k2 = (int(k) for k in rng.choice(colocadas, 2, replace=False))
+        return [(k1, estado.centros[k2].copy(), estado.giros[k1]), (k2, estado.centros[k1].copy(), estado.giros[k2])]
+    if colocadas.size == 0:
+        return None
+    k = int(rng.choice(colocadas))
+    centro = estado.centros[k] + rng.normal(0.0, paso, 2)
+    giro = estado.giros[k] if rng.random() >= PROB_GIRO else int(rng.integers(len(estado.angulos)))
+    return [(k, centro, giro)]
+
+def mejorar_distribucion(perimetro, objetos, posiciones, parametros, limite=None, angulos=ANGULOS_COLOCACION):
+    """
+    Recocido simulado a partir de las posiciones de la pasada voraz.
+    - objetos: plantillas centradas {'id', 'footprint'} (las mismas que usó la pasada voraz).
+    - posiciones: {id: {'centro': Point, 'angulo'}} de las mesas colocadas.
+    - parametros: BusquedaLocal(iteraciones, semilla).
+    - limite: instante de time.perf_counter() en el que parar aunque queden iteraciones.
+    - angulos: giros que se prueban (los mismos de la pasada voraz, que dio los de 'posiciones').
+    Devuelve (posiciones, huellas) de la mejor distribución vista, con el mismo formato.
+    """
+    estado = DistribucionLocal(perimetro, objetos, posiciones, angulos)
+    rng = np.random.default_rng(parametros.semilla)
+    limites = np.array(perimetro.bounds)
+    actual = mejor = estado.objetivo()
+    inicial = actual
+    mejor_solucion = estado.solucion()
+    aceptados = 0
+    iteraciones = max(int(parametros.iteraciones), 0)
+
+    for it in range(iteraciones):
+        if limite is not None and time.perf_counter() >= limite:
+            break
+        avance = it / max(iteraciones - 1, 1)
+        temperatura = TEMPERATURA_INICIAL * (TEMPERATURA_FINAL / TEMPERATURA_INICIAL) ** avance
+        paso = PASO_INICIAL_M * (PASO_FINAL_M / PASO_INICIAL_M) ** avance
+
+        cambios = _proponer(estado, rng, paso, limites)
+        if cambios is None:
+            continue
+        anterior = estado.aplicar(cambios)
+        if anterior is None:
+            continue
+        nuevo = estado.objetivo()
+        delta = nuevo - actual
+        if delta >= 0 or rng.random() < math.exp(delta / temperatura):
+            actual = nuevo
+            aceptados += 1
+            # Margen para que el redondeo de la media no cuente como mejora
+            if actual > mejor + 1e-9:
+                mejor = actual
+                mejor_solucion = estado.solucion()
+        else:
+            estado.deshacer(anterior)
+
+    print(f"INFO: Búsqueda local: objetivo {inicial:.3f} -> {mejor:.3f} ({aceptados} movimientos aceptados).")
+    return mejor_solucion
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+def identificador_modelo(model_path):
+    """
+    Devuelve un identificador corto de los pesos del modelo (ruta, tamaño y fecha de modificación).
+    Cambia cuando se reemplaza el archivo de pesos, invalidando así las entradas antiguas de la caché.
+    """
+    try:
+        st = os.stat(model_path)
+        firma = f"{os.path.abspath(model_path)}:{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        firma = str(model_path)
+    return hashlib.sha256(firma.encode()).hexdigest()[:16]
+
+def hash_imagen(datos):
+    """Hash SHA-256 del contenido de la imagen subida."""
+    return hashlib.sha256(datos).hexdigest()
+
+def _tamano_entrada(detecciones):
+    """Estimación en bytes de lo que ocupa una entrada (arreglos de las detecciones)."""
+    return sum(detecciones[k].nbytes for k in ('xyxy', 'conf', 'cls')) + 512
+
+class CacheDetecciones:
+    """
+    Caché LRU en memoria de las detecciones crudas de YOLO de cada plano.
+    La clave depende del contenido de la imagen, de los pesos del modelo, de conf/iou y del teselado,
+    así que cambiar solo 'filtros_m' reutiliza la inferencia y repite únicamente el post-proceso.
+    El perímetro no se guarda aquí: tiene su propia caché en perimetro.py (por imagen y parámetros),
+    así que cambiar solo las opciones del perímetro tampoco repite la inferencia.
+    """
+
+    def __init__(self, max_entradas=128, max_bytes=64 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def clave(hash_img, id_modelo, conf, iou, extra=''):
+        return f"{hash_img}:{id_modelo}:{float(conf):.4f}:{float(iou):.4f}:{extra}"
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, clave, detecciones):
+        tamano = _tamano_entrada(detecciones)
+        if self.max_entradas <= 0 or tamano > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._entradas[clave] = (detecciones, tamano)
+            self._bytes += tamano
+            # Expulsar las entradas menos usadas hasta respetar ambos límites
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                _, (_, tamano_expulsado) = self._entradas.popitem(last=False)
+                self._bytes -= tamano_expulsado
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
@@ -0,0 +1,49 @@
+import threading
+from collections import OrderedDict
+
+class CachePlantillas:
+    """
+    Caché LRU en memoria de plantillas de clúster (mesas + sillas con su aura) ya construidas.
+    Las plantillas son geometrías de Shapely, inmutables, así que se devuelve la misma a todos los
+    que piden la misma clave. La construcción se hace fuera del candado: si dos peticiones piden a la
+    vez una plantilla nueva, ambas la construyen y se guarda la última.
+    """
+
+    def __init__(self, max_entradas=256):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave, construir):
+        """Plantilla de 'clave'; si no está, la crea con construir() y la guarda."""
+        with self._lock:
+            plantilla = self._entradas.get(clave)
+            if plantilla is not None:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return plantilla
+            self.fallos += 1
+
+        plantilla = construir()
+        if self.max_entradas <= 0:
+            return plantilla
+        with self._lock:
+            self._entradas[clave] = plantilla
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return plantilla
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
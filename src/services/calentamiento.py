@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+
+from .deteccion import construir_layout
+from .gestor_modelo import GestorModelo, calentar_modelo
+from .perimetro import detectar_perimetro
+from .optimizador import optimizar_layout_completo
+
+def _calentar_modelo(app):
+    activo = app.model_manager.actual()
+    # Con servidor de inferencia el modelo ya está caliente en el otro proceso
+    if activo is not None and isinstance(app.model_manager, GestorModelo):
+        calentar_modelo(activo.modelo, app.config['MODEL_IMGSZ'])
+
+def _calentar_perimetro():
+    img = np.full((256, 256, 3), 255, dtype=np.uint8)
+    img[16:240, 16:240] = 0
+    detectar_perimetro(img)
+
+def _calentar_agrupacion():
+    # Una mesa y una silla: recorre el post-proceso vectorizado y la agrupación con el KD-tree de scipy
+    detecciones = {
+        'xyxy': np.array([[10, 10, 60, 60], [25, 62, 45, 80]], dtype=np.float32),
+        'conf': np.array([0.9, 0.9], dtype=np.float32),
+        'cls': np.array([0, 1], dtype=np.int32),
+        'names': {0: 'mesa', 1: 'silla'},
+        'orig_shape': (100, 100),
+    }
+    construir_layout(detecciones, [], 10, 10, {})
+
+def _calentar_geometria(pool):
+    layout = {
+        'm_to_px': 20.0,
+        'perimeter': {'points': [[0, 0], [200, 0], [200, 200], [0, 200]]},
+        'objects': {
+            f'mesa_{i}': {
+                'id': f'mesa_{i}', 'tipo': 'mesa_cuadrada', 'coords_mesa_metros': [x, 1, x + 0.8, 1.8],
+                'sillas_asignadas': [{'id_silla': f's{i}', 'coords_metros': [x + 0.2, 1.9, x + 0.6, 2.3]}],
+            }
+            for i, x in enumerate((1.0, 5.0))
+        },
+    }
+    # Con pool, además arranca sus procesos (cada uno importa shapely y numpy)
+    optimizar_layout_completo(layout, pool=pool)
+
+def calentar_aplicacion(app):
+    """
+    Fase de calentamiento (WARMUP_ON_STARTUP): carga el modelo y recorre una vez cada camino
+    pesado (inferencia, perímetro con OpenCV, agrupación con scipy y colocación con shapely),
+    de modo que la primera petición real no paga imports ni inicializaciones.
+    También se puede llamar desde un hook del servidor (p. ej. post_worker_init de gunicorn).
+    Devuelve los milisegundos de cada fase.
+    """
+    tiempos = {}
+    fases = [
+        ('modelo', lambda: _calentar_modelo(app)),
+        ('perimetro', _calentar_perimetro),
+        ('agrupacion', _calentar_agrupacion),
+        ('geometria', lambda: _calentar_geometria(app.placement_pool)),
+    ]
+    for nombre, fase in fases:
+        t0 = time.perf_counter()
+        try:
+            fase()
+            tiempos[nombre] = (time.perf_counter() - t0) * 1000.0
+        except Exception as e:
+            print(f"ERROR: Falló el calentamiento de '{nombre}': {e}")
+    print(f"INFO: Calentamiento completado (ms): { {k: round(v, 1) for k, v in tiempos.items()} }")
+    return tiempos
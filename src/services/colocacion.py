@@ -0,0 +1,415 @@
+"""
+Evaluación vectorizada de posiciones candidatas para las plantillas de clúster/mesa.
+Las comprobaciones geométricas se hacen en bloque con las funciones de Shapely 2
+sobre arreglos de geometrías, en lugar de una intersección por candidato en Python.
+"""
+import math
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+import shapely
+from shapely.affinity import rotate
+
+# Fracción mínima del área de la plantilla que debe quedar dentro del espacio libre
+TOLERANCIA_AREA = 0.999
+# Candidatos por bloque: se empieza con bloques pequeños (lo normal es encontrar sitio pronto)
+# y se duplican hasta el máximo. Se corta en cuanto un bloque tiene una posición válida.
+TAM_BLOQUE_INICIAL = 64
+TAM_BLOQUE_MAX = 2048
+# Tolerancia (m) de las versiones simplificadas con que se acotan las distancias antes de calcularlas exactas
+TOLERANCIA_COTA_DISTANCIA = 0.01
+# Los radios de descarte se redondean hacia arriba a potencias de este factor, para que plantillas
+# de área parecida compartan los obstáculos erosionados (un radio mayor sigue siendo un descarte exacto)
+FACTOR_RADIO = 1.1
+
+# Búsqueda de grueso a fino: paso final (m), semillas que se refinan en cada nivel y máximo de
+# candidatos evaluados durante el refinamiento (la rejilla inicial no cuenta)
+Refinamiento = namedtuple('Refinamiento', ['precision', 'top_k', 'presupuesto'])
+# Vecinos de cada semilla en el nivel siguiente (3x3 sin el centro, que ya está evaluado)
+_VECINOS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy], dtype=np.float64)
+# Giros (grados) que prueba la colocación por defecto; se configuran con PLACEMENT_ANGLES
+ANGULOS_COLOCACION = (0, 90)
+# Plantillas giradas y lo que se deriva de cada una (versión simplificada, holguras, núcleo erosionado)
+# que se guardan en caché: cada mesa se prueba en todos los ángulos y el refinamiento y las franjas
+# del pool vuelven a evaluar la misma plantilla. Las geometrías de Shapely son inmutables y se
+# comparan por valor, así que sirven de clave.
+TAM_CACHE_PLANTILLAS = 1024
+
+@lru_cache(maxsize=TAM_CACHE_PLANTILLAS)
+def plantilla_girada(plantilla, angulo):
+    """Plantilla girada 'angulo' grados sobre el centro de su caja."""
+    return rotate(plantilla, angulo, origin='center')
+
+@lru_cache(maxsize=TAM_CACHE_PLANTILLAS)
+def plantilla_simplificada(plantilla):
+    """Versión con menos vértices con la que se acotan las distancias (error <= TOLERANCIA_COTA_DISTANCIA)."""
+    return plantilla.simplify(TOLERANCIA_COTA_DISTANCIA)
+
+def rejilla_candidatos(minx, miny, maxx, maxy, step):
+    """Centros candidatos (n, 2) en el mismo orden que el recorrido x exterior / y interior."""
+    xs = np.arange(minx, maxx, step)
+    ys = np.arange(miny, maxy, step)
+    X, Y = np.meshgrid(xs, ys, indexing='ij')
+    return np.column_stack([X.ravel(), Y.ravel()])
+
+def mover_plantilla(plantilla, centros):
+    """Copias de la plantilla trasladadas a cada centro, creadas de una vez con shapely.transform."""
+    num_coords = len(shapely.get_coordinates(plantilla))
+    copias = np.full(len(centros), plantilla, dtype=object)
+    desplazamientos = np.repeat(np.asarray(centros, dtype=np.float64), num_coords, axis=0)
+    return shapely.transform(copias, lambda coords: coords + desplazamientos)
+
+# Fracciones del tamaño de la plantilla a las que se mide cuánto puede sobresalir (de menor a mayor)
+_FRACCIONES_HOLGURA = np.array([0.002, 0.01, 0.03, 0.1, 0.3, 1.0])
+
+@lru_cache(maxsize=TAM_CACHE_PLANTILLAS)
+def _holguras(plantilla, area_max):
+    """
+    Cuánto puede sobresalir la plantilla por cada lado (izq, der, abajo, arriba) sin perder más de area_max.
+    Lo que sobresale de la caja del espacio libre queda fuera de él, así que un candidato que
+    sobresale más que su holgura es inválido con seguridad. Se mide con pocas franjas en una sola
+    llamada vectorizada; redondear hacia arriba solo hace el filtro menos agresivo, nunca incorrecto.
+    """
+    minx, miny, maxx, maxy = plantilla.bounds
+    dx = (maxx - minx) * _FRACCIONES_HOLGURA
+    dy = (maxy - miny) * _FRACCIONES_HOLGURA
+    # clip_by_rect recorta contra un rectángulo alineado sin una intersección general (mucho más barato)
+    rectangulos = (
+        [(minx, miny, minx + d, maxy) for d in dx] + [(maxx - d, miny, maxx, maxy) for d in dx] +
+        [(minx, miny, maxx, miny + d) for d in dy] + [(minx, maxy - d, maxx, maxy) for d in dy]
+    )
+    areas = np.array([shapely.clip_by_rect(plantilla, *r).area for r in rectangulos]).reshape(4, -1)
+    holguras = []
+    for lado, anchos in enumerate((dx, dx, dy, dy)):
+        # Primera franja que ya pierde demasiada área; si ninguna, la plantilla entera
+        excede = np.flatnonzero(areas[lado] > area_max)
+        holguras.append(anchos[excede[0]] if excede.size else anchos[-1])
+    return tuple(holguras)
+
+class EspacioLibre:
+    """
+    Espacio libre (perímetro menos obstáculos) preparado para evaluar muchas posiciones.
+    Además de la geometría preparada guarda los obstáculos recortados al perímetro en un STRtree,
+    de modo que el área de una plantilla que queda fuera del espacio libre se calcula solo con
+    el perímetro y los obstáculos cercanos, sin intersecar cada candidato con todo el espacio libre.
+    Admite añadir obstáculos (agregar) sin recalcular la unión de todos ni el espacio libre desde cero.
+    """
+
+    def __init__(self, perimetro, obstaculos):
+        self.perimetro = perimetro
+        self.geom = perimetro.difference(obstaculos)
+        self.obstaculos = [] if obstaculos is None or obstaculos.is_empty else list(shapely.get_parts(obstaculos))
+        self.partes = self._recortar(obstaculos)
+        self.arbol = shapely.STRtree(self.partes)
+        self._arbol_obstaculos = None
+        self._simplificados = []
+        shapely.prepare(self.geom)
+        shapely.prepare(self.perimetro)
+        self._nucleos = {}
+
+    def _recortar(self, obstaculos):
+        """Partes con área de los obstáculos dentro del perímetro."""
+        if obstaculos is None or obstaculos.is_empty:
+            return np.array([], dtype=object)
+        partes = shapely.get_parts(self.perimetro.intersection(obstaculos))
+        return np.array([p for p in partes if p.area > 0], dtype=object)
+
+    @property
+    def vacio(self):
+        return self.geom.is_empty
+
+    @property
+    def bounds(self):
+        return self.geom.bounds
+
+    @property
+    def hay_obstaculos(self):
+        return bool(self.obstaculos)
+
+    def agregar(self, obstaculo):
+        """
+        Añade un obstáculo (p. ej. una mesa recién colocada). Al espacio libre solo se le resta la pieza
+        nueva y los índices se reconstruyen sobre las partes ya calculadas (un STRtree de cientos de
+        cajas se construye en microsegundos), así que el coste no crece con la unión de todos los anteriores.
+        """
+        self.geom = self.geom.difference(obstaculo)
+        shapely.prepare(self.geom)
+        self.obstaculos.extend(shapely.get_parts(obstaculo))
+        self._arbol_obstaculos = None
+        nuevas = self._recortar(obstaculo)
+        if len(nuevas) == 0:
+            return
+        self.partes = np.concatenate([self.partes, nuevas])
+        self.arbol = shapely.STRtree(self.partes)
+        for radio, (nucleos, _, perimetro_dilatado) in list(self._nucleos.items()):
+            nucleos = np.concatenate([nucleos, self._erosionar(nuevas, radio)])
+            self._nucleos[radio] = (nucleos, shapely.STRtree(nucleos), perimetro_dilatado)
+
+    @staticmethod
+    def _erosionar(partes, radio):
+        nucleos = shapely.buffer(partes, -radio) if len(partes) else np.array([], dtype=object)
+        return nucleos[~shapely.is_empty(nucleos)] if len(nucleos) else nucleos
+
+    def _nucleos_para(self, radio):
+        """Obstáculos erosionados y perímetro dilatado en 'radio' (se calculan una vez por radio)."""
+        if radio not in self._nucleos:
+            nucleos = self._erosionar(self.partes, radio)
+            perimetro_dilatado = self.perimetro.buffer(radio)
+            shapely.prepare(perimetro_dilatado)
+            self._nucleos[radio] = (nucleos, shapely.STRtree(nucleos), perimetro_dilatado)
+        _, arbol_nucleos, perimetro_dilatado = self._nucleos[radio]
+        return arbol_nucleos, perimetro_dilatado
+
+    def invadidas(self, nucleos_geoms, radio):
+        """
+        Descarte barato y exacto: 'nucleos_geoms' son las plantillas erosionadas en 'radio'.
+        Si un núcleo toca el núcleo de un obstáculo (o sale del perímetro dilatado), hay un punto
+        con un disco de ese radio dentro de la plantilla y fuera del espacio libre, así que la
+        plantilla pierde al menos pi * radio^2 de área. Devuelve una máscara de descartadas.
+        """
+        arbol_nucleos, perimetro_dilatado = self._nucleos_para(radio)
+        invadidas = ~shapely.covers(perimetro_dilatado, nucleos_geoms)
+        idx_geom, _ = arbol_nucleos.query(nucleos_geoms, predicate='intersects')
+        invadidas[idx_geom] = True
+        return invadidas
+
+    def area_dentro(self, geoms):
+        """
+        Área de cada geometría que cae dentro del espacio libre:
+        área total - lo que sale del perímetro - lo que pisa obstáculos (ambas partes son disjuntas).
+        """
+        areas = shapely.area(geoms)
+        dentro = shapely.area(shapely.intersection(geoms, self.perimetro))
+        if len(self.partes):
+            idx_geom, idx_parte = self.arbol.query(geoms, predicate='intersects')
+            if idx_geom.size:
+                pisado = shapely.area(shapely.intersection(geoms[idx_geom], self.partes[idx_parte]))
+                dentro = dentro.copy()
+                np.subtract.at(dentro, idx_geom, pisado)
+        return np.minimum(dentro, areas)
+
+    def distancia_obstaculos(self, geoms, simplificados=False):
+        """
+        Distancia de cada geometría al obstáculo más cercano (la misma que con la unión de todos).
+        La distancia exacta entre polígonos es cara, así que se usa el índice para medir solo lo necesario:
+        primero contra el obstáculo con la caja más cercana y después solo contra los obstáculos cuya
+        caja está a menos de esa distancia (ninguno más lejano puede ser el más cercano).
+        Con 'simplificados' se mide contra los obstáculos simplificados con TOLERANCIA_COTA_DISTANCIA.
+        """
+        distancias = np.full(len(geoms), np.inf)
+        if not self.obstaculos or len(geoms) == 0:
+            return distancias
+        if self._arbol_obstaculos is None:
+            self._obstaculos_arr = np.array(self.obstaculos, dtype=object)
+            self._cajas_obstaculos = shapely.envelope(self._obstaculos_arr)
+            self._arbol_obstaculos = shapely.STRtree(self._cajas_obstaculos)
+        obstaculos, arbol = self._obstaculos_arr, self._arbol_obstaculos
+        if simplificados:
+            # Solo se simplifican los obstáculos añadidos desde la última consulta
+            pendientes = self.obstaculos[len(self._simplificados):]
+            self._simplificados.extend(shapely.simplify(np.array(pendientes, dtype=object), TOLERANCIA_COTA_DISTANCIA))
+            obstaculos = np.array(self._simplificados, dtype=object)
+
+        cajas = shapely.envelope(geoms)
+        (idx_geom, idx_obs), _ = arbol.query_nearest(cajas, return_distance=True, all_matches=False)
+        distancias[idx_geom] = shapely.distance(geoms[idx_geom], obstaculos[idx_obs])
+
+        # Obstáculos cuya caja queda a menos de la distancia ya encontrada
+        minx, miny, maxx, maxy = shapely.bounds(geoms).T
+        ventanas = shapely.box(minx - distancias, miny - distancias, maxx + distancias, maxy + distancias)
+        idx_geom, idx_obs = arbol.query(ventanas)
+        if idx_geom.size:
+            cerca = shapely.distance(cajas[idx_geom], self._cajas_obstaculos[idx_obs]) < distancias[idx_geom]
+            idx_geom, idx_obs = idx_geom[cerca], idx_obs[cerca]
+            np.minimum.at(distancias, idx_geom, shapely.distance(geoms[idx_geom], obstaculos[idx_obs]))
+        return distancias
+
+def mas_separada(espacio, plantilla, centros, tolerancia=TOLERANCIA_AREA, umbral=-np.inf):
+    """
+    Índice del centro válido cuya plantilla queda más lejos de los obstáculos del espacio (el primero
+    si hay empate) y esa distancia, o None si ningún centro es válido o ninguno supera 'umbral' (la
+    mejor distancia de otro ángulo: los centros cuya cota no la supera ni se validan).
+    Filtro y refinamiento: con plantilla y obstáculos simplificados (muchos menos vértices) la distancia
+    se acota con un error de como mucho 2·TOLERANCIA_COTA_DISTANCIA. Los centros se validan y se miden
+    exactamente en orden de cota decreciente, y se para en cuanto la mejor distancia exacta supera la
+    cota de los que quedan, así que la mayoría de candidatos nunca se comprueban del todo.
+    """
+    margen = 2.0 * TOLERANCIA_COTA_DISTANCIA * 1.001 + 1e-9
+    simplificada = plantilla_simplificada(plantilla)
+    cotas = espacio.distancia_obstaculos(mover_plantilla(simplificada, centros), simplificados=True) + margen
+    orden = np.argsort(-cotas, kind='stable')
+
+    mejor_k, mejor_d = None, umbral
+    inicio, tam_bloque = 0, TAM_BLOQUE_INICIAL
+    while inicio < len(orden) and cotas[orden[inicio]] >= mejor_d:
+        bloque = orden[inicio:inicio + tam_bloque]
+        inicio += tam_bloque
+        tam_bloque = min(2 * tam_bloque, TAM_BLOQUE_MAX)
+        bloque = bloque[cotas[bloque] >= mejor_d]
+        validos = bloque[posiciones_validas(plantilla, espacio, centros[bloque], tolerancia)]
+        if validos.size == 0:
+            continue
+        exactas = espacio.distancia_obstaculos(mover_plantilla(plantilla, centros[validos]))
+        # Máximo del bloque y, a igualdad, el índice menor (el primero en el recorrido x / y)
+        empatados = validos[exactas == exactas.max()]
+        k, d = int(empatados.min()), float(exactas.max())
+        if d > mejor_d or (mejor_k is not None and d == mejor_d and k < mejor_k):
+            mejor_k, mejor_d = k, d
+    return None if mejor_k is None else (mejor_k, mejor_d)
+
+def mejor_separacion(plantilla, espacio, centros, umbral=-np.inf):
+    """
+    Como mas_separada, pero mientras no hay obstáculos la distancia se mide a las paredes del
+    perímetro. Devuelve (índice, distancia) del primero de los máximos o None si ningún centro es
+    válido o ninguno supera 'umbral'.
+    """
+    if espacio.hay_obstaculos:
+        return mas_separada(espacio, plantilla, centros, umbral=umbral)
+    validos = np.flatnonzero(posiciones_validas(plantilla, espacio, centros))
+    if validos.size == 0:
+        return None
+    distancias = shapely.distance(espacio.perimetro.exterior, mover_plantilla(plantilla, centros[validos]))
+    j = int(np.argmax(distancias))
+    if distancias[j] <= umbral:
+        return None
+    return int(validos[j]), float(distancias[j])
+
+def _prefiltro_cajas(plantilla, espacio_libre, centros, tolerancia):
+    """Descarta sin geometría los candidatos cuya caja sobresale del espacio libre más de lo tolerable."""
+    area_max = (1.0 - tolerancia) * plantilla.area
+    p_minx, p_miny, p_maxx, p_maxy = plantilla.bounds
+    e_minx, e_miny, e_maxx, e_maxy = espacio_libre.bounds
+    h_izq, h_der, h_abajo, h_arriba = _holguras(plantilla, area_max)
+    x, y = centros[:, 0], centros[:, 1]
+    return (
+        (x + p_minx >= e_minx - h_izq) & (x + p_maxx <= e_maxx + h_der) &
+        (y + p_miny >= e_miny - h_abajo) & (y + p_maxy <= e_maxy + h_arriba)
+    )
+
+@lru_cache(maxsize=TAM_CACHE_PLANTILLAS)
+def _nucleo_descarte(plantilla, tolerancia):
+    """Radio del disco cuya área ya supera la pérdida tolerada y plantilla erosionada en ese radio."""
+    radio = float(np.sqrt((1.0 - tolerancia) * plantilla.area / np.pi)) * 1.001
+    if radio > 0:
+        radio = FACTOR_RADIO ** math.ceil(math.log(radio, FACTOR_RADIO))
+    return radio, plantilla.buffer(-radio)
+
+def posiciones_validas(plantilla, espacio, centros, tolerancia=TOLERANCIA_AREA):
+    """Máscara de todos los centros válidos, con la misma regla que primera_posicion_valida."""
+    validas = np.zeros(len(centros), dtype=bool)
+    if len(centros) == 0:
+        return validas
+    indices = np.flatnonzero(_prefiltro_cajas(plantilla, espacio.geom, centros, tolerancia))
+    if indices.size == 0:
+        return validas
+
+    movidas = mover_plantilla(plantilla, centros[indices])
+    cubiertas = shapely.covers(espacio.geom, movidas)
+    parciales = np.flatnonzero(shapely.intersects(espacio.geom, movidas) & ~cubiertas)
+    radio, nucleo = _nucleo_descarte(plantilla, tolerancia)
+    if parciales.size and not nucleo.is_empty:
+        parciales = parciales[~espacio.invadidas(mover_plantilla(nucleo, centros[indices[parciales]]), radio)]
+    if parciales.size:
+        cubiertas[parciales] = espacio.area_dentro(movidas[parciales]) / plantilla.area >= tolerancia
+    validas[indices] = cubiertas
+    return validas
+
+def fraccion_dentro(plantilla, espacio, centros):
+    """Fracción del área de la plantilla que queda dentro del espacio libre en cada centro."""
+    if len(centros) == 0:
+        return np.zeros(0)
+    return espacio.area_dentro(mover_plantilla(plantilla, centros)) / plantilla.area
+
+def puntuar_separacion(plantilla, espacio, centros, cuantas, tolerancia=TOLERANCIA_AREA):
+    """
+    Puntuación de los centros para el refinamiento de la búsqueda de máxima separación:
+    - los válidos, con una cota inferior de su separación: la distancia con plantilla y obstáculos
+      simplificados menos su error máximo (como en mas_separada), sin bajar de 0. Distinguir
+      posiciones a menos de 2·TOLERANCIA_COTA_DISTANCIA no compensa una distancia exacta por centro;
+    - si hay menos de 'cuantas' válidos, los demás con fracción dentro - 1 (negativa, más alta cuanto
+      menos sobra), para que el refinamiento también pueda acercarse a huecos justos. Si no, -inf.
+    Sin obstáculos la separación es la distancia exacta a las paredes.
+    """
+    puntuaciones = np.full(len(centros), -np.inf)
+    if len(centros) == 0:
+        return puntuaciones
+    validas = posiciones_validas(plantilla, espacio, centros, tolerancia)
+    if espacio.hay_obstaculos:
+        margen = 2.0 * TOLERANCIA_COTA_DISTANCIA * 1.001 + 1e-9
+        simplificada = plantilla_simplificada(plantilla)
+        distancias = espacio.distancia_obstaculos(mover_plantilla(simplificada, centros[validas]), simplificados=True)
+        puntuaciones[validas] = np.maximum(distancias - margen, 0.0)
+    else:
+        puntuaciones[validas] = shapely.distance(espacio.perimetro.exterior, mover_plantilla(plantilla, centros[validas]))
+    if np.count_nonzero(validas) < cuantas:
+        # La fracción nunca llega a 'tolerancia' en los no válidos, así que quedan por debajo de 0
+        puntuaciones[~validas] = fraccion_dentro(plantilla, espacio, centros[~validas]) - 1.0
+    return puntuaciones
+
+def refinar(evaluar, centros, puntuaciones, paso, refinamiento, objetivo=np.inf):
+    """
+    Búsqueda de grueso a fino a partir de una rejilla ya evaluada ('centros' con sus 'puntuaciones').
+    En cada nivel el paso se divide entre dos y se evalúan los 8 vecinos de las refinamiento.top_k mejores
+    posiciones del nivel anterior, hasta bajar de refinamiento.precision, agotar el presupuesto o
+    alcanzar 'objetivo'. evaluar(centros) devuelve una puntuación por centro (mayor es mejor, -inf si
+    no sirve). Devuelve (centro, puntuación) del mejor visto; como incluye la rejilla inicial, el
+    resultado nunca es peor que el de la rejilla sola.
+    """
+    k = int(np.argmax(puntuaciones))
+    mejor_centro, mejor = centros[k], float(puntuaciones[k])
+    restantes = refinamiento.presupuesto
+    while paso > refinamiento.precision and restantes > 0 and mejor < objetivo:
+        paso /= 2.0
+        utiles = np.flatnonzero(np.isfinite(puntuaciones))
+        if utiles.size == 0:
+            break
+        semillas = utiles[np.argsort(-puntuaciones[utiles], kind='stable')[:refinamiento.top_k]]
+        nuevos = (centros[semillas][:, None, :] + _VECINOS[None, :, :] * paso).reshape(-1, 2)[:restantes]
+        restantes -= len(nuevos)
+        puntuaciones_nuevas = evaluar(nuevos)
+        centros = np.concatenate([centros[semillas], nuevos])
+        puntuaciones = np.concatenate([puntuaciones[semillas], puntuaciones_nuevas])
+        k = int(np.argmax(puntuaciones_nuevas))
+        if puntuaciones_nuevas[k] > mejor:
+            mejor_centro, mejor = nuevos[k], float(puntuaciones_nuevas[k])
+    return mejor_centro, mejor
+
+def primera_posicion_valida(plantilla, espacio, centros, tolerancia=TOLERANCIA_AREA):
+    """
+    Índice del primer centro (en el orden dado) en el que la plantilla queda dentro del EspacioLibre,
+    con la misma regla que antes: área(intersección) / área(plantilla) >= tolerancia. None si no hay ninguno.
+    Orden de las comprobaciones: caja (sin geometría), covers/intersects preparados (rápidos) y,
+    solo para los candidatos que tocan el borde antes del primer válido, el área dentro del espacio libre.
+    """
+    if len(centros) == 0:
+        return None
+    espacio_libre = espacio.geom
+    indices = np.flatnonzero(_prefiltro_cajas(plantilla, espacio_libre, centros, tolerancia))
+    if indices.size == 0:
+        return None
+
+    area_plantilla = plantilla.area
+    radio, nucleo = _nucleo_descarte(plantilla, tolerancia)
+    inicio, tam_bloque = 0, TAM_BLOQUE_INICIAL
+    while inicio < indices.size:
+        bloque = indices[inicio:inicio + tam_bloque]
+        inicio += tam_bloque
+        tam_bloque = min(2 * tam_bloque, TAM_BLOQUE_MAX)
+        movidas = mover_plantilla(plantilla, centros[bloque])
+        validas = shapely.covers(espacio_libre, movidas)
+
+        # Los parciales posteriores al primer candidato cubierto no pueden ser "el primero"
+        cubiertas = np.flatnonzero(validas)
+        limite = cubiertas[0] if cubiertas.size else len(bloque)
+        parciales = np.flatnonzero(shapely.intersects(espacio_libre, movidas[:limite]) & ~validas[:limite])
+        if parciales.size and not nucleo.is_empty:
+            parciales = parciales[~espacio.invadidas(mover_plantilla(nucleo, centros[bloque[parciales]]), radio)]
+        if parciales.size:
+            areas = espacio.area_dentro(movidas[parciales])
+            validas[parciales] = areas / area_plantilla >= tolerancia
+
+        aciertos = np.flatnonzero(validas)
+        if aciertos.size:
+            return int(bloque[aciertos[0]])
+    return None
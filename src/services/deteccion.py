@@ -0,0 +1,280 @@
+import math
+import time
+from concurrent.futures import Future
+
+from .recursos import procesar_detecciones, agrupar_mesas_sillas, extraer_detecciones, MODOS_AGRUPACION
+from .imagenes import decodificar_imagen
+from .perimetro import detectar_perimetro, perimetro_en_cache
+from .cache_detecciones import CacheDetecciones, hash_imagen
+from .teselado import detectar_por_teselas
+
+def parsear_config(config_data):
+    """
+    Extrae del JSON de configuración enviado por el cliente los datos del local.
+    Devuelve (local_ancho_m, local_alto_m, filtros_m). Lanza KeyError/TypeError si falta algo.
+    Parámetros:
+    - config_data: Diccionario con 'local_ancho_m', 'local_alto_m' y 'filtros_m'.
+    """
+    return config_data['local_ancho_m'], config_data['local_alto_m'], config_data['filtros_m']
+
+def parsear_teselado(valor, tam_defecto, solape_defecto):
+    """
+    Interpreta la opción 'teselado' del JSON de configuración.
+    Acepta true/false o un diccionario {'tam': píxeles, 'solape': fracción}.
+    Devuelve None si el teselado está desactivado, o {'tam', 'solape'}.
+    """
+    if not valor:
+        return None
+    opciones = valor if isinstance(valor, dict) else {}
+    tam = int(opciones.get('tam', tam_defecto))
+    solape = float(opciones.get('solape', solape_defecto))
+    if tam < 32 or not (0.0 <= solape < 0.9):
+        raise ValueError("Teselado inválido: 'tam' debe ser >= 32 y 'solape' estar en [0, 0.9).")
+    return {'tam': tam, 'solape': solape}
+
+def parsear_agrupacion(valor):
+    """
+    Interpreta la opción 'agrupacion' del JSON de configuración.
+    Acepta un diccionario {'modo': 'cercana'|'optima', 'max_dist_m': metros} (ambas claves opcionales).
+    Devuelve {'modo', 'max_dist_m'} con max_dist_m None si no se limita la distancia.
+    """
+    if valor is None:
+        valor = {}
+    if not isinstance(valor, dict):
+        raise ValueError("Agrupación inválida: debe ser un objeto {'modo', 'max_dist_m'}.")
+    modo = valor.get('modo', 'cercana')
+    if modo not in MODOS_AGRUPACION:
+        raise ValueError(f"Agrupación inválida: 'modo' debe ser uno de {list(MODOS_AGRUPACION)}.")
+    max_dist_m = valor.get('max_dist_m')
+    if max_dist_m is not None:
+        if isinstance(max_dist_m, bool) or not isinstance(max_dist_m, (int, float)):
+            raise ValueError("Agrupación inválida: 'max_dist_m' debe ser un número.")
+        max_dist_m = float(max_dist_m)
+        if not (math.isfinite(max_dist_m) and max_dist_m > 0):
+            raise ValueError("Agrupación inválida: 'max_dist_m' debe ser mayor que 0.")
+    return {'modo': modo, 'max_dist_m': max_dist_m}
+
+def parsear_opciones_perimetro(valor, defectos):
+    """
+    Interpreta la opción 'perimetro' del JSON de configuración y la combina con los valores
+    por defecto de la aplicación. Devuelve los argumentos para detectar_perimetro.
+    Parámetros:
+    - valor: Diccionario opcional con 'umbral', 'epsilon', 'multiresolucion' y 'lado_max'.
+    - defectos: Diccionario con las mismas claves tomado de la configuración.
+    """
+    opciones = dict(defectos)
+    opciones.update(valor or {})
+    umbral = int(opciones['umbral'])
+    epsilon = float(opciones['epsilon'])
+    if not (0 <= umbral <= 255) or not (0.0 < epsilon < 1.0):
+        raise ValueError("Perímetro inválido: 'umbral' debe estar en [0, 255] y 'epsilon' en (0, 1).")
+    return {
+        'umbral': umbral,
+        'epsilon_factor': epsilon,
+        'multiresolucion': bool(opciones['multiresolucion']),
+        'lado_max': int(opciones['lado_max']),
+    }
+
+def predecir_en_lotes(model, imagenes, batch_size, conf=0.25, iou=0.45):
+    """
+    Ejecuta el modelo YOLO sobre una lista de imágenes en lotes de tamaño `batch_size`.
+    Devuelve una lista de resultados en el mismo orden que `imagenes`.
+    Parámetros:
+    - model: Modelo YOLO cargado.
+    - imagenes: Lista de arreglos NumPy BGR.
+    - batch_size: Número máximo de imágenes por llamada al modelo.
+    - conf, iou: Umbrales de confianza y NMS.
+    """
+    batch_size = max(1, int(batch_size))
+    resultados = []
+    for inicio in range(0, len(imagenes), batch_size):
+        lote = imagenes[inicio:inicio + batch_size]
+        resultados.extend(model.predict(source=lote, conf=conf, iou=iou, save=False, verbose=False))
+    return resultados
+
+def _cronometrar(func, *args, **kwargs):
+    """Ejecuta func y devuelve (resultado, milisegundos)."""
+    t0 = time.perf_counter()
+    resultado = func(*args, **kwargs)
+    return resultado, (time.perf_counter() - t0) * 1000.0
+
+def _en_paralelo(executor, func, *args, **kwargs):
+    """Envía func al pool de hilos; sin pool, la ejecuta aquí y devuelve un Future ya resuelto."""
+    if executor is not None:
+        return executor.submit(func, *args, **kwargs)
+    futuro = Future()
+    try:
+        futuro.set_result(func(*args, **kwargs))
+    except Exception as e:
+        futuro.set_exception(e)
+    return futuro
+
+def detectar_planos(model, datos_imagenes, batch_size, conf=0.25, iou=0.45, cache=None, id_modelo='',
+                    teselado=None, opciones_perimetro=None, executor=None, hashes=None, max_pixeles=None,
+                    tam_lote_teselas=None):
+    """
+    Obtiene las detecciones crudas y el perímetro de cada plano, consultando primero las cachés.
+    Solo se pasan por YOLO las imágenes cuyas detecciones no están en `cache`, y solo se decodifican
+    las que además necesitan detecciones o un perímetro que no esté en la caché de perimetro.py.
+    YOLO y detectar_perimetro son independientes y ambos liberan el GIL, así que con un
+    `executor` el perímetro se calcula en paralelo a la inferencia.
+    Devuelve una lista de diccionarios {'detecciones', 'perimetro', 'tiempos_ms'} en el mismo
+    orden de entrada (con teselado, además 'teselas'; las que salen enteras de caché no traen tiempos).
+    Lanza ValueError si alguna imagen no se puede decodificar.
+    Parámetros:
+    - model: Modelo YOLO cargado.
+    - datos_imagenes: Lista con los bytes de cada imagen.
+    - batch_size: Número máximo de imágenes por llamada al modelo.
+    - conf, iou: Umbrales de confianza y NMS (forman parte de la clave de caché, como el teselado).
+    - cache: (Opcional) CacheDetecciones compartida por la aplicación.
+    - id_modelo: Identificador de los pesos del modelo (forma parte de la clave de caché).
+    - teselado: (Opcional) {'tam', 'solape'} para inferencia por teselas en planos muy grandes.
+    - opciones_perimetro: (Opcional) Argumentos para detectar_perimetro (ver parsear_opciones_perimetro),
+      comunes a todas las imágenes o una lista con unos por imagen.
+    - executor: (Opcional) ThreadPoolExecutor compartido de la aplicación.
+    - hashes: (Opcional) SHA-256 de cada imagen ya calculados al recibir la subida.
+    - max_pixeles: (Opcional) Límite de píxeles por imagen (ver decodificar_imagen).
+    - tam_lote_teselas: (Opcional) Teselas por llamada al modelo con teselado; por defecto batch_size.
+    """
+    tam_lote_teselas = tam_lote_teselas or batch_size
+    if isinstance(opciones_perimetro, list):
+        opciones_por_imagen = opciones_perimetro
+    else:
+        opciones_por_imagen = [opciones_perimetro or {}] * len(datos_imagenes)
+    num_imagenes = len(datos_imagenes)
+    salida = [None] * num_imagenes
+    if hashes is None:
+        hashes = [hash_imagen(datos) for datos in datos_imagenes]
+    claves = [None] * num_imagenes
+    detecciones_cache = [None] * num_imagenes
+    # El perímetro no depende del modelo: se busca en su propia caché (perimetro.py)
+    perimetros_cache = [perimetro_en_cache(hashes[i], **opciones_por_imagen[i]) for i in range(num_imagenes)]
+
+    if cache is not None:
+        extra = f"teselas-{teselado['tam']}-{teselado['solape']:.3f}" if teselado else ''
+        for i in range(num_imagenes):
+            claves[i] = CacheDetecciones.clave(hashes[i], id_modelo, conf, iou, extra)
+            detecciones_cache[i] = cache.obtener(claves[i])
+
+    pendientes = []
+    for i in range(num_imagenes):
+        if detecciones_cache[i] is None:
+            pendientes.append(i)
+        elif perimetros_cache[i] is not None:
+            salida[i] = {'detecciones': detecciones_cache[i], 'perimetro': perimetros_cache[i]}
+        else:
+            # Detecciones en caché pero perímetro con otros parámetros: solo se repite el perímetro
+            t0 = time.perf_counter()
+            img = decodificar_imagen(datos_imagenes[i], max_pixeles)
+            t_decodificacion = (time.perf_counter() - t0) * 1000.0
+            perimetro, t_perimetro = _cronometrar(detectar_perimetro, img, clave_imagen=hashes[i], **opciones_por_imagen[i])
+            salida[i] = {
+                'detecciones': detecciones_cache[i],
+                'perimetro': perimetro,
+                'tiempos_ms': {'decodificacion': round(t_decodificacion, 2), 'perimetro': round(t_perimetro, 2)},
+            }
+
+    def lanzar_perimetro(i, img):
+        # El perímetro (OpenCV) corre en el pool mientras YOLO (torch) usa este hilo
+        return _en_paralelo(executor, _cronometrar, detectar_perimetro, img, clave_imagen=hashes[i], **opciones_por_imagen[i])
+
+    if pendientes and teselado:
+        for i in pendientes:
+            t0 = time.perf_counter()
+            img = decodificar_imagen(datos_imagenes[i], max_pixeles)
+            t_decodificacion = (time.perf_counter() - t0) * 1000.0
+
+            futuro_perimetro = lanzar_perimetro(i, img)
+            detecciones, tiempos, num_teselas = detectar_por_teselas(
+                model, img, teselado['tam'], teselado['solape'], tam_lote_teselas, conf=conf, iou=iou
+            )
+
+            t0 = time.perf_counter()
+            perimetro, tiempos['perimetro'] = futuro_perimetro.result()
+            tiempos['espera_perimetro'] = (time.perf_counter() - t0) * 1000.0
+            tiempos['decodificacion'] = t_decodificacion
+
+            salida[i] = {
+                'detecciones': detecciones,
+                'perimetro': perimetro,
+                'tiempos_ms': {k: round(v, 2) for k, v in tiempos.items()},
+                'teselas': num_teselas,
+            }
+            if cache is not None:
+                cache.guardar(claves[i], detecciones)
+    elif pendientes:
+        t0 = time.perf_counter()
+        imagenes = [decodificar_imagen(datos_imagenes[i], max_pixeles) for i in pendientes]
+        t_decodificacion = (time.perf_counter() - t0) * 1000.0
+
+        futuros_perimetro = [lanzar_perimetro(i, img) for i, img in zip(pendientes, imagenes)]
+
+        t0 = time.perf_counter()
+        results_list = predecir_en_lotes(model, imagenes, batch_size, conf=conf, iou=iou)
+        t_inferencia = (time.perf_counter() - t0) * 1000.0
+
+        for i, results, futuro in zip(pendientes, results_list, futuros_perimetro):
+            detecciones = extraer_detecciones(results)
+            t0 = time.perf_counter()
+            perimetro, t_perimetro = futuro.result()
+            salida[i] = {
+                'detecciones': detecciones,
+                'perimetro': perimetro,
+                'tiempos_ms': {
+                    'decodificacion': round(t_decodificacion, 2),
+                    'inferencia': round(t_inferencia, 2),
+                    'perimetro': round(t_perimetro, 2),
+                    'espera_perimetro': round((time.perf_counter() - t0) * 1000.0, 2),
+                },
+            }
+            if cache is not None:
+                cache.guardar(claves[i], detecciones)
+
+    return salida
+
+def construir_layout(detecciones, poligono_perimetro, local_ancho_m, local_alto_m, filtros_m, agrupacion=None):
+    """
+    Convierte las detecciones de una imagen en el JSON de layout que consume el front-end.
+    Parámetros:
+    - detecciones: Diccionario de extraer_detecciones (incluye 'orig_shape').
+    - poligono_perimetro: Lista de puntos del perímetro detectado.
+    - local_ancho_m, local_alto_m: Dimensiones del local en metros.
+    - filtros_m: Diccionario con filtros de tamaño para mesas y sillas.
+    - agrupacion: (Opcional) Resultado de parsear_agrupacion; por defecto modo 'cercana' sin distancia máxima.
+    """
+    agrupacion = agrupacion or parsear_agrupacion(None)
+    alto_plano_pixeles, ancho_plano_pixeles = detecciones['orig_shape']
+
+    lista_mesas, lista_sillas = procesar_detecciones(
+        detecciones,
+        local_ancho_m,
+        local_alto_m,
+        filtros_m
+    )
+
+    layout_ordenado = agrupar_mesas_sillas(
+        lista_mesas,
+        lista_sillas,
+        max_dist_m=agrupacion['max_dist_m'],
+        modo=agrupacion['modo']
+    )
+
+    # Calcular el factor de conversión de metros a píxeles.
+    try:
+        m_to_px_scale = float(ancho_plano_pixeles) / float(local_ancho_m)
+    except (TypeError, ZeroDivisionError):
+        m_to_px_scale = 20.0
+
+    return {
+        "dimensions": {
+            "width_px": ancho_plano_pixeles,
+            "height_px": alto_plano_pixeles,
+            "width_m": local_ancho_m,
+            "height_m": local_alto_m,
+        },
+        "objects": layout_ordenado,
+        "perimeter": {
+            "points": poligono_perimetro
+        },
+        "m_to_px": m_to_px_scale
+    }
@@ -0,0 +1,228 @@
+"""
+Motor de colocación por espacio de configuraciones (c-space).
+En lugar de probar centros uno a uno, calcula de una vez la región de centros factibles:
+los puntos c tales que la plantilla trasladada a c queda dentro del perímetro y no pisa
+ningún obstáculo. Esa región es
+
+    {c : c + T ⊆ perímetro}  -  (obstáculos ⊕ -T)
+
+donde ⊕ es la suma de Minkowski. Las sumas se construyen con piezas convexas (la suma de dos
+convexos es la envolvente convexa de las sumas de sus vértices), así que el resultado no
+depende del paso de ninguna rejilla ni del tamaño de la sala.
+
+La plantilla y los obstáculos se sustituyen antes por una versión simplificada que los contiene
+(ver _simplificar_contenedor), por lo que el motor es conservador: cualquier centro de la región
+es válido para la geometría original, a costa de unos centímetros de holgura.
+"""
+import numpy as np
+import shapely
+from shapely.affinity import translate
+from shapely.geometry import Polygon
+from shapely.geometry.polygon import orient
+
+# Tolerancia de simplificación (m): la plantilla y los obstáculos crecen como mucho ~2x este valor
+EPSILON_SIMPLIFICACION = 0.01
+# Precisión (m) de la búsqueda del centro con máxima separación
+PRECISION_SEPARACION = 0.01
+# Erosión final de la región factible (m): elimina las astillas de área casi nula que dejan los
+# bordes casi coincidentes en las diferencias y garantiza un margen mínimo a cualquier centro
+TOLERANCIA_NUMERICA = 1e-6
+
+def _simplificar_contenedor(geom, epsilon=EPSILON_SIMPLIFICACION):
+    """
+    Versión con pocos vértices que contiene a 'geom': se dilata 2·epsilon con esquinas en inglete
+    y se simplifica con tolerancia epsilon (la simplificación se aleja como mucho epsilon del borde).
+    """
+    if geom.is_empty:
+        return geom
+    return geom.buffer(2 * epsilon, join_style='mitre').simplify(epsilon)
+
+def _es_convexo(poligono):
+    return not poligono.interiors and poligono.convex_hull.area - poligono.area <= 1e-9 * max(poligono.area, 1.0)
+
+def _giro(a, b, c):
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+def _fusionar_triangulos(triangulos):
+    """
+    Hertel-Mehlhorn: parte de una triangulación y elimina diagonales mientras las dos piezas que
+    separa sigan formando un polígono convexo. Trabaja con tuplas de coordenadas (los triángulos
+    vecinos comparten vértices exactos), sin operaciones de Shapely por diagonal.
+    """
+    piezas = {}
+    aristas = {}
+    for k, triangulo in enumerate(triangulos):
+        ciclo = [tuple(c) for c in np.asarray(triangulo.exterior.coords)[:-1]]
+        if _giro(*ciclo) < 0:
+            ciclo.reverse()
+        piezas[k] = ciclo
+        for i in range(3):
+            aristas[(ciclo[i], ciclo[(i + 1) % 3])] = k
+
+    for (a, b) in list(aristas):
+        p, q = aristas.get((a, b)), aristas.get((b, a))
+        if p is None or q is None or p == q:
+            continue
+        ciclo_p, ciclo_q = piezas[p], piezas[q]
+        # Unión recorriendo p desde b hasta a y q desde a hasta b (sin repetir extremos)
+        i, j = ciclo_p.index(b), ciclo_q.index(a)
+        tramo_p = ciclo_p[i:] + ciclo_p[:i]
+        tramo_q = ciclo_q[j:] + ciclo_q[:j]
+        ciclo = tramo_p + tramo_q[1:-1]
+        n = len(ciclo)
+        ia, ib = len(tramo_p) - 1, 0
+        if any(_giro(ciclo[v - 1], ciclo[v], ciclo[(v + 1) % n]) < -1e-12 for v in (ia, ib)):
+            continue
+        del piezas[q]
+        piezas[p] = ciclo
+        del aristas[(a, b)], aristas[(b, a)]
+        for v in range(n):
+            aristas[(ciclo[v], ciclo[(v + 1) % n])] = p
+    return [Polygon(ciclo) for ciclo in piezas.values()]
+
+def _piezas_convexas(geom):
+    """
+    Descompone una geometría poligonal en piezas convexas. Los polígonos convexos se dejan como están;
+    el resto se triangula y se fusionan triángulos vecinos (menos piezas = menos sumas de Minkowski).
+    """
+    piezas = []
+    for poligono in shapely.get_parts(geom):
+        if poligono.is_empty or poligono.area <= 0:
+            continue
+        if _es_convexo(poligono):
+            piezas.append(poligono)
+        else:
+            piezas.extend(_fusionar_triangulos(shapely.get_parts(shapely.constrained_delaunay_triangles(poligono))))
+    return piezas
+
+def _vertices(poligono):
+    """Vértices de un polígono convexo en sentido antihorario (sin repetir el de cierre)."""
+    return np.asarray(orient(poligono, 1.0).exterior.coords)[:-1]
+
+def _ciclo(vertices):
+    """Vértice más bajo de un convexo (antihorario) y sus aristas desde él, con el ángulo de cada una."""
+    k = np.lexsort((vertices[:, 0], vertices[:, 1]))[0]
+    v = np.roll(vertices, -k, axis=0)
+    aristas = np.roll(v, -1, axis=0) - v
+    aristas = aristas[np.any(aristas != 0, axis=1)]
+    # Desde el vértice más bajo los ángulos crecen de forma monótona en [0, 2*pi)
+    angulos = np.mod(np.arctan2(aristas[:, 1], aristas[:, 0]), 2 * np.pi)
+    return v[0], aristas, angulos
+
+def _sumas_minkowski(convexos_a, convexos_b):
+    """
+    Unión de A_i ⊕ B_j para todas las parejas de convexos (dados por sus vértices antihorarios;
+    un segmento vale como convexo de dos vértices). La suma de dos convexos se obtiene partiendo de
+    la suma de sus vértices más bajos y recorriendo las aristas de ambos ordenadas por ángulo,
+    así que cuesta |A_i| + |B_j| y todas las parejas se calculan a la vez con numpy.
+    """
+    ciclos_a = [_ciclo(v) for v in convexos_a]
+    ciclos_b = [_ciclo(v) for v in convexos_b]
+    if not ciclos_a or not ciclos_b:
+        return Polygon()
+    num_b = len(ciclos_b)
+    inicios_b = np.array([c[0] for c in ciclos_b])
+    aristas_b = np.concatenate([c[1] for c in ciclos_b])
+    angulos_b = np.concatenate([c[2] for c in ciclos_b])
+    pieza_b = np.repeat(np.arange(num_b), [len(c[1]) for c in ciclos_b])
+
+    aristas, angulos, parejas, origenes = [], [], [], []
+    for i, (inicio_a, aristas_a, angulos_a) in enumerate(ciclos_a):
+        base = i * num_b
+        aristas += [np.tile(aristas_a, (num_b, 1)), aristas_b]
+        angulos += [np.tile(angulos_a, num_b), angulos_b]
+        parejas += [base + np.repeat(np.arange(num_b), len(aristas_a)), base + pieza_b]
+        origenes.append(inicio_a + inicios_b)
+    aristas, angulos = np.concatenate(aristas), np.concatenate(angulos)
+    parejas, origenes = np.concatenate(parejas), np.concatenate(origenes)
+
+    orden = np.lexsort((angulos, parejas))
+    aristas, parejas = aristas[orden], parejas[orden]
+    # Suma acumulada exclusiva de las aristas dentro de cada pareja
+    previas = np.cumsum(aristas, axis=0) - aristas
+    primera = np.flatnonzero(np.r_[True, parejas[1:] != parejas[:-1]])
+    vertices = origenes[parejas] + previas - np.repeat(previas[primera], np.diff(np.r_[primera, len(parejas)]), axis=0)
+    sumas = shapely.polygons(shapely.linearrings(vertices, indices=parejas))
+    return shapely.union_all(sumas)
+
+def _reflejar(poligono):
+    return shapely.transform(poligono, lambda c: -c)
+
+def _bordes(geom):
+    """Cada arista de los anillos de 'geom' como segmento (convexo degenerado de dos vértices)."""
+    segmentos = []
+    for anillo in shapely.get_rings(shapely.get_parts(geom)):
+        coords = np.asarray(anillo.coords)
+        segmentos.extend(coords[k:k + 2] for k in range(len(coords) - 1))
+    return segmentos
+
+class EspacioConfiguracion:
+    """
+    Regiones de centros de una plantilla (ya orientada y centrada en el origen) en una sala:
+    - dentro_perimetro: centros con la plantilla completamente dentro del perímetro.
+    - bloqueo_obstaculos: centros en los que la plantilla pisaría algún obstáculo (obstáculos ⊕ -T).
+    - bloqueo_paredes: centros en los que la plantilla cruzaría una pared (bordes del perímetro ⊕ -T).
+    - factible: dentro_perimetro - bloqueo_obstaculos.
+    La distancia de un centro c a bloqueo_obstaculos es exactamente la separación entre la
+    plantilla en c y los obstáculos, lo que permite maximizarla sin recorrer una rejilla.
+    """
+
+    def __init__(self, plantilla, perimetro, obstaculos, epsilon=EPSILON_SIMPLIFICACION):
+        plantilla_s = _simplificar_contenedor(plantilla, epsilon)
+        piezas_reflejadas = [_vertices(_reflejar(p)) for p in _piezas_convexas(plantilla_s)]
+
+        # c + T ⊆ perímetro  <=>  (por cada componente conexa de T) un punto de referencia de la
+        # componente cae dentro y la componente no cruza ningún borde del perímetro
+        self.bloqueo_paredes = _sumas_minkowski(_bordes(perimetro), piezas_reflejadas)
+        dentro = None
+        for componente in shapely.get_parts(plantilla_s):
+            ref = componente.representative_point()
+            trasladado = translate(perimetro, -ref.x, -ref.y)
+            dentro = trasladado if dentro is None else dentro.intersection(trasladado)
+        self.dentro_perimetro = dentro.difference(self.bloqueo_paredes) if dentro is not None else Polygon()
+
+        if obstaculos is None or obstaculos.is_empty:
+            self.bloqueo_obstaculos = Polygon()
+        else:
+            obstaculos_s = _simplificar_contenedor(obstaculos.intersection(perimetro.envelope), epsilon)
+            self.bloqueo_obstaculos = _sumas_minkowski([_vertices(p) for p in _piezas_convexas(obstaculos_s)], piezas_reflejadas)
+        self.factible = self.dentro_perimetro.difference(self.bloqueo_obstaculos).buffer(-TOLERANCIA_NUMERICA, join_style='mitre')
+
+    @property
+    def vacio(self):
+        return self.factible.is_empty or self.factible.area <= 0
+
+    def primer_centro(self):
+        """Centro factible con menor x (y, a igualdad, menor y): el mismo criterio que el recorrido de la rejilla."""
+        if self.vacio:
+            return None
+        coords = shapely.get_coordinates(self.factible)
+        k = np.lexsort((coords[:, 1], coords[:, 0]))[0]
+        return float(coords[k, 0]), float(coords[k, 1])
+
+    def centro_mas_separado(self, precision=PRECISION_SEPARACION):
+        """
+        Centro factible que maximiza la separación con los obstáculos (o con las paredes si no hay
+        obstáculos). Búsqueda binaria sobre la separación d: la región factible menos
+        bloqueo ⊕ disco(d) deja de estar vacía exactamente cuando d supera el óptimo.
+        Devuelve ((x, y), separación) o None.
+        """
+        if self.vacio:
+            return None
+        bloqueo = self.bloqueo_obstaculos if not self.bloqueo_obstaculos.is_empty else self.bloqueo_paredes
+        if bloqueo.is_empty:
+            p = self.factible.representative_point()
+            return (p.x, p.y), 0.0
+
+        minx, miny, maxx, maxy = self.factible.bounds
+        bajo, alto = 0.0, float(np.hypot(maxx - minx, maxy - miny))
+        region = self.factible
+        while alto - bajo > precision:
+            medio = (bajo + alto) / 2.0
+            candidata = self.factible.difference(bloqueo.buffer(medio))
+            if candidata.is_empty or candidata.area <= 0:
+                alto = medio
+            else:
+                bajo, region = medio, candidata
+        p = region.representative_point()
+        return (p.x, p.y), bajo
@@ -0,0 +1,286 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+import numpy as np
+
+from .cache_detecciones import identificador_modelo
+from .modelo import cargar_modelo
+
+# Modelo activo: se reemplaza entero (asignación atómica), nunca se modifica en sitio
+ModeloActivo = namedtuple('ModeloActivo', ['modelo', 'version', 'ruta', 'cargado_en'])
+
+ESTADO_LISTO = 'listo'
+ESTADO_CARGANDO = 'cargando'
+ESTADO_ERROR = 'error'
+# Cada cuánto mira cada worker si se ha pedido una recarga (ver RecargaCompartida), por defecto
+INTERVALO_VIGILANCIA_S = 1.0
+
+def calentar_modelo(modelo, imgsz=640):
+    """Inferencia de prueba sobre una imagen en negro para que la primera petición real no pague la inicialización."""
+    modelo.predict(source=[np.zeros((imgsz, imgsz, 3), dtype=np.uint8)], save=False, verbose=False)
+
+def _pid_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class RecargaCompartida:
+    """
+    Archivo JSON que comparten los workers de la API con INFERENCE_MODE=local para que una recarga
+    pedida a uno de ellos llegue a todos. Guarda la última solicitud (ruta, versión esperada e id)
+    y el estado de cada worker por pid; se lee y se escribe bajo flock.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+
+    @staticmethod
+    def _decodificar(contenido):
+        try:
+            return json.loads(contenido) if contenido.strip() else {}
+        except ValueError:
+            return {}
+
+    def firma(self):
+        """Identifica la versión del archivo sin abrirlo (None si no existe): cambia con cada escritura."""
+        try:
+            st = os.stat(self.ruta)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def leer(self):
+        try:
+            with open(self.ruta) as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                datos = self._decodificar(f.read())
+        except FileNotFoundError:
+            return {}
+        # Los workers que ya no existen no cuentan
+        datos['workers'] = {pid: w for pid, w in datos.get('workers', {}).items() if _pid_vivo(int(pid))}
+        return datos
+
+    def _modificar(self, cambio):
+        with os.fdopen(os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o600), 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            datos = self._decodificar(f.read())
+            cambio(datos)
+            f.seek(0)
+            f.truncate()
+            json.dump(datos, f)
+
+    def solicitar(self, model_path, version):
+        """Publica una solicitud de recarga y devuelve su id."""
+        solicitud = {'id': uuid.uuid4().hex, 'model_path': model_path, 'version': version, 'solicitada_en': time.time()}
+        self._modificar(lambda datos: datos.update(solicitud=solicitud))
+        return solicitud['id']
+
+    def informar(self, pid, estado):
+        def cambio(datos):
+            workers = {p: w for p, w in datos.get('workers', {}).items() if _pid_vivo(int(p))}
+            workers[str(pid)] = estado
+            datos['workers'] = workers
+        self._modificar(cambio)
+
+class GestorModelo:
+    """
+    Mantiene el modelo de detección activo y permite sustituirlo en caliente.
+    Cada petición toma la referencia del modelo activo al empezar y la usa hasta el final,
+    así que las peticiones en curso terminan con el modelo anterior aunque entretanto se active otro.
+    La versión ('<id de los pesos>-<backend>') forma parte de la clave de la caché de detecciones.
+    Con 'recarga_compartida' (una RecargaCompartida) las recargas se publican para el resto de
+    workers, y un hilo de este proceso aplica las que publiquen los demás.
+    """
+
+    def __init__(self, backend='pytorch', export_dir=None, imgsz=640, num_hilos=None, al_activar=None,
+                 model_path=None, recarga_compartida=None, intervalo_vigilancia_s=INTERVALO_VIGILANCIA_S):
+        self.backend = backend
+        self.export_dir = export_dir
+        self.imgsz = imgsz
+        self.num_hilos = num_hilos
+        # Se llama con el ModeloActivo nuevo tras cada cambio (p. ej. para reciclar el pool de trabajos)
+        self.al_activar = al_activar
+        self._activo = None
+        # Si se indica model_path, la primera llamada a actual() lo carga (carga perezosa):
+        # los procesos que nunca detectan (migraciones, reservas) no importan torch
+        self._ruta_diferida = model_path
+        self._carga_lock = threading.Lock()
+        self._recarga_lock = threading.Lock()
+        self._estado = {'estado': ESTADO_LISTO, 'error': None, 'ruta_pendiente': None}
+        self.recarga_compartida = recarga_compartida
+        self.intervalo_vigilancia_s = intervalo_vigilancia_s
+        self._solicitud_aplicada = None
+        # Firma del archivo compartido en la última lectura: si no cambia, no se vuelve a leer
+        self._firma_vista = None
+        # El hilo vigilante no sobrevive a un fork: se arranca de nuevo en cada proceso
+        self._pid_vigilante = None
+        self._vigilante_lock = threading.Lock()
+
+    def version_de(self, model_path):
+        return f"{identificador_modelo(model_path)}-{self.backend}"
+
+    def _preparar(self, model_path, calentar):
+        pesos_id = identificador_modelo(model_path)
+        modelo = cargar_modelo(
+            model_path, backend=self.backend, export_dir=self.export_dir, id_modelo=pesos_id,
+            imgsz=self.imgsz, num_hilos=self.num_hilos
+        )
+        if calentar:
+            calentar_modelo(modelo, self.imgsz)
+        return ModeloActivo(modelo, f"{pesos_id}-{self.backend}", model_path, time.time())
+
+    def _activar(self, activo):
+        self._activo = activo
+        if self.al_activar is not None:
+            self.al_activar(activo)
+
+    def cargar(self, model_path, calentar=False):
+        """Carga y activa el modelo de forma síncrona (arranque de la aplicación)."""
+        activo = self._preparar(model_path, calentar)
+        self._activar(activo)
+        return activo
+
+    def actual(self):
+        """Modelo activo (ModeloActivo) o None si no hay ninguno cargado."""
+        self._vigilar()
+        if self._activo is None and self._ruta_diferida:
+            self._carga_diferida()
+        return self._activo
+
+    def _carga_diferida(self):
+        with self._carga_lock:
+            model_path, self._ruta_diferida = self._ruta_diferida, None
+            if model_path is None or self._activo is not None:
+                return
+            try:
+                self.cargar(model_path)
+                print(f"INFO: Modelo YOLO cargado correctamente desde '{model_path}' (backend: {self.backend}).")
+            except Exception as e:
+                # No se reintenta en cada petición; una recarga en caliente puede recuperarlo
+                print(f"ERROR: No se pudo cargar el modelo YOLO: {e}")
+            self._informar()
+
+    def _vigilar(self):
+        """Arranca (una vez por proceso) el hilo que aplica las recargas pedidas a otros workers."""
+        if self.recarga_compartida is None or self._pid_vigilante == os.getpid():
+            return
+        with self._vigilante_lock:
+            if self._pid_vigilante == os.getpid():
+                return
+            self._pid_vigilante = os.getpid()
+            # Antes de la primera carga, para que la carga perezosa use ya los pesos pedidos
+            self._seguir_solicitud()
+        threading.Thread(target=self._bucle_vigilante, name='vigilante-modelo', daemon=True).start()
+
+    def _bucle_vigilante(self):
+        while True:
+            time.sleep(self.intervalo_vigilancia_s)
+            try:
+                self._seguir_solicitud()
+            except Exception as e:
+                print(f"ERROR: No se pudo consultar la recarga compartida del modelo: {e}")
+
+    def _seguir_solicitud(self):
+        # Lo normal es que nadie pida recargas: un stat por vuelta, sin bloqueo ni JSON
+        firma = self.recarga_compartida.firma()
+        if firma is None or firma == self._firma_vista:
+            return
+        self._firma_vista = firma
+        solicitud = self.recarga_compartida.leer().get('solicitud')
+        if not solicitud or solicitud['id'] == self._solicitud_aplicada:
+            return
+        with self._carga_lock:
+            if self._activo is None and self._ruta_diferida:
+                self._ruta_diferida = solicitud['model_path']
+                self._solicitud_aplicada = solicitud['id']
+                return
+        if self._activo is not None and self._activo.version == solicitud['version']:
+            self._solicitud_aplicada = solicitud['id']
+            return
+        try:
+            iniciada = self._iniciar_recarga(solicitud['model_path'])
+        except FileNotFoundError as e:
+            self._estado = {'estado': ESTADO_ERROR, 'error': str(e), 'ruta_pendiente': None}
+            self._informar(version_fallida=solicitud['version'])
+            iniciada = True
+        # Si había otra recarga en curso se vuelve a intentar en la siguiente vuelta
+        if iniciada:
+            self._solicitud_aplicada = solicitud['id']
+        else:
+            self._firma_vista = None
+
+    def _informar(self, version_fallida=None):
+        if self.recarga_compartida is None:
+            return
+        activo = self._activo
+        try:
+            self.recarga_compartida.informar(os.getpid(), {
+                'estado': self._estado['estado'],
+                'error': self._estado['error'],
+                'version': activo.version if activo else None,
+                'version_fallida': version_fallida
+            })
+        except OSError as e:
+            print(f"ERROR: No se pudo publicar el estado del modelo: {e}")
+
+    def recargar(self, model_path):
+        """
+        Carga 'model_path' en segundo plano, lo calienta y lo activa.
+        Devuelve la versión que quedará activa, o None si ya hay una recarga en curso.
+        """
+        self._vigilar()
+        version = self.version_de(model_path)
+        if not self._iniciar_recarga(model_path):
+            return None
+        if self.recarga_compartida is not None:
+            self._solicitud_aplicada = self.recarga_compartida.solicitar(model_path, version)
+        return version
+
+    def _iniciar_recarga(self, model_path):
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"No existe el archivo de pesos '{model_path}'.")
+        if not self._recarga_lock.acquire(blocking=False):
+            return False
+        self._estado = {'estado': ESTADO_CARGANDO, 'error': None, 'ruta_pendiente': model_path}
+        threading.Thread(target=self._recargar, args=(model_path,), name='recarga-modelo', daemon=True).start()
+        return True
+
+    def _recargar(self, model_path):
+        try:
+            activo = self._preparar(model_path, calentar=True)
+            self._activar(activo)
+            self._estado = {'estado': ESTADO_LISTO, 'error': None, 'ruta_pendiente': None}
+            print(f"INFO: Modelo '{model_path}' activado en caliente (versión {activo.version}).")
+            self._informar()
+        except Exception as e:
+            # El modelo anterior sigue activo
+            self._estado = {'estado': ESTADO_ERROR, 'error': str(e), 'ruta_pendiente': None}
+            print(f"ERROR: No se pudo recargar el modelo desde '{model_path}': {e}")
+            self._informar(version_fallida=self.version_de(model_path))
+        finally:
+            self._recarga_lock.release()
+
+    def estado(self):
+        """Estado de este proceso; con recarga compartida, también la última solicitud y el estado de cada worker."""
+        activo = self._activo
+        estado = {
+            **self._estado,
+            'version': activo.version if activo else None,
+            'ruta': activo.ruta if activo else None,
+            'cargado_en': activo.cargado_en if activo else None
+        }
+        if self.recarga_compartida is not None:
+            compartido = self.recarga_compartida.leer()
+            estado['solicitud'] = compartido.get('solicitud')
+            estado['workers'] = compartido['workers']
+        return estado
@@ -0,0 +1,39 @@
+import io
+
+import numpy as np
+
+from .almacen_subidas import SubidaDemasiadoGrande
+
+def decodificar_imagen(datos, max_pixeles=None):
+    """
+    Decodifica en memoria los bytes de una imagen subida (JPEG/PNG) a un arreglo NumPy BGR.
+    El mismo arreglo se reutiliza para el tamaño, la predicción YOLO y el perímetro.
+    Parámetros:
+    - datos: Bytes de la imagen tal como llegan en la petición.
+    - max_pixeles: (Opcional) Límite de ancho x alto; se comprueba leyendo solo la cabecera,
+      antes de reservar memoria para la imagen completa.
+    """
+    # Imports diferidos: OpenCV y Pillow solo se cargan en los procesos que detectan planos
+    import cv2
+    from PIL import Image
+
+    buffer = np.frombuffer(datos, dtype=np.uint8)
+    if buffer.size == 0:
+        raise ValueError("La imagen subida está vacía.")
+
+    if max_pixeles:
+        try:
+            ancho, alto = Image.open(io.BytesIO(datos)).size
+        except Image.DecompressionBombError:
+            raise SubidaDemasiadoGrande("La imagen supera el número máximo de píxeles permitido.")
+        except Exception:
+            raise ValueError("No se pudo decodificar la imagen subida.")
+        if ancho * alto > max_pixeles:
+            raise SubidaDemasiadoGrande(
+                f"La imagen tiene {ancho}x{alto} píxeles y supera el máximo permitido ({max_pixeles})."
+            )
+
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("No se pudo decodificar la imagen subida.")
+    return img
@@ -0,0 +1,82 @@
+import fcntl
+import os
+import shutil
+import tempfile
+
+# Backend 'pytorch' usa los pesos .pt directamente; el resto se exportan una vez y se reutilizan.
+BACKEND_PYTORCH = 'pytorch'
+BACKENDS_EXPORTABLES = ('onnx', 'openvino')
+
+def ruta_artefacto(model_path, backend, export_dir, id_modelo):
+    """
+    Ruta del modelo exportado para un backend. Incluye el identificador de los pesos,
+    así que al reemplazar best.pt se genera un artefacto nuevo en lugar de usar uno obsoleto.
+    """
+    nombre_base = os.path.splitext(os.path.basename(model_path))[0]
+    if backend == 'onnx':
+        return os.path.join(export_dir, f"{nombre_base}-{id_modelo}.onnx")
+    # Ultralytics reconoce OpenVINO por el sufijo '_openvino_model' del directorio
+    return os.path.join(export_dir, f"{nombre_base}-{id_modelo}_openvino_model")
+
+def exportar_modelo(model_path, backend, export_dir, id_modelo, imgsz=640):
+    """
+    Exporta los pesos PyTorch al formato del backend si todavía no existe el artefacto en caché.
+    Devuelve la ruta del artefacto.
+    Varios procesos pueden arrancar a la vez (workers de gunicorn, pool de trabajos, servidor de
+    inferencia): la exportación se hace bajo un bloqueo de archivo, sobre una copia de los pesos en
+    un directorio temporal propio, y el artefacto se mueve a su sitio con os.replace, así que nadie
+    ve nunca uno a medio escribir. Quien obtiene el bloqueo después reutiliza el ya exportado.
+    """
+    destino = ruta_artefacto(model_path, backend, export_dir, id_modelo)
+    if os.path.exists(destino):
+        return destino
+
+    os.makedirs(export_dir, exist_ok=True)
+    with open(f"{destino}.lock", 'w') as candado:
+        fcntl.flock(candado, fcntl.LOCK_EX)
+        if os.path.exists(destino):
+            return destino
+
+        from ultralytics import YOLO
+
+        print(f"INFO: Exportando '{model_path}' a {backend} (solo la primera vez)...")
+        # Ultralytics escribe el resultado junto a los pesos: se exporta una copia para no pisar a nadie
+        temporal = tempfile.mkdtemp(prefix='.exportando-', dir=export_dir)
+        try:
+            copia = os.path.join(temporal, os.path.basename(model_path))
+            shutil.copyfile(model_path, copia)
+            exportado = YOLO(copia).export(format=backend, imgsz=imgsz, dynamic=True, half=False)
+            os.replace(str(exportado), destino)
+        finally:
+            shutil.rmtree(temporal, ignore_errors=True)
+    return destino
+
+def cargar_modelo(model_path, backend=BACKEND_PYTORCH, export_dir=None, id_modelo='', imgsz=640, num_hilos=None):
+    """
+    Carga el modelo de detección con el backend de inferencia configurado.
+    Todos los backends se sirven a través de ultralytics.YOLO, así que model.predict devuelve
+    los mismos objetos Results que consume procesar_detecciones.
+    Parámetros:
+    - model_path: Ruta a los pesos PyTorch (best.pt).
+    - backend: 'pytorch', 'onnx' u 'openvino'.
+    - export_dir: Carpeta donde se guardan los artefactos exportados.
+    - id_modelo: Identificador de los pesos (ver cache_detecciones.identificador_modelo).
+    - imgsz: Tamaño de entrada usado al exportar.
+    - num_hilos: (Opcional) Hilos intra-op de torch, para no competir con el pool de la aplicación.
+    """
+    # Import diferido: los procesos que delegan la inferencia no necesitan cargar torch
+    from ultralytics import YOLO
+
+    if num_hilos:
+        import torch
+        torch.set_num_threads(int(num_hilos))
+
+    backend = (backend or BACKEND_PYTORCH).lower()
+    if backend == BACKEND_PYTORCH:
+        return YOLO(model_path)
+    if backend not in BACKENDS_EXPORTABLES:
+        raise ValueError(f"Backend de inferencia desconocido: '{backend}'.")
+
+    export_dir = export_dir or os.path.dirname(model_path) or '.'
+    artefacto = exportar_modelo(model_path, backend, export_dir, id_modelo, imgsz=imgsz)
+    return YOLO(artefacto, task='detect')
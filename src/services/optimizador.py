@@ -2,14 +2,31 @@
 from shapely.geometry import box, Polygon, MultiPolygon, Point
 from shapely.ops import unary_union
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
 from copy import deepcopy
 from shapely.affinity import translate, rotate
 import numpy as np
 import json
+import time
+import shapely
+from .colocacion import (
+    EspacioLibre, Refinamiento, ANGULOS_COLOCACION, plantilla_girada, rejilla_candidatos, primera_posicion_valida, mover_plantilla,
+    mejor_separacion, fraccion_dentro, puntuar_separacion, refinar, TOLERANCIA_AREA, TOLERANCIA_COTA_DISTANCIA
+)
+from .espacio_configuracion import EspacioConfiguracion
+from .rejilla_ocupacion import RejillaOcupacion, RESOLUCION_CM
+from .busqueda_local import BusquedaLocal, mejorar_distribucion
+from .cache_plantillas import CachePlantillas
 from .. import db
 from ..models import Reserva, Layout
 
+# Motores de colocación: 'rejilla' prueba centros con un paso fijo; 'cspace' calcula la región
+# de centros factibles (espacio de configuraciones) y elige dentro de ella sin rejilla;
+# 'raster' discretiza la sala en una rejilla de ocupación y usa erosión y transformada de distancia
+MOTOR_REJILLA = 'rejilla'
+MOTOR_CSPACE = 'cspace'
+MOTOR_RASTER = 'raster'
+MOTORES_COLOCACION = (MOTOR_REJILLA, MOTOR_CSPACE, MOTOR_RASTER)
+
 RESERVATION_DURATION_MINUTES = 120
 CLUSTER_PASS_BUFFER_M = 0.0
 # --- CLAVES DEL LAYOUT ---
@@ -26,6 +43,37 @@ TIPO_MESA_CUADRADA = 'mesas_cuadradas'
 TIPO_MESA_REDONDA = 'mesas_redondas'
 SILLA_BUFFER_M = 0.0
 MIN_ESPACIO_LIBRE_M = 0.2
+# Estado de cada mesa en optimizar_layout_con_presupuesto
+ESTADO_COLOCADA = 'colocada'
+ESTADO_SIN_ESPACIO = 'sin_espacio'
+ESTADO_SIN_TIEMPO = 'sin_tiempo'
+# Con refinamiento, todos los ángulos se puntúan en la rejilla pero solo se refinan los mejores
+ANGULOS_REFINADOS = 2
+# Plantillas de clúster recientes (por número de mesas, medidas redondeadas a DECIMALES_PLANTILLA
+# metros, orientación y medidas de las sillas): las reservas se repiten con pocas combinaciones
+cache_plantillas_cluster = CachePlantillas(max_entradas=256)
+DECIMALES_PLANTILLA = 3
+
+def refinamiento_desde_config(config):
+    """Refinamiento de grueso a fino del motor 'rejilla' según la configuración de la app (None si está desactivado)."""
+    if not config.get('PLACEMENT_REFINE'):
+        return None
+    return Refinamiento(
+        precision=config['PLACEMENT_REFINE_PRECISION_M'],
+        top_k=config['PLACEMENT_REFINE_TOP_K'],
+        presupuesto=config['PLACEMENT_REFINE_BUDGET'],
+    )
+
+def busqueda_local_desde_config(config):
+    """Parámetros de la búsqueda local tras la pasada voraz (None si LOCAL_SEARCH_ITERATIONS es 0)."""
+    if not config.get('LOCAL_SEARCH_ITERATIONS'):
+        return None
+    return BusquedaLocal(iteraciones=config['LOCAL_SEARCH_ITERATIONS'], semilla=config['LOCAL_SEARCH_SEED'])
+
+def _caja_girada(coords, angulo):
+    """Caja de 'coords' girada 'angulo' grados sobre su centro (como se guarda Mesa.angle)."""
+    caja = box(*coords)
+    return rotate(caja, angulo, origin='center') if angulo else caja
 
 def _get_object_footprint(mesa_obj, buffer=0.0):
     """
@@ -40,7 +88,7 @@ def _get_object_footprint(mesa_obj, buffer=0.0):
     # 1. Añadir la geometría de la mesa
     mesa_coords = mesa_obj.get('coords_mesa_metros')
     if mesa_coords and len(mesa_coords) == 4:
-        geoms.append(box(*mesa_coords))
+        geoms.append(_caja_girada(mesa_coords, mesa_obj.get('angle') or 0.0))
     else:
         print(f"ADVERTENCIA en _get_object_footprint: La mesa {mesa_obj.get('id')} no tiene coordenadas válidas.")
         return None
@@ -49,7 +97,7 @@ def _get_object_footprint(mesa_obj, buffer=0.0):
     for silla in mesa_obj.get(SILLAS_KEY, []):
         silla_coords = silla.get('coords_metros')
         if silla_coords and len(silla_coords) == 4:
-            geoms.append(box(*silla_coords))
+            geoms.append(_caja_girada(silla_coords, silla.get('angle') or 0.0))
         else:
             print(f"ADVERTENCIA en _get_object_footprint: La silla {silla.get('id_silla')} de la mesa {mesa_obj.get('id')} no tiene coordenadas válidas.")
             
@@ -281,7 +329,21 @@ def _build_cluster_template(k, ancho_mesa_m, largo_mesa_m, orientacion, sillas_d
     - largo_mesa_m: largo de cada mesa en metros
     - orientacion: 'horizontal' o 'vertical'
     - sillas_data: lista de datos de sillas con sus dimensiones reales
+    Las medidas se redondean a DECIMALES_PLANTILLA (milímetros) y la plantilla sale de
+    cache_plantillas_cluster si ya se construyó con las mismas; la geometría devuelta se comparte
+    y no debe modificarse.
     """
+    redondear = lambda v: round(float(v), DECIMALES_PLANTILLA)
+    medidas_sillas = []
+    for silla in sillas_data:
+        silla_coords_m = silla.get('coords_metros', [0,0,0.5,0.5])
+        medidas_sillas.append((redondear(abs(silla_coords_m[2] - silla_coords_m[0])),
+                               redondear(abs(silla_coords_m[3] - silla_coords_m[1]))))
+    clave = (int(k), redondear(ancho_mesa_m), redondear(largo_mesa_m), orientacion, tuple(medidas_sillas))
+    return cache_plantillas_cluster.obtener(clave, lambda: _construir_plantilla_cluster(*clave))
+
+def _construir_plantilla_cluster(k, ancho_mesa_m, largo_mesa_m, orientacion, medidas_sillas):
+    """Geometría de _build_cluster_template; 'medidas_sillas' es la lista de (ancho, alto) de cada silla."""
 
     geoms = []
     paso_distancia = largo_mesa_m + CLUSTER_PASS_BUFFER_M
@@ -304,7 +366,7 @@ def _build_cluster_template(k, ancho_mesa_m, largo_mesa_m, orientacion, sillas_d
         geoms.append(box(cx - half_w, cy - half_l, cx + half_w, cy + half_l))
 
     # Distribuir sillas usando sus dimensiones reales
-    num_people = len(sillas_data)
+    num_people = len(medidas_sillas)
     sillas_por_mesa = num_people // k
     sillas_extra = num_people % k
     silla_idx_global = 0
@@ -314,13 +376,10 @@ def _build_cluster_template(k, ancho_mesa_m, largo_mesa_m, orientacion, sillas_d
         num_sillas_esta_mesa = sillas_por_mesa + (1 if i < sillas_extra else 0)
         
         for j in range(num_sillas_esta_mesa):
-            if silla_idx_global >= len(sillas_data): break
-            silla_actual = sillas_data[silla_idx_global]
-            silla_idx_global += 1
+            if silla_idx_global >= len(medidas_sillas): break
             # Usar las dimensiones REALES de la silla actual
-            silla_coords_m = silla_actual.get('coords_metros', [0,0,0.5,0.5])
-            silla_w_m = abs(silla_coords_m[2] - silla_coords_m[0])
-            silla_h_m = abs(silla_coords_m[3] - silla_coords_m[1])
+            silla_w_m, silla_h_m = medidas_sillas[silla_idx_global]
+            silla_idx_global += 1
             half_silla_w, half_silla_h = silla_w_m / 2.0, silla_h_m / 2.0
 
             half_w, half_l = ancho_mesa_m / 2.0, largo_mesa_m / 2.0
@@ -340,48 +399,110 @@ def _build_cluster_template(k, ancho_mesa_m, largo_mesa_m, orientacion, sillas_d
     cluster_geom = unary_union(geoms)
     return cluster_geom.buffer(0.15)
 
-def _find_best_placement(cluster_horizontal, cluster_vertical, perimetro_geom, obstaculos_geom):
+def _find_best_placement(cluster_horizontal, cluster_vertical, perimetro_geom, obstaculos_geom, motor=MOTOR_REJILLA,
+                         resolucion_cm=RESOLUCION_CM, refinamiento=None, pool=None):
     """
     Encuentra la mejor posición probando AMBAS orientaciones (horizontal y vertical).
     Devuelve la primera posición válida que encuentra para simplificar.
+    Con motor='cspace' la "primera" es el punto de menor x de la región factible, sin paso de rejilla.
+    Con 'refinamiento' (solo motor 'rejilla'), si ningún punto de la rejilla sirve se refina alrededor
+    de los que dejan más plantilla dentro del espacio libre, por si hay un hueco justo entre puntos.
+    Con 'pool' (PoolColocacion) las orientaciones y franjas de la rejilla se evalúan en sus procesos.
     """
-    espacio_libre_geom = perimetro_geom.difference(obstaculos_geom)
-    if espacio_libre_geom.is_empty:
+    if motor in (MOTOR_CSPACE, MOTOR_RASTER):
+        return _find_best_placement_exacto(
+            cluster_horizontal, cluster_vertical, perimetro_geom, obstaculos_geom, motor, resolucion_cm
+        )
+
+    espacio = EspacioLibre(perimetro_geom, obstaculos_geom)
+    if espacio.vacio:
         return None
 
-    minx, miny, maxx, maxy = espacio_libre_geom.bounds
-    
-    # Plantillas a probar: (plantilla, orientación)
-    plantillas_a_probar = [
-        (cluster_horizontal, 'horizontal'),
-        (cluster_vertical, 'vertical')
-    ]
+    if pool is None:
+        return _buscar_hueco(cluster_horizontal, cluster_vertical, espacio, refinamiento)
+    with pool.sesion(perimetro_geom, obstaculos_geom) as sesion:
+        return _buscar_hueco(cluster_horizontal, cluster_vertical, espacio, refinamiento, sesion)
 
-    for plantilla, orientacion in plantillas_a_probar:
+def _buscar_hueco(cluster_horizontal, cluster_vertical, espacio, refinamiento, sesion=None):
+    """Búsqueda de _find_best_placement con el motor 'rejilla', en serie o repartida en la sesión del pool."""
+    minx, miny, maxx, maxy = espacio.bounds
+    
+    # Plantillas a probar: (plantilla, orientación, centros de la rejilla en el orden del recorrido)
+    plantillas_a_probar = []
+    for plantilla, orientacion in [(cluster_horizontal, 'horizontal'), (cluster_vertical, 'vertical')]:
         if plantilla.is_empty:
             continue
             
         f_minx, f_miny, f_maxx, f_maxy = plantilla.bounds
         step = max(0.5, min(f_maxx - f_minx, f_maxy - f_miny) / 2.0)
-        
-        for x in np.arange(minx, maxx, step):
-            for y in np.arange(miny, maxy, step):
-                # Centramos la plantilla en el punto candidato
-                cluster_movido = translate(plantilla, x, y)
-                
-                # Usamos una comprobación de área para mayor tolerancia
-                interseccion = espacio_libre_geom.intersection(cluster_movido)
-                if (interseccion.area / plantilla.area) >= 0.999:
-                    print(f"Posición válida encontrada con orientación '{orientacion}' en ({x:.2f}, {y:.2f})")
-                    posicion_encontrada = {'centro': Point(x, y), 'orientacion': orientacion}
-                    
-                    # Visualizar el plan correcto
-                    # visualizar_geometrias(perimetro_geom, obstaculos_geom, espacio_libre_geom, cluster=plantilla, destino=posicion_encontrada)
-                    return posicion_encontrada
+        plantillas_a_probar.append((plantilla, orientacion, rejilla_candidatos(minx, miny, maxx, maxy, step)))
+
+    # Todos los candidatos de la rejilla se evalúan en bloque; en serie, la vertical solo si la horizontal no cabe
+    if sesion is not None:
+        indices = sesion.primera_posicion_valida([(p, c) for p, _, c in plantillas_a_probar])
+    else:
+        indices = (primera_posicion_valida(p, espacio, c) for p, _, c in plantillas_a_probar)
+
+    for (plantilla, orientacion, centros), indice in zip(plantillas_a_probar, indices):
+        if indice is not None:
+            x, y = centros[indice]
+            print(f"Posición válida encontrada con orientación '{orientacion}' en ({x:.2f}, {y:.2f})")
+            posicion_encontrada = {'centro': Point(x, y), 'orientacion': orientacion}
+
+            # Visualizar el plan correcto
+            # visualizar_geometrias(perimetro_geom, obstaculos_geom, espacio.geom, cluster=plantilla, destino=posicion_encontrada)
+            return posicion_encontrada
+
+    if refinamiento is not None:
+        for plantilla, orientacion, _ in plantillas_a_probar:
+            posicion_encontrada = _refinar_hueco(plantilla, orientacion, espacio, refinamiento, sesion)
+            if posicion_encontrada is not None:
+                return posicion_encontrada
 
     # No se encontró ninguna posición válida para el clúster.
     return None
 
+def _refinar_hueco(plantilla, orientacion, espacio, refinamiento, sesion=None):
+    """
+    Segunda pasada de _find_best_placement: parte de la misma rejilla, puntúa cada centro libre con la
+    fracción de la plantilla que queda dentro y refina alrededor de los mejores hasta que alguno es válido.
+    """
+    f_minx, f_miny, f_maxx, f_maxy = plantilla.bounds
+    step = max(0.5, min(f_maxx - f_minx, f_maxy - f_miny) / 2.0)
+    centros = rejilla_candidatos(*espacio.bounds, step)
+    centros = centros[shapely.contains_xy(espacio.geom, centros[:, 0], centros[:, 1])]
+    if len(centros) == 0:
+        return None
+
+    if sesion is not None:
+        evaluar = lambda c: sesion.fraccion_dentro(plantilla, c)
+    else:
+        evaluar = lambda c: fraccion_dentro(plantilla, espacio, c)
+    (x, y), fraccion = refinar(evaluar, centros, evaluar(centros), step, refinamiento, objetivo=TOLERANCIA_AREA)
+    if fraccion < TOLERANCIA_AREA:
+        return None
+    print(f"Posición válida encontrada (refinando) con orientación '{orientacion}' en ({x:.2f}, {y:.2f})")
+    return {'centro': Point(x, y), 'orientacion': orientacion}
+
+def _find_best_placement_exacto(cluster_horizontal, cluster_vertical, perimetro_geom, obstaculos_geom, motor, resolucion_cm):
+    """
+    Variante de _find_best_placement que toma el centro directamente de la región factible
+    (motor 'cspace') o de la rejilla de ocupación erosionada con la plantilla (motor 'raster').
+    """
+    rejilla = RejillaOcupacion(perimetro_geom, obstaculos_geom, resolucion_cm) if motor == MOTOR_RASTER else None
+    for plantilla, orientacion in [(cluster_horizontal, 'horizontal'), (cluster_vertical, 'vertical')]:
+        if plantilla.is_empty:
+            continue
+        if rejilla is not None:
+            centro = rejilla.primer_centro(plantilla)
+        else:
+            centro = EspacioConfiguracion(plantilla, perimetro_geom, obstaculos_geom).primer_centro()
+        if centro is not None:
+            x, y = centro
+            print(f"Posición válida encontrada con orientación '{orientacion}' en ({x:.2f}, {y:.2f})")
+            return {'centro': Point(x, y), 'orientacion': orientacion}
+    return None
+
 def _apply_reservation(layout_actual, mesas_ids, num_people, user_id, reservation_time, movimiento_info):
     """
     Aplica la reserva moviendo el clúster a su destino.
@@ -515,10 +636,26 @@ def _apply_reservation(layout_actual, mesas_ids, num_people, user_id, reservatio
     return layout_actual, f"Reserva confirmada. Clúster asignado.", mesas_ids
 
 
+def _mover_caja(coords, angulo_caja, angulo, origen, desplazamiento):
+    """
+    Gira 'angulo' grados alrededor de 'origen' y traslada una caja (coords en metros, girada
+    'angulo_caja' sobre su centro). Devuelve (coords, ángulo de la caja): si el giro total es recto la
+    caja sigue alineada con los ejes y se guarda su envolvente con ángulo 0; si no, la caja sin girar
+    centrada en su nueva posición y el giro total (módulo 180, una caja es simétrica).
+    """
+    movida = translate(rotate(_caja_girada(coords, angulo_caja), angulo, origin=origen), *desplazamiento)
+    angulo_total = (angulo_caja + angulo) % 180
+    if angulo_total % 90 == 0:
+        return list(movida.bounds), 0.0
+    centro = movida.centroid
+    medio_ancho, medio_alto = (coords[2] - coords[0]) / 2.0, (coords[3] - coords[1]) / 2.0
+    return [centro.x - medio_ancho, centro.y - medio_alto, centro.x + medio_ancho, centro.y + medio_alto], angulo_total
+
 def _apply_optimized_position(mesa_obj, movimiento_info, m_to_px):
     """
     Función LIGERA y PRECISA para aplicar una nueva posición a una mesa y sus sillas.
     Calcula las posiciones relativas para evitar errores de recálculo.
+    Con giros que no son rectos, la mesa y las sillas guardan su caja sin girar y el giro en 'angle'.
     """
     # 1. Extraer información del movimiento y la escala
     angulo = movimiento_info.get('angulo', 0)
@@ -531,14 +668,12 @@ def _apply_optimized_position(mesa_obj, movimiento_info, m_to_px):
     centro_orig_y = (mesa_coords_orig_m[1] + mesa_coords_orig_m[3]) / 2.0
 
     # 3. Mover la mesa
-    mesa_poly_orig = box(*mesa_coords_orig_m)
-    # Mover la mesa original a su nueva posición
-    mesa_poly_final = translate(rotate(mesa_poly_orig, angulo, origin=(centro_orig_x, centro_orig_y)),
-                                xoff=centro_destino_m.x - centro_orig_x,
-                                yoff=centro_destino_m.y - centro_orig_y)
-    
-    minx, miny, maxx, maxy = mesa_poly_final.bounds
-    coords_m_rounded = [round(c, 3) for c in [minx, miny, maxx, maxy]]
+    origen = (centro_orig_x, centro_orig_y)
+    desplazamiento = (centro_destino_m.x - centro_orig_x, centro_destino_m.y - centro_orig_y)
+    coords_mesa, angulo_mesa = _mover_caja(mesa_coords_orig_m, mesa_obj.get('angle') or 0.0, angulo, origen, desplazamiento)
+    coords_m_rounded = [round(c, 3) for c in coords_mesa]
+    if angulo_mesa or 'angle' in mesa_obj:
+        mesa_obj['angle'] = angulo_mesa
     mesa_obj.update({
         'coords_mesa_metros': coords_m_rounded,
         'coords_pixeles': [c * m_to_px for c in coords_m_rounded],
@@ -548,15 +683,14 @@ def _apply_optimized_position(mesa_obj, movimiento_info, m_to_px):
     # 4. Mover las sillas aplicando la misma transformación
     for silla_data in mesa_obj.get(SILLAS_KEY, []):
         silla_coords_orig_m = silla_data.get('coords_metros', [0,0,0.5,0.5])
-        silla_poly_orig = box(*silla_coords_orig_m)
         
         # Aplicar EXACTAMENTE la misma rotación y traslación que a la mesa
-        silla_poly_final = translate(rotate(silla_poly_orig, angulo, origin=(centro_orig_x, centro_orig_y)),
-                                     xoff=centro_destino_m.x - centro_orig_x,
-                                     yoff=centro_destino_m.y - centro_orig_y)
-        
-        s_minx, s_miny, s_maxx, s_maxy = silla_poly_final.bounds
-        silla_coords_m_rounded = [round(c, 3) for c in [s_minx, s_miny, s_maxx, s_maxy]]
+        coords_silla, angulo_silla = _mover_caja(
+            silla_coords_orig_m, silla_data.get('angle') or 0.0, angulo, origen, desplazamiento
+        )
+        silla_coords_m_rounded = [round(c, 3) for c in coords_silla]
+        if angulo_silla or 'angle' in silla_data:
+            silla_data['angle'] = angulo_silla
         silla_data.update({
             'coords_metros': silla_coords_m_rounded,
             'coords_pixeles': [c * m_to_px for c in silla_coords_m_rounded]
@@ -564,73 +698,156 @@ def _apply_optimized_position(mesa_obj, movimiento_info, m_to_px):
         
     return mesa_obj
 
-def _find_most_distant_placement(cluster_footprint, perimetro_geom, obstaculos_existentes):
+def _find_most_distant_placement(cluster_footprint, perimetro_geom, obstaculos_existentes, motor=MOTOR_REJILLA,
+                                 resolucion_cm=RESOLUCION_CM, espacio=None, refinamiento=None, sesion=None,
+                                 angulos=ANGULOS_COLOCACION):
     """
     Encuentra la posición para el cluster que MAXIMIZA la distancia a los obstáculos existentes.
     Versión con lógica de distancia corregida.
+    Con 'espacio' (EspacioLibre que se actualiza con cada mesa colocada) no se recalcula el espacio
+    libre y las distancias se consultan al índice de obstáculos en lugar de a su unión.
+    Con 'refinamiento' (solo motor 'rejilla') la rejilla es la fase gruesa: se refina alrededor de sus
+    refinamiento.top_k mejores centros con pasos cada vez menores (ver colocacion.refinar).
+    Con 'sesion' (SesionColocacion con una copia de 'espacio') los candidatos de todos los ángulos se
+    evalúan repartidos en el pool de procesos; el resultado es el mismo.
+    'angulos' son los giros (grados) que se prueban; a igualdad de distancia gana el primero. Sin pool,
+    cada ángulo solo valida los centros cuya cota supera la mejor distancia de los anteriores.
     """
-    espacio_libre_geom = perimetro_geom.difference(obstaculos_existentes)
-    if espacio_libre_geom.is_empty:
+    if motor == MOTOR_CSPACE:
+        return _find_most_distant_placement_cspace(cluster_footprint, perimetro_geom, obstaculos_existentes, angulos)
+    if motor == MOTOR_RASTER:
+        rejilla = RejillaOcupacion(perimetro_geom, obstaculos_existentes, resolucion_cm)
+        return _find_most_distant_placement_raster(cluster_footprint, rejilla, angulos)
+
+    if espacio is None:
+        espacio = EspacioLibre(perimetro_geom, obstaculos_existentes)
+    if espacio.vacio:
         return None
 
-    angles = [0, 90]
-    minx, miny, maxx, maxy = espacio_libre_geom.bounds
+    angles = angulos
+    minx, miny, maxx, maxy = espacio.bounds
     
     f_minx, f_miny, f_maxx, f_maxy = cluster_footprint.bounds
     step = max(1.0, min(f_maxx - f_minx, f_maxy - f_miny) / 2.0)    
 
-    mejor_posicion = None
-    max_distancia_minima = -1
+    # Candidatos de la rejilla con el centro en el espacio libre; la plantilla dentro se comprueba en bloque
+    centros = rejilla_candidatos(minx, miny, maxx, maxy, step)
+    centros = centros[shapely.contains_xy(espacio.geom, centros[:, 0], centros[:, 1])]
+    if len(centros) == 0:
+        return None
+    plantillas = [plantilla_girada(cluster_footprint, angle) for angle in angles]
 
-    area_cluster = cluster_footprint.area
-    TOLERANCIA_AREA = 0.999
+    # (centro, distancia) o None por ángulo; en la rejilla gana el primero de los máximos (el mismo
+    # desempate que el recorrido x / y)
+    if refinamiento is not None:
+        resultados = _refinar_separacion(plantillas, espacio, centros, step, refinamiento, sesion)
+    else:
+        if sesion is not None:
+            indices = sesion.mejor_separacion([(p, centros) for p in plantillas])
+        else:
+            indices, umbral = [], -np.inf
+            for p in plantillas:
+                indices.append(mejor_separacion(p, espacio, centros, umbral))
+                if indices[-1] is not None:
+                    umbral = indices[-1][1]
+        resultados = [None if r is None else (centros[r[0]], r[1]) for r in indices]
 
-    for angle in angles:
-        cluster_rotado = rotate(cluster_footprint, angle, origin='center')
-        
-        for x in np.arange(minx, maxx, step):
-            for y in np.arange(miny, maxy, step):
-                punto_candidato = Point(x, y)
-                
-                if not espacio_libre_geom.contains(punto_candidato):
-                    continue
-
-                cluster_movido = translate(cluster_rotado, x, y)
-                
-                interseccion = espacio_libre_geom.intersection(cluster_movido)
-                
-                if (interseccion.area / area_cluster) >= TOLERANCIA_AREA:
-                    distancia_actual = 0
-                    if not obstaculos_existentes.is_empty:
-                        # Si ya hay obstáculos, la distancia es a ellos.
-                        distancia_actual = obstaculos_existentes.distance(cluster_movido)
-                    else:
-                        # Si es el primer objeto, la distancia es a los bordes del perímetro.
-                        distancia_actual = perimetro_geom.exterior.distance(cluster_movido)
-                    
-                    if distancia_actual > max_distancia_minima:
-                        max_distancia_minima = distancia_actual
-                        mejor_posicion = {'centro': punto_candidato, 'angulo': angle}
+    mejor_posicion = None
+    max_distancia_minima = -1
+    for angle, resultado in zip(angles, resultados):
+        if resultado is None:
+            continue
+        centro, distancia = resultado
+        if distancia > max_distancia_minima:
+            max_distancia_minima = distancia
+            mejor_posicion = {'centro': Point(*centro), 'angulo': angle}
 
     if mejor_posicion:
         print(f"  -> Mejor posición encontrada con una distancia de {max_distancia_minima:.2f}m.")
     
     return mejor_posicion
 
+def _refinar_separacion(plantillas, espacio, centros, step, refinamiento, sesion=None):
+    """
+    Búsqueda de grueso a fino de la máxima separación a partir de los centros de la rejilla, para
+    cada plantilla (ángulo). Las posiciones se comparan por una cota de su separación (ver
+    colocacion.puntuar_separacion); solo la elegida se mide exactamente. Todos los ángulos se puntúan
+    en la rejilla, pero solo se refinan los ANGULOS_REFINADOS con mejor puntuación (a igualdad, los
+    primeros). Devuelve (centro, distancia) por ángulo, o None si no se refina o no se llega a
+    ninguna posición válida. Con 'sesion', cada nivel se puntúa repartido en el pool.
+    """
+    if sesion is not None:
+        evaluadores = [
+            lambda c, p=p: sesion.puntuar_separacion(p, c, refinamiento.top_k) for p in plantillas
+        ]
+    else:
+        evaluadores = [lambda c, p=p: puntuar_separacion(p, espacio, c, refinamiento.top_k) for p in plantillas]
+    puntuaciones = [evaluar(centros) for evaluar in evaluadores]
+    refinados = sorted(range(len(plantillas)), key=lambda a: -puntuaciones[a].max())[:ANGULOS_REFINADOS]
+
+    resultados = [None] * len(plantillas)
+    for a in refinados:
+        centro, cota = refinar(evaluadores[a], centros, puntuaciones[a], step, refinamiento)
+        # Puntuación negativa: ni la rejilla ni el refinamiento han dado con una posición válida
+        if cota < 0:
+            continue
+        movida = mover_plantilla(plantillas[a], centro[None, :])
+        if espacio.hay_obstaculos:
+            resultados[a] = centro, float(espacio.distancia_obstaculos(movida)[0])
+        else:
+            resultados[a] = centro, float(shapely.distance(espacio.perimetro.exterior, movida[0]))
+    return resultados
 
-def optimizar_layout_completo(layout_actual):
+def _find_most_distant_placement_cspace(cluster_footprint, perimetro_geom, obstaculos_existentes,
+                                        angulos=ANGULOS_COLOCACION):
     """
-    Reorganiza TODAS las mesas del layout para DISTRIBUIRLAS equitativamente.
-    Parametros:
-    - layout_actual: El layout actual con todas las mesas.
+    Variante de _find_most_distant_placement sin rejilla: para cada ángulo calcula la región factible
+    y busca en ella (búsqueda binaria) el centro con mayor separación.
     """
-    
-    # 1. PREPARAR DATOS
-    geometria_base = _get_geometric_layout(layout_actual, exclude_ids=[])
-    perimetro_geom = geometria_base['perimetro_geom']
-    m_to_px = layout_actual.get('m_to_px', 20.0)
-    
-    # 2. CREAR PLANTILLAS CENTRADAS (AURAS)
+    mejor_posicion = None
+    max_distancia_minima = -1
+
+    for angle in angulos:
+        cluster_rotado = plantilla_girada(cluster_footprint, angle)
+        resultado = EspacioConfiguracion(cluster_rotado, perimetro_geom, obstaculos_existentes).centro_mas_separado()
+        if resultado is None:
+            continue
+        (x, y), distancia = resultado
+        if distancia > max_distancia_minima:
+            max_distancia_minima = distancia
+            mejor_posicion = {'centro': Point(x, y), 'angulo': angle}
+
+    if mejor_posicion:
+        print(f"  -> Mejor posición encontrada con una distancia de {max_distancia_minima:.2f}m.")
+
+    return mejor_posicion
+
+def _find_most_distant_placement_raster(cluster_footprint, rejilla, angulos=ANGULOS_COLOCACION):
+    """
+    Variante de _find_most_distant_placement sobre una RejillaOcupacion: la separación de todos los
+    centros se obtiene de una vez erosionando la transformada de distancia con la plantilla.
+    """
+    mejor_posicion = None
+    max_distancia_minima = -1
+
+    for angle in angulos:
+        cluster_rotado = plantilla_girada(cluster_footprint, angle)
+        resultado = rejilla.centro_mas_separado(cluster_rotado)
+        if resultado is None:
+            continue
+        (x, y), distancia = resultado
+        if distancia > max_distancia_minima:
+            max_distancia_minima = distancia
+            mejor_posicion = {'centro': Point(x, y), 'angulo': angle}
+
+    if mejor_posicion:
+        print(f"  -> Mejor posición encontrada con una distancia de {max_distancia_minima:.2f}m.")
+
+    return mejor_posicion
+
+
+def _preparar_objetos(layout_actual):
+    """Plantillas centradas (auras) de las mesas del layout, de mayor a menor área."""
     objetos_a_colocar = []
     for mesa_id, mesa_data in layout_actual['objects'].items():
         if not mesa_data.get('tipo', '').startswith('mesa'): continue
@@ -641,28 +858,90 @@ def optimizar_layout_completo(layout_actual):
             objetos_a_colocar.append({
                 'id': mesa_id, 'footprint': footprint_centrado, 'area': footprint_original.area
             })
-
-    # 3. ORDENAR Y COLOCAR
     objetos_a_colocar.sort(key=lambda x: x['area'], reverse=True)
+    return objetos_a_colocar
+
+def _colocar_objetos(objetos_a_colocar, perimetro_geom, motor, resolucion_cm, refinamiento, limite=None, pool=None,
+                     angulos=ANGULOS_COLOCACION):
+    """
+    Pasada voraz: coloca cada objeto (en orden) en la posición más separada de los ya colocados.
+    Con 'limite' (instante de time.perf_counter()) deja de colocar en cuanto se alcanza.
+    Con 'pool' (solo motor 'rejilla') la búsqueda de cada objeto se reparte en sus procesos.
+    Cada objeto se prueba con los giros de 'angulos'.
+    Devuelve (posiciones, huellas colocadas por id, estado por id: 'colocada', 'sin_espacio' o 'sin_tiempo').
+    """
     obstaculos_colocados = MultiPolygon()
-    posiciones_finales = {}
-    
+    # Con el motor raster la rejilla se crea una vez y se actualiza tras cada colocación; con la
+    # rejilla de puntos, el espacio libre y el índice de obstáculos (sin unir las mesas colocadas)
+    rejilla = RejillaOcupacion(perimetro_geom, resolucion_cm=resolucion_cm) if motor == MOTOR_RASTER else None
+    espacio = EspacioLibre(perimetro_geom, obstaculos_colocados) if motor == MOTOR_REJILLA else None
+    if espacio is None or pool is None:
+        return _colocar_en_orden(objetos_a_colocar, perimetro_geom, motor, refinamiento, limite, angulos, rejilla, espacio)
+    # Los procesos del pool replican el espacio libre y reciben cada mesa colocada
+    with pool.sesion(perimetro_geom, obstaculos_colocados) as sesion:
+        return _colocar_en_orden(
+            objetos_a_colocar, perimetro_geom, motor, refinamiento, limite, angulos, rejilla, espacio, sesion
+        )
+
+def _colocar_en_orden(objetos_a_colocar, perimetro_geom, motor, refinamiento, limite, angulos, rejilla, espacio,
+                      sesion=None):
+    """Bucle de _colocar_objetos sobre la rejilla raster o el espacio libre ya creados."""
+    obstaculos_colocados = MultiPolygon()
+    posiciones_finales, huellas, estados = {}, {}, {}
     for i, obj in enumerate(objetos_a_colocar):
+        if limite is not None and time.perf_counter() >= limite:
+            print(f"  -> ADVERTENCIA: Tiempo agotado; quedan {len(objetos_a_colocar) - i} mesas sin colocar.")
+            estados.update((o['id'], ESTADO_SIN_TIEMPO) for o in objetos_a_colocar[i:])
+            break
         print(f"({i+1}/{len(objetos_a_colocar)}) Buscando posición para la mesa {obj['id']}...")
         
         # Usar la nueva función de búsqueda que maximiza la distancia
-        posicion_encontrada = _find_most_distant_placement(obj['footprint'], perimetro_geom, obstaculos_colocados)
+        if rejilla is not None:
+            posicion_encontrada = _find_most_distant_placement_raster(obj['footprint'], rejilla, angulos)
+        else:
+            posicion_encontrada = _find_most_distant_placement(
+                obj['footprint'], perimetro_geom, obstaculos_colocados, motor=motor, espacio=espacio,
+                refinamiento=refinamiento, sesion=sesion, angulos=angulos
+            )
 
         if posicion_encontrada:
             posiciones_finales[obj['id']] = posicion_encontrada
             centro = posicion_encontrada['centro']
             angulo = posicion_encontrada['angulo']
-            footprint_movido = translate(rotate(obj['footprint'], angulo, origin='center'), xoff=centro.x, yoff=centro.y)
-            obstaculos_colocados = unary_union([obstaculos_colocados, footprint_movido])
+            footprint_movido = translate(plantilla_girada(obj['footprint'], angulo), xoff=centro.x, yoff=centro.y)
+            huellas[obj['id']] = footprint_movido
+            estados[obj['id']] = ESTADO_COLOCADA
+            if rejilla is not None:
+                rejilla.agregar(footprint_movido)
+            elif espacio is not None:
+                espacio.agregar(footprint_movido)
+                if sesion is not None:
+                    sesion.agregar(footprint_movido)
+            else:
+                obstaculos_colocados = unary_union([obstaculos_colocados, footprint_movido])
         else:
+            estados[obj['id']] = ESTADO_SIN_ESPACIO
             print(f"  -> ADVERTENCIA: No se encontró espacio para la mesa {obj['id']}.")
+    return posiciones_finales, huellas, estados
 
-    # 4. RECONSTRUIR EL LAYOUT FINAL (Lógica sin cambios)
+def calidad_distribucion(huellas, total_mesas):
+    """
+    Calidad de una distribución: mesas colocadas y menor separación (m) entre las huellas colocadas
+    (None con menos de dos). Las distribuciones se comparan primero por mesas colocadas y luego por separación.
+    La separación se mide con las huellas simplificadas (error de unos 2 cm, mucho más barato).
+    """
+    separacion = None
+    if len(huellas) > 1:
+        geoms = shapely.simplify(np.array(list(huellas.values()), dtype=object), TOLERANCIA_COTA_DISTANCIA)
+        _, distancias = shapely.STRtree(geoms).query_nearest(geoms, return_distance=True, exclusive=True, all_matches=False)
+        separacion = round(float(distancias.min()), 4)
+    return {'mesas_colocadas': len(huellas), 'mesas_totales': total_mesas, 'separacion_minima_m': separacion}
+
+def _clave_calidad(calidad):
+    separacion = calidad['separacion_minima_m']
+    return calidad['mesas_colocadas'], (separacion if separacion is not None else float('inf'))
+
+def _reconstruir_layout(layout_actual, posiciones_finales, m_to_px):
     layout_final = deepcopy(layout_actual)
     layout_final['objects'] = {}
 
@@ -670,10 +949,132 @@ def optimizar_layout_completo(layout_actual):
         mesa_obj_original = deepcopy(layout_actual['objects'][mesa_id])
         mesa_obj_movido = _apply_optimized_position(mesa_obj_original, movimiento_info, m_to_px)
         layout_final['objects'][mesa_id] = mesa_obj_movido
+    return layout_final
+
+def optimizar_layout_completo(layout_actual, motor=MOTOR_REJILLA, resolucion_cm=RESOLUCION_CM, refinamiento=None,
+                              busqueda_local=None, pool=None, angulos=ANGULOS_COLOCACION):
+    """
+    Reorganiza TODAS las mesas del layout para DISTRIBUIRLAS equitativamente.
+    Parametros:
+    - layout_actual: El layout actual con todas las mesas.
+    - motor: 'rejilla', 'cspace' o 'raster' (ver MOTORES_COLOCACION).
+    - resolucion_cm: tamaño de celda del motor 'raster'.
+    - refinamiento: Refinamiento de grueso a fino del motor 'rejilla' (None = solo la rejilla).
+    - busqueda_local: BusquedaLocal para mejorar la pasada voraz (None = solo la pasada voraz).
+    - pool: PoolColocacion en el que repartir la búsqueda del motor 'rejilla' (None = en este proceso).
+    - angulos: giros (grados) que se prueban para cada mesa.
+    """
+    
+    # 1. PREPARAR DATOS
+    geometria_base = _get_geometric_layout(layout_actual, exclude_ids=[])
+    perimetro_geom = geometria_base['perimetro_geom']
+    m_to_px = layout_actual.get('m_to_px', 20.0)
+    
+    # 2. CREAR PLANTILLAS CENTRADAS (AURAS), ORDENADAS POR ÁREA
+    objetos_a_colocar = _preparar_objetos(layout_actual)
+
+    # 3. COLOCAR
+    posiciones_finales, _, _ = _colocar_objetos(
+        objetos_a_colocar, perimetro_geom, motor, resolucion_cm, refinamiento, pool=pool, angulos=angulos
+    )
+    if busqueda_local is not None:
+        posiciones_finales, _ = mejorar_distribucion(
+            perimetro_geom, objetos_a_colocar, posiciones_finales, busqueda_local, angulos=angulos
+        )
+
+    # 4. RECONSTRUIR EL LAYOUT FINAL (Lógica sin cambios)
+    layout_final = _reconstruir_layout(layout_actual, posiciones_finales, m_to_px)
 
     print("--- Optimización de Distribución Finalizada ---")
     return layout_final
 
+def _niveles_busqueda(motor, resolucion_cm, refinamiento):
+    """
+    Pasadas (motor, resolucion_cm, refinamiento) del modo con presupuesto de tiempo, de la más barata
+    a la más cuidadosa. Siempre se empieza con el motor raster a 4x la resolución (celdas grandes: una
+    distribución completa en poco tiempo, aunque con menos holgura) y después:
+    - 'rejilla': solo la rejilla, refinamiento reducido (4x menos preciso, mitad de semillas y cuarta
+      parte del presupuesto) y el refinamiento configurado;
+    - 'raster': 2x la resolución y la resolución configurada;
+    - 'cspace': una pasada (no tiene parámetro de precisión).
+    """
+    niveles = [(MOTOR_RASTER, resolucion_cm * 4, None)]
+    if motor == MOTOR_REJILLA:
+        niveles.append((MOTOR_REJILLA, resolucion_cm, None))
+        if refinamiento is not None:
+            reducido = Refinamiento(
+                precision=refinamiento.precision * 4, top_k=max(1, refinamiento.top_k // 2),
+                presupuesto=max(1, refinamiento.presupuesto // 4)
+            )
+            niveles += [(MOTOR_REJILLA, resolucion_cm, reducido), (MOTOR_REJILLA, resolucion_cm, refinamiento)]
+    elif motor == MOTOR_RASTER:
+        niveles += [(MOTOR_RASTER, resolucion_cm * 2, None), (MOTOR_RASTER, resolucion_cm, None)]
+    else:
+        niveles.append((motor, resolucion_cm, None))
+    return niveles
+
+def optimizar_layout_con_presupuesto(layout_actual, tiempo_ms, motor=MOTOR_REJILLA, resolucion_cm=RESOLUCION_CM,
+                                     refinamiento=None, busqueda_local=None, pool=None, angulos=ANGULOS_COLOCACION):
+    """
+    Variante de optimizar_layout_completo que responde en 'tiempo_ms' (modo "anytime"): repite la
+    colocación con pasadas cada vez más cuidadosas (ver _niveles_busqueda) mientras quede tiempo y
+    devuelve la mejor distribución encontrada, completa o parcial. No empieza una pasada si la
+    anterior tardó más de lo que queda; una pasada cortada por el límite solo se usa si ninguna terminó.
+    Con 'busqueda_local', el tiempo que sobre se dedica a mejorar la mejor distribución (hasta sus
+    iteraciones o hasta el límite). 'pool' y 'angulos', como en optimizar_layout_completo.
+    El layout devuelto incluye 'optimizacion' con el estado de cada mesa ('colocada', 'sin_espacio'
+    o 'sin_tiempo'), la calidad (ver calidad_distribucion), las pasadas terminadas y el tiempo empleado.
+    """
+    inicio = time.perf_counter()
+    limite = inicio + tiempo_ms / 1000.0
+
+    geometria_base = _get_geometric_layout(layout_actual, exclude_ids=[])
+    perimetro_geom = geometria_base['perimetro_geom']
+    m_to_px = layout_actual.get('m_to_px', 20.0)
+    objetos_a_colocar = _preparar_objetos(layout_actual)
+
+    # (completa, clave de calidad, posiciones, estados, calidad) de la mejor pasada
+    mejor = None
+    pasadas = 0
+    duracion = 0.0
+    for motor_nivel, resolucion_nivel, refinamiento_nivel in _niveles_busqueda(motor, resolucion_cm, refinamiento):
+        t0 = time.perf_counter()
+        if mejor is not None and limite - t0 < duracion:
+            break
+        posiciones, huellas, estados = _colocar_objetos(
+            objetos_a_colocar, perimetro_geom, motor_nivel, resolucion_nivel, refinamiento_nivel, limite=limite,
+            pool=pool, angulos=angulos
+        )
+        duracion = time.perf_counter() - t0
+        calidad = calidad_distribucion(huellas, len(objetos_a_colocar))
+        completa = ESTADO_SIN_TIEMPO not in estados.values()
+        # Una pasada terminada siempre gana a una cortada; entre iguales decide la calidad
+        candidata = (completa, _clave_calidad(calidad), posiciones, estados, calidad)
+        if mejor is None or candidata[:2] > mejor[:2]:
+            mejor = candidata
+        if not completa:
+            break
+        pasadas += 1
+
+    _, _, posiciones, estados, calidad = mejor
+    if busqueda_local is not None and time.perf_counter() < limite:
+        posiciones, huellas = mejorar_distribucion(
+            perimetro_geom, objetos_a_colocar, posiciones, busqueda_local, limite=limite, angulos=angulos
+        )
+        # La búsqueda local puede colocar mesas que la pasada voraz dejó fuera
+        estados = {mesa_id: ESTADO_COLOCADA if mesa_id in posiciones else estado for mesa_id, estado in estados.items()}
+        calidad = calidad_distribucion(huellas, len(objetos_a_colocar))
+    layout_final = _reconstruir_layout(layout_actual, posiciones, m_to_px)
+    layout_final['optimizacion'] = {
+        'completa': ESTADO_SIN_TIEMPO not in estados.values(),
+        'estado_mesas': estados,
+        'calidad': calidad,
+        'pasadas': pasadas,
+        'tiempo_ms': round((time.perf_counter() - inicio) * 1000.0, 2),
+    }
+    print(f"--- Optimización con presupuesto finalizada ({pasadas} pasadas, calidad {calidad}) ---")
+    return layout_final
+
 def visualizar_geometrias(perimetro, obstaculos, espacio_libre, cluster=None, destino=None):
     """
     Crea una visualización de las geometrías usando Matplotlib.
@@ -683,6 +1084,9 @@ def visualizar_geometrias(perimetro, obstaculos, espacio_libre, cluster=None, de
     - cluster: (Opcional) El footprint del clúster que se intenta colocar.
     - destino: (Opcional) El punto y ángulo donde se colocó el clúster.
     """
+    # Import diferido: matplotlib solo hace falta para esta visualización de depuración
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(10, 10))
     
     # Función auxiliar para dibujar cualquier geometría (Polygon o MultiPolygon)
@@ -794,8 +1198,8 @@ def generar_layout_simulado_para_hora(target_time, layout_id=None):
             mesa.id_str: {
                 "id": mesa.id_str, "tipo": mesa.tipo, "estado": 'libre', # El estado base siempre es 'libre'
                 "capacidad_actual": mesa.capacidad_actual, "coords_mesa_metros": mesa.coords_mesa_metros,
-                "coords_mesa_pixeles": mesa.coords_mesa_pixeles,
-                "sillas_asignadas": [{"id_silla": s.id_str, "coords_pixeles": s.coords_pixeles, "coords_metros": s.coords_metros, "tipo": s.tipo} for s in mesa.sillas]
+                "coords_mesa_pixeles": mesa.coords_mesa_pixeles, "angle": mesa.angle,
+                "sillas_asignadas": [{"id_silla": s.id_str, "coords_pixeles": s.coords_pixeles, "coords_metros": s.coords_metros, "tipo": s.tipo, "angle": s.angle} for s in mesa.sillas]
             } for mesa in layout_db.mesas
         },
         "perimeter": {"points": json.loads(layout_db.perimeter_json)}, "m_to_px": layout_db.m_to_px
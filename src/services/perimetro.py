@@ -1,33 +1,151 @@
-import cv2
+import threading
+from collections import OrderedDict
 
-def detectar_perimetro(path_imagen):
+import numpy as np
+
+# OpenCV se importa dentro de las funciones: así importar este módulo (y la app entera)
+# no carga cv2 en los procesos que solo atienden reservas o ejecutan migraciones.
+
+# Caché LRU de perímetros por (hash de imagen, parámetros)
+MAX_PERIMETROS_EN_CACHE = 64
+_cache_perimetros = OrderedDict()
+_lock_cache = threading.Lock()
+
+def _leer_imagen(imagen):
+    if isinstance(imagen, str):
+        import cv2
+        img = cv2.imread(imagen)
+        if img is None:
+            raise FileNotFoundError(f"Imagen no encontrada: {imagen}")
+        return img
+    return imagen
+
+def _simplificar(contour, epsilon_factor):
+    """Simplifica el contorno y lo convierte a lista de tuplas."""
+    import cv2
+
+    epsilon = epsilon_factor * cv2.arcLength(contour, True)
+    polygon = cv2.approxPolyDP(contour, epsilon, True)
+    return [(int(p[0][0]), int(p[0][1])) for p in polygon]
+
+def _contorno_completo(img, umbral):
+    """Contorno más grande calculado sobre la imagen a resolución completa."""
+    import cv2
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(gray, umbral, 255, cv2.THRESH_BINARY_INV)
+
+    # Buscar contornos externos
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    # Tomar el contorno más grande (probablemente el recinto)
+    return max(contours, key=cv2.contourArea)
+
+def _contorno_multiresolucion(img, umbral, lado_max):
+    """
+    Busca el contorno en un nivel reducido de la imagen y lo refina a resolución completa
+    solo cerca del borde: cada punto del contorno reducido se desplaza a lo largo de su
+    normal hasta el primer píxel oscuro, leyendo únicamente esos píxeles de la imagen original.
+    """
+    import cv2
+
+    h, w = img.shape[:2]
+    factor = int(np.ceil(max(h, w) / float(lado_max)))
+    if factor <= 1:
+        return _contorno_completo(img, umbral)
+
+    # 1. Nivel reducido (factor entero: INTER_AREA conserva las paredes finas como gris medio)
+    reducida = cv2.resize(img, (max(1, w // factor), max(1, h // factor)), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(reducida, cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(gray, umbral, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    if not contours:
+        return None
+    contorno = max(contours, key=cv2.contourArea).reshape(-1, 2).astype(np.float64)
+    if len(contorno) < 3:
+        return _contorno_completo(img, umbral)
+
+    # 2. Puntos en coordenadas completas y normales hacia fuera del recinto
+    puntos = contorno * factor + (factor - 1) / 2.0
+    tangentes = np.roll(puntos, -1, axis=0) - np.roll(puntos, 1, axis=0)
+    normales = np.column_stack((tangentes[:, 1], -tangentes[:, 0]))
+    normales /= np.maximum(np.linalg.norm(normales, axis=1, keepdims=True), 1e-9)
+    x, y = puntos[:, 0], puntos[:, 1]
+    area_orientada = 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+    if area_orientada < 0:
+        normales = -normales
+
+    # 3. Muestrear a resolución completa de fuera hacia dentro y quedarse con el primer píxel oscuro
+    margen = 2 * factor
+    pasos = np.arange(margen, -margen - 1, -1, dtype=np.float64)
+    muestras = puntos[:, None, :] + normales[:, None, :] * pasos[None, :, None]
+    xs = np.clip(np.rint(muestras[..., 0]), 0, w - 1).astype(np.intp)
+    ys = np.clip(np.rint(muestras[..., 1]), 0, h - 1).astype(np.intp)
+    gris = img[ys, xs].astype(np.float32) @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+    oscuro = gris <= umbral
+
+    primero = np.argmax(oscuro, axis=1)
+    refinados = np.where(
+        oscuro.any(axis=1)[:, None],
+        muestras[np.arange(len(puntos)), primero],
+        puntos
+    )
+    return np.rint(refinados).astype(np.int32).reshape(-1, 1, 2)
+
+def _clave_perimetro(clave_imagen, umbral, epsilon_factor, multiresolucion, lado_max):
+    return (clave_imagen, int(umbral), float(epsilon_factor), bool(multiresolucion), int(lado_max))
+
+def _consultar_cache(clave):
+    with _lock_cache:
+        puntos = _cache_perimetros.get(clave)
+        if puntos is not None:
+            _cache_perimetros.move_to_end(clave)
+        return puntos
+
+def perimetro_en_cache(clave_imagen, umbral=200, epsilon_factor=0.01, multiresolucion=False, lado_max=1024):
+    """
+    Perímetro ya calculado por detectar_perimetro para esa imagen (por su hash) y esos parámetros,
+    o None si no está en caché. Permite saber si hace falta decodificar la imagen para obtenerlo.
+    """
+    return _consultar_cache(_clave_perimetro(clave_imagen, umbral, epsilon_factor, multiresolucion, lado_max))
+
+def detectar_perimetro(imagen, umbral=200, epsilon_factor=0.01, multiresolucion=False, lado_max=1024, clave_imagen=None):
     """
     Detecta el contorno externo (perímetro del restaurante) en una imagen.
     Devuelve una lista de puntos [(x1, y1), (x2, y2), ...].
     Parámetros:
-    - path_imagen: Ruta a la imagen del plano del restaurante.
+    - imagen: Arreglo NumPy BGR ya decodificado, o ruta a la imagen del plano.
+    - umbral: Nivel de gris por debajo del cual un píxel se considera pared.
+    - epsilon_factor: Fracción del perímetro usada como tolerancia al simplificar el contorno.
+    - multiresolucion: Si es True, detecta en un nivel reducido y refina solo cerca del borde.
+    - lado_max: Lado mayor (en píxeles) del nivel reducido en modo multiresolución.
+    - clave_imagen: (Opcional) Hash de la imagen; si se indica, el resultado se guarda en caché.
     """
-    img = cv2.imread(path_imagen)
-    if img is None:
-        raise FileNotFoundError(f"Imagen no encontrada: {path_imagen}")
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    _, thresh = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY_INV)
+    clave = None
+    if clave_imagen is not None:
+        clave = _clave_perimetro(clave_imagen, umbral, epsilon_factor, multiresolucion, lado_max)
+        puntos = _consultar_cache(clave)
+        if puntos is not None:
+            return puntos
 
-    # Buscar contornos externos
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not contours:
+    img = _leer_imagen(imagen)
+    if multiresolucion:
+        contour = _contorno_multiresolucion(img, umbral, lado_max)
+    else:
+        contour = _contorno_completo(img, umbral)
+
+    if contour is None:
         # Fallback: usar el rectángulo completo de la imagen como perímetro
         h, w = img.shape[:2]
-        return [(0, 0), (w, 0), (w, h), (0, h)]
-
-    # Tomar el contorno más grande (probablemente el recinto)
-    contour = max(contours, key=cv2.contourArea)
-
-    # Simplificar el contorno
-    epsilon = 0.01 * cv2.arcLength(contour, True)
-    polygon = cv2.approxPolyDP(contour, epsilon, True)
+        puntos = [(0, 0), (w, 0), (w, h), (0, h)]
+    else:
+        puntos = _simplificar(contour, epsilon_factor)
 
-    # Convertir a lista de tuplas
-    puntos = [(int(p[0][0]), int(p[0][1])) for p in polygon]
+    if clave is not None:
+        with _lock_cache:
+            _cache_perimetros[clave] = puntos
+            while len(_cache_perimetros) > MAX_PERIMETROS_EN_CACHE:
+                _cache_perimetros.popitem(last=False)
 
     return puntos
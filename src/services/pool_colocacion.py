@@ -0,0 +1,224 @@
+"""
+Pool de procesos para repartir la búsqueda de posiciones del motor 'rejilla'.
+
+La pasada voraz coloca las mesas de una en una, así que lo que se reparte es la búsqueda de cada
+mesa: los candidatos de cada orientación se parten en franjas contiguas del recorrido x / y (franjas
+verticales de la sala) y cada proceso evalúa las suyas. Cada proceso mantiene su propia copia del
+EspacioLibre de la sesión: recibe el perímetro y los obstáculos una vez, en WKB, y después solo las
+mesas que se van colocando. Las mejores parciales se reducen con el mismo desempate que el recorrido
+en serie (mayor distancia y, a igualdad, el índice menor), así que el resultado es el mismo que sin
+pool y no depende del número de procesos.
+"""
+import itertools
+import multiprocessing
+import threading
+
+import numpy as np
+import shapely
+
+from .colocacion import (
+    EspacioLibre, mejor_separacion, puntuar_separacion, fraccion_dentro, primera_posicion_valida
+)
+
+# Por debajo de este número de candidatos por franja el envío cuesta más que la evaluación
+MIN_CANDIDATOS_FRANJA = 128
+# Franjas por proceso y orientación: con más de una, un proceso que acaba antes no deja al resto solo
+FRANJAS_POR_PROCESO = 2
+
+def _evaluar(espacio, operacion, plantilla_wkb, centros):
+    plantilla = shapely.from_wkb(plantilla_wkb)
+    if operacion == 'separacion':
+        return mejor_separacion(plantilla, espacio, centros)
+    if operacion == 'cotas':
+        return puntuar_separacion(plantilla, espacio, centros, 0)
+    if operacion == 'fraccion':
+        return fraccion_dentro(plantilla, espacio, centros)
+    if operacion == 'primera':
+        return primera_posicion_valida(plantilla, espacio, centros)
+    raise ValueError(f"Operación desconocida '{operacion}'.")
+
+def _bucle_proceso(conexion):
+    """
+    Proceso del pool. Los mensajes de sesión ('abrir', 'agregar', 'fin') no tienen respuesta; si
+    fallan, el error se devuelve en la siguiente evaluación de esa sesión.
+    """
+    espacios, errores = {}, {}
+    while True:
+        try:
+            orden, sesion, *datos = conexion.recv()
+        except EOFError:
+            return
+        try:
+            if orden == 'abrir':
+                perimetro, obstaculos = shapely.from_wkb(datos)
+                espacios[sesion] = EspacioLibre(perimetro, obstaculos)
+            elif orden == 'agregar':
+                if sesion in espacios:
+                    espacios[sesion].agregar(shapely.from_wkb(datos[0]))
+            elif orden == 'fin':
+                espacios.pop(sesion, None)
+                errores.pop(sesion, None)
+            elif orden == 'evaluar':
+                if sesion in errores:
+                    raise RuntimeError(errores[sesion])
+                conexion.send(('ok', [_evaluar(espacios[sesion], *tarea) for tarea in datos[0]]))
+        except Exception as e:
+            if orden == 'evaluar':
+                conexion.send(('error', f"{type(e).__name__}: {e}"))
+            else:
+                errores[sesion] = f"{type(e).__name__}: {e}"
+
+class PoolColocacion:
+    """
+    Procesos (contexto 'spawn', como los trabajos de detección) conectados cada uno por su tubería,
+    para que todos reciban las mismas sesiones y cada evaluación vaya al proceso elegido.
+    Se arrancan en el primer uso. Las evaluaciones de peticiones concurrentes se turnan.
+    """
+
+    def __init__(self, num_procesos):
+        self.num_procesos = max(int(num_procesos), 1)
+        self._procesos = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def _arrancar(self):
+        if self._procesos is None:
+            contexto = multiprocessing.get_context('spawn')
+            procesos = []
+            for _ in range(self.num_procesos):
+                local, remota = contexto.Pipe()
+                proceso = contexto.Process(target=_bucle_proceso, args=(remota,), daemon=True)
+                proceso.start()
+                remota.close()
+                procesos.append((proceso, local))
+            self._procesos = procesos
+            print(f"INFO: Pool de colocación con {self.num_procesos} procesos.")
+        return self._procesos
+
+    def _reiniciar(self):
+        """Descarta los procesos tras un fallo de comunicación; el siguiente uso arranca otros."""
+        for proceso, conexion in self._procesos or []:
+            conexion.close()
+            proceso.terminate()
+        self._procesos = None
+
+    def _difundir(self, mensaje):
+        with self._lock:
+            try:
+                for _, conexion in self._arrancar():
+                    conexion.send(mensaje)
+            except (OSError, EOFError) as e:
+                self._reiniciar()
+                raise RuntimeError(f"El pool de colocación ha dejado de responder: {e}") from e
+
+    def _repartir(self, sesion, tareas):
+        """Reparte las tareas (la j-ésima al proceso j % n) y devuelve sus resultados en el mismo orden."""
+        resultados = [None] * len(tareas)
+        with self._lock:
+            try:
+                procesos = self._arrancar()
+                n = len(procesos)
+                enviados = []
+                for p, (_, conexion) in enumerate(procesos):
+                    if tareas[p::n]:
+                        conexion.send(('evaluar', sesion, tareas[p::n]))
+                        enviados.append((p, conexion))
+                # Se recogen todas las respuestas antes de informar de un error, para no dejar ninguna en la tubería
+                errores = []
+                for p, conexion in enviados:
+                    estado, valor = conexion.recv()
+                    if estado == 'ok':
+                        resultados[p::n] = valor
+                    else:
+                        errores.append(valor)
+            except (OSError, EOFError) as e:
+                self._reiniciar()
+                raise RuntimeError(f"El pool de colocación ha dejado de responder: {e}") from e
+        if errores:
+            raise RuntimeError(f"Falló la evaluación en el pool de colocación: {errores[0]}")
+        return resultados
+
+    def sesion(self, perimetro, obstaculos):
+        return SesionColocacion(self, perimetro, obstaculos)
+
+    def cerrar(self):
+        with self._lock:
+            self._reiniciar()
+
+class SesionColocacion:
+    """
+    EspacioLibre replicado en los procesos del pool. Hay que llamar a agregar con cada obstáculo que se
+    añada al EspacioLibre local, en el mismo orden. Se usa con 'with' para liberarlo al terminar.
+    Cada búsqueda recibe una lista de (plantilla, centros), una por orientación, y se reparte entera.
+    """
+
+    def __init__(self, pool, perimetro, obstaculos):
+        self.pool = pool
+        self.id = next(pool._ids)
+        pool._difundir(('abrir', self.id, shapely.to_wkb(perimetro), shapely.to_wkb(obstaculos)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def agregar(self, obstaculo):
+        self.pool._difundir(('agregar', self.id, shapely.to_wkb(obstaculo)))
+
+    def cerrar(self):
+        try:
+            self.pool._difundir(('fin', self.id))
+        except RuntimeError:
+            pass
+
+    def _franjas(self, num_centros):
+        num_franjas = min(self.pool.num_procesos * FRANJAS_POR_PROCESO, max(num_centros // MIN_CANDIDATOS_FRANJA, 1))
+        limites = np.linspace(0, num_centros, num_franjas + 1).astype(int)
+        return list(zip(limites[:-1], limites[1:]))
+
+    def _evaluar(self, operacion, busquedas):
+        """Resultados por orientación: lista de (inicio de la franja, resultado de la franja)."""
+        tareas, origen = [], []
+        for o, (plantilla, centros) in enumerate(busquedas):
+            plantilla_wkb = shapely.to_wkb(plantilla)
+            for inicio, fin in self._franjas(len(centros)):
+                tareas.append((operacion, plantilla_wkb, centros[inicio:fin]))
+                origen.append((o, inicio))
+        por_orientacion = [[] for _ in busquedas]
+        for (o, inicio), resultado in zip(origen, self.pool._repartir(self.id, tareas)):
+            por_orientacion[o].append((inicio, resultado))
+        return por_orientacion
+
+    def mejor_separacion(self, busquedas):
+        """colocacion.mejor_separacion de cada (plantilla, centros): (índice, distancia) o None."""
+        mejores = []
+        for franjas in self._evaluar('separacion', busquedas):
+            # Las franjas van en orden: con '>' estricto, a igualdad gana el índice menor
+            mejor = None
+            for inicio, resultado in franjas:
+                if resultado is not None and (mejor is None or resultado[1] > mejor[1]):
+                    mejor = (inicio + resultado[0], resultado[1])
+            mejores.append(mejor)
+        return mejores
+
+    def primera_posicion_valida(self, busquedas):
+        """colocacion.primera_posicion_valida de cada (plantilla, centros)."""
+        return [
+            min((inicio + r for inicio, r in franjas if r is not None), default=None)
+            for franjas in self._evaluar('primera', busquedas)
+        ]
+
+    def fraccion_dentro(self, plantilla, centros):
+        franjas = self._evaluar('fraccion', [(plantilla, centros)])[0]
+        return np.concatenate([r for _, r in franjas]) if franjas else np.zeros(0)
+
+    def puntuar_separacion(self, plantilla, centros, cuantas):
+        """colocacion.puntuar_separacion repartida: primero las cotas y, si hacen falta, las fracciones."""
+        franjas = self._evaluar('cotas', [(plantilla, centros)])[0]
+        puntuaciones = np.concatenate([r for _, r in franjas]) if franjas else np.zeros(0)
+        # Las posiciones válidas puntúan >= 0 y el resto -inf (cuantas=0 en los procesos)
+        no_validas = puntuaciones < 0
+        if len(centros) - np.count_nonzero(no_validas) < cuantas and no_validas.any():
+            puntuaciones[no_validas] = self.fraccion_dentro(plantilla, centros[no_validas]) - 1.0
+        return puntuaciones
@@ -1,80 +1,137 @@
-import math
-import cv2
+import os
+from functools import lru_cache
 import numpy as np
-import uuid
 
-def procesar_detecciones(results, local_ancho_m, local_alto_m, filtros_m,):
+# Espacio que ocupa una silla a lo largo del borde de una mesa (para estimar su capacidad)
+ANCHO_SILLA_M = 0.6
+
+def extraer_detecciones(results):
+    """
+    Copia las detecciones crudas de un resultado YOLO a arreglos NumPy independientes del modelo.
+    Devuelve un diccionario con 'xyxy' (n, 4), 'conf' (n,), 'cls' (n,), 'orig_shape' y 'names'.
+    Este formato es el que se guarda en la caché y el que acepta procesar_detecciones.
+    Parámetros:
+    - results: Resultado de la detección del modelo YOLO para una imagen (si ya es un
+      diccionario, p. ej. devuelto por el servidor de inferencia, se devuelve tal cual).
+    """
+    if isinstance(results, dict):
+        return results
+    boxes = results.boxes
+    return {
+        'xyxy': np.asarray(boxes.xyxy.cpu().numpy(), dtype=np.float32).reshape(-1, 4),
+        'conf': np.asarray(boxes.conf.cpu().numpy(), dtype=np.float32).reshape(-1),
+        'cls': np.asarray(boxes.cls.cpu().numpy()).reshape(-1).astype(np.int32),
+        'orig_shape': tuple(int(v) for v in results.orig_shape[:2]),
+        'names': dict(getattr(results, "names", {}) or {}),
+    }
+
+@lru_cache(maxsize=64)
+def _ids_por_tipo(nombres_clases):
     """
-    Versión restaurada y simplificada. Procesa las detecciones del modelo YOLO,
-    convierte coordenadas a metros y filtra los objetos según su tamaño.
+    IDs de clase de mesas y sillas para un conjunto de nombres de clase.
+    Se memoriza porque el modelo siempre tiene las mismas clases.
+    """
+    ids_mesas = [i for i, name in nombres_clases if 'mesa' in str(name).lower()]
+    ids_sillas = [i for i, name in nombres_clases if 'silla' in str(name).lower()]
+    return np.asarray(ids_mesas, dtype=np.int64), np.asarray(ids_sillas, dtype=np.int64)
+
+def _generar_ids(prefijo, n):
+    """Genera n IDs cortos aleatorios (6 hex) con una sola llamada a os.urandom."""
+    if n == 0:
+        return []
+    hexa = os.urandom(3 * n).hex()
+    return [f"{prefijo}-{hexa[6 * i:6 * i + 6]}" for i in range(n)]
+
+def procesar_detecciones_arrays(results, local_ancho_m, local_alto_m, filtros_m):
+    """
+    Versión vectorizada del post-proceso: aplica el umbral de confianza, la conversión px→m
+    y los filtros de tamaño como máscaras sobre los arreglos completos de detecciones.
+    Devuelve {'mesas': {...}, 'sillas': {...}, 'names': {...}} donde cada grupo contiene
+    los arreglos 'xyxy_px', 'xyxy_m', 'ancho_m', 'alto_m' y 'cls', o None si no hay escala válida.
     Parámetros:
-    - results: Resultados de la detección del modelo YOLO.
+    - results: Resultados de la detección del modelo YOLO, o el diccionario de extraer_detecciones.
     - local_ancho_m: Ancho del plano en metros.
     - local_alto_m: Alto del plano en metros.
     - filtros_m: Diccionario con filtros de tamaño para mesas y sillas.
     """
-    lista_mesas = []
-    lista_sillas = []
-    classNames = getattr(results, "names", {}) or {}
+    detecciones = extraer_detecciones(results)
+    classNames = detecciones.get('names') or {}
 
     # 1. Calcular el factor de escala (píxeles por metro)
     try:
-        ancho_plano_pixeles = int(results.orig_shape[1])
+        ancho_plano_pixeles = int(detecciones['orig_shape'][1])
         factor_escala = float(ancho_plano_pixeles) / float(local_ancho_m)
-    except (AttributeError, TypeError, ValueError):
-        return [], []
+    except (KeyError, IndexError, TypeError, ValueError, ZeroDivisionError):
+        return None
 
     # 2. Identificar qué IDs de clase corresponden a mesas y sillas
-    ID_MESAS = [i for i, name in classNames.items() if 'mesa' in str(name).lower()]
-    ID_SILLAS = [i for i, name in classNames.items() if 'silla' in str(name).lower()]
-
-    # 3. Procesar cada objeto detectado
-    for box in results.boxes:
-        confianza = float(box.conf[0])
-        if confianza < 0.25:
-            continue
-
-        class_id = int(box.cls[0])
-        es_mesa = class_id in ID_MESAS
-        es_silla = class_id in ID_SILLAS
-
-        if not es_mesa and not es_silla:
-            continue
-
-        # 4. Conversión de coordenadas y cálculo de dimensiones
-        coords_px = [float(x) for x in box.xyxy[0].tolist()]
-        x1_p, y1_p, x2_p, y2_p = coords_px
-        
-        coords_m = [coord / factor_escala for coord in coords_px]
-        ancho_metros = (x2_p - x1_p) / factor_escala
-        alto_metros = (y2_p - y1_p) / factor_escala
-        lado_max_metros = max(ancho_metros, alto_metros)
-
-        # 5. Aplicar filtros de tamaño
-        filtro_tipo = "MESA" if es_mesa else "SILLA"
+    ids_mesas, ids_sillas = _ids_por_tipo(tuple(sorted(classNames.items())))
+
+    xyxy_px = np.asarray(detecciones['xyxy'], dtype=np.float64).reshape(-1, 4)
+    conf = np.asarray(detecciones['conf'], dtype=np.float64).reshape(-1)
+    cls = np.asarray(detecciones['cls']).reshape(-1).astype(np.int64)
+
+    # 3. Conversión de coordenadas y dimensiones de todas las cajas a la vez
+    xyxy_m = xyxy_px / factor_escala
+    ancho_m = (xyxy_px[:, 2] - xyxy_px[:, 0]) / factor_escala
+    alto_m = (xyxy_px[:, 3] - xyxy_px[:, 1]) / factor_escala
+    lado_max_m = np.maximum(ancho_m, alto_m)
+    confiable = conf >= 0.25
+
+    salida = {'names': classNames}
+    for grupo, ids, filtro_tipo in (('mesas', ids_mesas, 'MESA'), ('sillas', ids_sillas, 'SILLA')):
+        # 4. Aplicar confianza, clase y filtros de tamaño como una sola máscara
         filtro = filtros_m.get(filtro_tipo, {"min_lado": 0, "max_lado": 999})
+        mascara = confiable & np.isin(cls, ids)
+        mascara &= (lado_max_m >= filtro["min_lado"]) & (lado_max_m <= filtro["max_lado"])
+        salida[grupo] = {
+            'xyxy_px': xyxy_px[mascara],
+            'xyxy_m': xyxy_m[mascara],
+            'ancho_m': ancho_m[mascara],
+            'alto_m': alto_m[mascara],
+            'cls': cls[mascara],
+        }
+    return salida
+
+def _arrays_a_items(grupo, classNames, clave_id, prefijo):
+    """Construye los diccionarios de la API a partir de los arreglos de un grupo."""
+    n = len(grupo['cls'])
+    ids = _generar_ids(prefijo, n)
+    coords_px = grupo['xyxy_px'].tolist()
+    coords_m = grupo['xyxy_m'].tolist()
+    anchos = grupo['ancho_m'].tolist()
+    altos = grupo['alto_m'].tolist()
+    clases = grupo['cls'].tolist()
+    return [
+        {
+            'coords_pixeles': coords_px[i],
+            'coords_metros': coords_m[i],
+            'ancho_m': anchos[i],
+            'alto_m': altos[i],
+            'clase_id': clases[i],
+            'nombre_clase': classNames.get(clases[i], "desconocido"),
+            clave_id: ids[i],
+        }
+        for i in range(n)
+    ]
 
-        if filtro["min_lado"] <= lado_max_metros <= filtro["max_lado"]:
-            item = {
-                'coords_pixeles': coords_px,
-                'coords_metros': coords_m,
-                'ancho_m': ancho_metros,
-                'alto_m': alto_metros,
-                'clase_id': class_id,
-                'nombre_clase': classNames.get(class_id, "desconocido"),
-            }
-
-            if es_mesa:
-                # Generar un ID único y corto para la mesa
-                item['id_mesa'] = f"M-{uuid.uuid4().hex[:6]}"
-                lista_mesas.append(item)
-                # mesa_counter += 1 # Eliminado
-            elif es_silla:
-                # Generar un ID único y corto para la silla
-                item['id_silla'] = f"S-{uuid.uuid4().hex[:6]}"
-                lista_sillas.append(item)
-                # silla_counter += 1 # Eliminado
+def procesar_detecciones(results, local_ancho_m, local_alto_m, filtros_m,):
+    """
+    Procesa las detecciones del modelo YOLO, convierte coordenadas a metros y filtra
+    los objetos según su tamaño. El trabajo se hace con arreglos en
+    procesar_detecciones_arrays; aquí solo se construyen los diccionarios de la API.
+    Parámetros:
+    - results: Resultados de la detección del modelo YOLO, o el diccionario de extraer_detecciones.
+    - local_ancho_m: Ancho del plano en metros.
+    - local_alto_m: Alto del plano en metros.
+    - filtros_m: Diccionario con filtros de tamaño para mesas y sillas.
+    """
+    arrays = procesar_detecciones_arrays(results, local_ancho_m, local_alto_m, filtros_m)
+    if arrays is None:
+        return [], []
 
+    lista_mesas = _arrays_a_items(arrays['mesas'], arrays['names'], 'id_mesa', 'M')
+    lista_sillas = _arrays_a_items(arrays['sillas'], arrays['names'], 'id_silla', 'S')
     return lista_mesas, lista_sillas
 
 def calcular_centro(coords):
@@ -82,13 +139,69 @@ def calcular_centro(coords):
     x1, y1, x2, y2 = coords
     return ((x1 + x2) / 2, (y1 + y2) / 2)
 
-def agrupar_mesas_sillas(lista_mesas, lista_sillas):
+def _centros(coords):
+    """Centros (n, 2) de una lista de cajas [x1, y1, x2, y2]."""
+    cajas = np.asarray(coords, dtype=np.float64).reshape(-1, 4)
+    return np.column_stack(((cajas[:, 0] + cajas[:, 2]) / 2, (cajas[:, 1] + cajas[:, 3]) / 2))
+
+def estimar_capacidad_mesa(coords_metros):
+    """Número de sillas que caben alrededor de una mesa según su perímetro (mínimo 1)."""
+    x1, y1, x2, y2 = coords_metros
+    perimetro_m = 2 * (abs(x2 - x1) + abs(y2 - y1))
+    return max(1, int(round(perimetro_m / ANCHO_SILLA_M)))
+
+def _asignar_cercana(centros_mesas, centros_sillas, max_dist_m):
+    """Mesa más cercana de cada silla con un KD-tree; -1 si supera max_dist_m."""
+    # Import diferido de scipy: solo se paga en el primer agrupamiento, no al arrancar
+    from scipy.spatial import cKDTree
+
+    arbol = cKDTree(centros_mesas)
+    limite = np.inf if max_dist_m is None else float(max_dist_m)
+    distancias, indices = arbol.query(centros_sillas, k=1, distance_upper_bound=limite)
+    return np.where(np.isfinite(distancias), indices, -1)
+
+def _asignar_optima(centros_mesas, centros_sillas, capacidades, max_dist_m):
     """
-    Versión restaurada. Asigna cada silla a la mesa más cercana.
+    Asignación global de coste mínimo respetando la capacidad de cada mesa
+    (cada mesa se replica tantas veces como sillas admite). Las sillas que no
+    entran en ninguna plaza vuelven a la mesa más cercana.
+    """
+    from scipy.optimize import linear_sum_assignment
+    from scipy.spatial.distance import cdist
+
+    plazas = np.repeat(np.arange(len(centros_mesas)), capacidades)
+    costes = cdist(centros_sillas, centros_mesas[plazas])
+    limite = np.inf if max_dist_m is None else float(max_dist_m)
+    # Las parejas fuera de rango quedan muy penalizadas y se descartan al final
+    penalizacion = (costes.max() + 1.0) * 1e3 if costes.size else 0.0
+    costes_validos = np.where(costes <= limite, costes, penalizacion)
+
+    filas, columnas = linear_sum_assignment(costes_validos)
+    asignacion = np.full(len(centros_sillas), -1, dtype=np.int64)
+    validas = costes[filas, columnas] <= limite
+    asignacion[filas[validas]] = plazas[columnas[validas]]
+
+    sin_plaza = asignacion < 0
+    if sin_plaza.any():
+        asignacion[sin_plaza] = _asignar_cercana(centros_mesas, centros_sillas[sin_plaza], max_dist_m)
+    return asignacion
+
+MODOS_AGRUPACION = ('cercana', 'optima')
+
+def agrupar_mesas_sillas(lista_mesas, lista_sillas, max_dist_m=None, modo='cercana', capacidades=None):
+    """
+    Asigna cada silla a una mesa.
+    - modo 'cercana': la mesa más cercana, buscada con un KD-tree.
+    - modo 'optima': asignación global que respeta la capacidad de cada mesa, para que una
+      mesa no se quede con las sillas que claramente pertenecen a su vecina.
     Esta versión guarda solo la información esencial para la visualización inicial.
     Parametros:
     - lista_mesas: Lista de diccionarios con información de mesas detectadas.
     - lista_sillas: Lista de diccionarios con información de sillas detectadas.
+    - max_dist_m: (Opcional) Distancia máxima silla-mesa en metros; las sillas más lejanas no se asignan.
+    - modo: 'cercana' (por defecto) u 'optima'.
+    - capacidades: (Opcional) Lista con la capacidad de cada mesa en modo 'optima';
+      por defecto se estima con estimar_capacidad_mesa.
     """
     layout_ordenado = {}
 
@@ -104,28 +217,32 @@ def agrupar_mesas_sillas(lista_mesas, lista_sillas):
             "estado": "libre"
         }
 
-    # 2. Asignar cada silla a la mesa más cercana
-    for silla in lista_sillas:
-        centro_silla_metros = calcular_centro(silla['coords_metros'])
-        distancia_minima = float('inf')
-        id_mesa_cercana = None
-
-        for id_mesa, datos_mesa in layout_ordenado.items():
-            centro_mesa_metros = calcular_centro(datos_mesa['coords_mesa_metros'])
-            dist = math.sqrt((centro_silla_metros[0] - centro_mesa_metros[0])**2 + (centro_silla_metros[1] - centro_mesa_metros[1])**2)
-            if dist < distancia_minima:
-                distancia_minima = dist
-                id_mesa_cercana = id_mesa
-
-        # 3. Añadir la silla a la mesa encontrada
-        if id_mesa_cercana is not None:
-            layout_ordenado[id_mesa_cercana]['sillas_asignadas'].append({
-                'id_silla': silla['id_silla'],
-                'coords_pixeles': silla['coords_pixeles'],
-                'coords_metros': silla['coords_metros'],
-                'tipo': silla['nombre_clase'].lower()
-            })
-            layout_ordenado[id_mesa_cercana]['capacidad_actual'] += 1
-
-    # 4. El paso de limpieza ya no es necesario.
-    return layout_ordenado
\ No newline at end of file
+    if not lista_mesas or not lista_sillas:
+        return layout_ordenado
+
+    # 2. Asignar las sillas a las mesas (centros calculados una sola vez)
+    centros_mesas = _centros([m['coords_metros'] for m in lista_mesas])
+    centros_sillas = _centros([s['coords_metros'] for s in lista_sillas])
+
+    if modo == 'optima':
+        if capacidades is None:
+            capacidades = [estimar_capacidad_mesa(m['coords_metros']) for m in lista_mesas]
+        asignacion = _asignar_optima(centros_mesas, centros_sillas, np.asarray(capacidades, dtype=np.int64), max_dist_m)
+    else:
+        asignacion = _asignar_cercana(centros_mesas, centros_sillas, max_dist_m)
+
+    # 3. Añadir cada silla a su mesa, en el orden original
+    ids_mesas = [m['id_mesa'] for m in lista_mesas]
+    for silla, idx_mesa in zip(lista_sillas, asignacion.tolist()):
+        if idx_mesa < 0:
+            continue
+        datos_mesa = layout_ordenado[ids_mesas[idx_mesa]]
+        datos_mesa['sillas_asignadas'].append({
+            'id_silla': silla['id_silla'],
+            'coords_pixeles': silla['coords_pixeles'],
+            'coords_metros': silla['coords_metros'],
+            'tipo': silla['nombre_clase'].lower()
+        })
+        datos_mesa['capacidad_actual'] += 1
+
+    return layout_ordenado
@@ -0,0 +1,210 @@
+"""
+Motor de colocación raster: la sala se discretiza en una rejilla de ocupación (celdas de
+'resolucion_cm') y las preguntas de colocación se responden con operaciones de imagen de OpenCV:
+- dónde cabe una plantilla: erosión de la máscara de celdas libres con la plantilla como kernel;
+- cuánta separación deja: transformada de distancia a los obstáculos, erosionada (mínimo) con el
+  contorno de la plantilla.
+Tras cada colocación solo se pinta el nuevo obstáculo y se actualiza la distancia en su entorno.
+
+Todas las geometrías se dilatan media diagonal de celda antes de pintarse (obstáculos, exterior del
+perímetro y plantilla), así que una celda libre está libre entera y una posición válida en la rejilla
+es válida para la geometría real; a cambio se pierde como mucho una celda de holgura.
+"""
+import math
+
+import numpy as np
+from shapely.geometry import box
+
+# OpenCV y scipy se importan dentro de las funciones (ver perimetro.py)
+
+RESOLUCION_CM = 5
+
+def _anillos(geom):
+    """Anillos (exterior e interiores) de los polígonos de 'geom' como arreglos de coordenadas."""
+    anillos = []
+    for poligono in getattr(geom, 'geoms', [geom]):
+        if poligono.is_empty or poligono.geom_type != 'Polygon':
+            continue
+        anillos.append(np.asarray(poligono.exterior.coords))
+        anillos.extend(np.asarray(interior.coords) for interior in poligono.interiors)
+    return anillos
+
+def _pintar(mascara, geom, a_pixeles):
+    """Rellena en 'mascara' las celdas cuyo centro cae en 'geom' (a_pixeles convierte metros a píxeles)."""
+    import cv2
+
+    anillos = [np.round(a_pixeles(a) * 16).astype(np.int32) for a in _anillos(geom)]
+    if anillos:
+        # shift=4: coordenadas con 4 bits de fracción (precisión de 1/16 de celda)
+        cv2.fillPoly(mascara, anillos, 1, lineType=cv2.LINE_8, shift=4)
+
+def _rectangulos(kernel):
+    """Descompone un kernel binario en rectángulos (fila, columna, alto, ancho) uniendo tramos iguales de filas consecutivas."""
+    rectangulos, abiertos = [], {}
+    for fila in range(kernel.shape[0] + 1):
+        tramos = set()
+        if fila < kernel.shape[0]:
+            bordes = np.flatnonzero(np.diff(np.r_[0, kernel[fila], 0]))
+            tramos = set(zip(bordes[::2], bordes[1::2]))
+        for tramo in list(abiertos):
+            if tramo not in tramos:
+                inicio = abiertos.pop(tramo)
+                rectangulos.append((inicio, int(tramo[0]), fila - inicio, int(tramo[1] - tramo[0])))
+        for tramo in tramos:
+            abiertos.setdefault(tramo, fila)
+    return rectangulos
+
+def _transformada_distancia(libres):
+    """
+    Distancia euclídea exacta (en celdas) de cada celda no nula a la celda nula más cercana.
+    Se usa scipy y no cv2.distanceTransform(DIST_MASK_PRECISE), que devuelve valores que varían en
+    la última cifra entre llamadas idénticas: basta para cambiar un desempate del argmax y que la
+    misma sala no dé siempre la misma distribución.
+    """
+    from scipy.ndimage import distance_transform_edt
+
+    return distance_transform_edt(libres).astype(np.float32)
+
+def _desplazar(mascara, df, dc):
+    """resultado[j, i] = mascara[j + df, i + dc], con False fuera de la rejilla."""
+    resultado = np.zeros_like(mascara)
+    alto, ancho = mascara.shape
+    origen = mascara[max(df, 0):alto + min(df, 0), max(dc, 0):ancho + min(dc, 0)]
+    resultado[max(-df, 0):max(-df, 0) + origen.shape[0], max(-dc, 0):max(-dc, 0) + origen.shape[1]] = origen
+    return resultado
+
+class RejillaOcupacion:
+    """
+    Rejilla de ocupación de una sala. Las celdas se indexan [fila, columna] con la fila creciendo
+    en y; el centro de la celda (j, i) está en (x0 + (i + 0.5)·r, y0 + (j + 0.5)·r).
+    """
+
+    def __init__(self, perimetro, obstaculos=None, resolucion_cm=RESOLUCION_CM):
+        self.resolucion = resolucion_cm / 100.0
+        self.media_diagonal = self.resolucion * math.sqrt(2) / 2.0
+        minx, miny, maxx, maxy = perimetro.bounds
+        self.x0, self.y0 = minx - self.resolucion, miny - self.resolucion
+        ancho = int(math.ceil((maxx - self.x0) / self.resolucion)) + 2
+        alto = int(math.ceil((maxy - self.y0) / self.resolucion)) + 2
+
+        # Exterior del perímetro (paredes) y obstáculos colocados, por separado: la separación se mide
+        # a los obstáculos y, mientras no haya ninguno, a las paredes
+        self.fuera = np.zeros((alto, ancho), dtype=np.uint8)
+        marco = box(self.x0 - self.resolucion, self.y0 - self.resolucion,
+                    self.x0 + (ancho + 1) * self.resolucion, self.y0 + (alto + 1) * self.resolucion)
+        _pintar(self.fuera, self._inflar(marco.difference(perimetro)), self._a_pixeles)
+        self.obstaculos = np.zeros_like(self.fuera)
+        self.hay_obstaculos = False
+        self._distancia = None
+        if obstaculos is not None and not obstaculos.is_empty:
+            self.agregar(obstaculos)
+
+    def _inflar(self, geom):
+        return geom.buffer(self.media_diagonal, join_style='mitre') if not geom.is_empty else geom
+
+    def _a_pixeles(self, coords):
+        return (coords - (self.x0, self.y0)) / self.resolucion - 0.5
+
+    def a_metros(self, fila, columna):
+        return self.x0 + (columna + 0.5) * self.resolucion, self.y0 + (fila + 0.5) * self.resolucion
+
+    @property
+    def libres(self):
+        return ((self.fuera | self.obstaculos) == 0).astype(np.uint8)
+
+    def agregar(self, geom):
+        """
+        Marca 'geom' como obstáculo. Solo se pintan sus celdas y la distancia se actualiza en la
+        ventana donde el nuevo obstáculo puede quedar más cerca que los anteriores.
+        """
+        nuevo = np.zeros_like(self.obstaculos)
+        _pintar(nuevo, self._inflar(geom), self._a_pixeles)
+        filas, columnas = np.nonzero(nuevo)
+        if filas.size == 0:
+            return
+        self.obstaculos |= nuevo
+        if not self.hay_obstaculos or self._distancia is None:
+            # Primer obstáculo: la separación deja de medirse a las paredes
+            self.hay_obstaculos = True
+            self._distancia = None
+            return
+
+        # Solo pueden acercarse las celdas a menos de la distancia máxima actual del nuevo obstáculo
+        radio = int(math.ceil(float(self._distancia.max()))) + 1
+        f0, f1 = max(filas.min() - radio, 0), min(filas.max() + radio + 1, nuevo.shape[0])
+        c0, c1 = max(columnas.min() - radio, 0), min(columnas.max() + radio + 1, nuevo.shape[1])
+        distancia_nuevo = _transformada_distancia(nuevo[f0:f1, c0:c1] == 0)
+        np.minimum(self._distancia[f0:f1, c0:c1], distancia_nuevo, out=self._distancia[f0:f1, c0:c1])
+
+    def distancia(self):
+        """Distancia (en celdas) de cada celda al obstáculo más cercano, o a las paredes si no hay obstáculos."""
+        if self._distancia is None:
+            origen = self.obstaculos if self.hay_obstaculos else self.fuera
+            self._distancia = _transformada_distancia(origen == 0)
+        return self._distancia
+
+    def _kernel(self, plantilla):
+        """Celdas que ocupa la plantilla (dilatada media diagonal) con su origen en el centro de una celda."""
+        r = self.resolucion
+        minx, miny, maxx, maxy = plantilla.bounds
+        c_min = min(int(math.floor((minx - self.media_diagonal) / r)), 0)
+        c_max = max(int(math.ceil((maxx + self.media_diagonal) / r)), 0)
+        f_min = min(int(math.floor((miny - self.media_diagonal) / r)), 0)
+        f_max = max(int(math.ceil((maxy + self.media_diagonal) / r)), 0)
+        kernel = np.zeros((f_max - f_min + 1, c_max - c_min + 1), dtype=np.uint8)
+        _pintar(kernel, self._inflar(plantilla), lambda coords: coords / r - (c_min, f_min))
+        return kernel, (-c_min, -f_min)
+
+    def _erosionar(self, imagen, kernel, ancla):
+        import cv2
+
+        return cv2.erode(imagen, kernel, anchor=ancla, borderType=cv2.BORDER_CONSTANT, borderValue=0)
+
+    def posiciones_validas(self, plantilla):
+        """
+        Máscara de las celdas en cuyo centro cabe la plantilla sin pisar obstáculos ni salir del perímetro.
+        La erosión con un kernel arbitrario cuesta lo que su número de celdas; erosionar con su unión de
+        rectángulos (la erosión por una unión es el AND de las erosiones) usa el filtro separable de OpenCV.
+        """
+        kernel, ancla = self._kernel(plantilla)
+        libres = self.libres
+        validas = np.ones(libres.shape, dtype=bool)
+        for f0, c0, alto, ancho in _rectangulos(kernel):
+            # erosionada[j, i] = celdas [j:j+alto, i:i+ancho] libres; se desplaza al origen de la plantilla
+            erosionada = self._erosionar(libres, np.ones((alto, ancho), np.uint8), (0, 0)).astype(bool)
+            validas &= _desplazar(erosionada, f0 - ancla[1], c0 - ancla[0])
+        return validas, kernel, ancla
+
+    def primer_centro(self, plantilla):
+        """Primer centro válido recorriendo x y, dentro de cada columna, y (el orden de la rejilla clásica)."""
+        validas, _, _ = self.posiciones_validas(plantilla)
+        columnas_filas = np.argwhere(validas.T)
+        if columnas_filas.size == 0:
+            return None
+        columna, fila = columnas_filas[0]
+        return self.a_metros(fila, columna)
+
+    def centro_mas_separado(self, plantilla):
+        """
+        Centro válido cuya plantilla queda más lejos de los obstáculos (o de las paredes si aún no hay).
+        La separación de la plantilla en c es el mínimo de la distancia sobre su contorno trasladado a c.
+        Devuelve ((x, y), separación en metros) o None.
+        """
+        import cv2
+
+        validas, kernel, ancla = self.posiciones_validas(plantilla)
+        if not validas.any():
+            return None
+        contorno = kernel - cv2.erode(kernel, np.ones((3, 3), np.uint8), borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        # Solo hace falta la separación alrededor de las celdas válidas (más el alcance del kernel)
+        filas, columnas = np.nonzero(validas)
+        f0 = max(filas.min() - ancla[1], 0)
+        f1 = min(filas.max() + kernel.shape[0] - ancla[1], validas.shape[0])
+        c0 = max(columnas.min() - ancla[0], 0)
+        c1 = min(columnas.max() + kernel.shape[1] - ancla[0], validas.shape[1])
+        separacion = self._erosionar(np.ascontiguousarray(self.distancia()[f0:f1, c0:c1]), contorno, ancla)
+        separacion = np.where(validas[f0:f1, c0:c1], separacion, -1.0)
+        # argmax sobre la traspuesta: a igualdad gana la primera en el orden x / y, como en la rejilla clásica
+        columna, fila = np.unravel_index(np.argmax(separacion.T), separacion.T.shape)
+        x, y = self.a_metros(f0 + fila, c0 + columna)
+        return (x, y), float(separacion[fila, columna]) * self.resolucion
@@ -0,0 +1,178 @@
+"""
+Servidor de inferencia local: un único proceso carga el modelo YOLO y los workers
+de gunicorn le envían las imágenes por un socket Unix. Así el modelo (y torch)
+ocupa memoria una sola vez en lugar de una vez por worker.
+
+Arranque (con la misma INFERENCE_AUTHKEY en el servidor y en la API):
+    python -m src.services.servidor_inferencia --socket /tmp/deteccion_inferencia/inferencia.sock
+y en la API: INFERENCE_MODE=servidor
+"""
+import argparse
+import os
+import stat
+import threading
+from multiprocessing.connection import Listener, Client
+
+from .gestor_modelo import GestorModelo, ModeloActivo
+from .recursos import extraer_detecciones
+
+class ClienteInferencia:
+    """
+    Sustituto del modelo YOLO que reenvía las predicciones al servidor de inferencia.
+    Expone el mismo `predict(source=..., conf=..., iou=...)` que ultralytics.YOLO,
+    pero devuelve directamente los diccionarios de extraer_detecciones.
+    """
+
+    def __init__(self, socket_path, authkey):
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = Client(self.socket_path, family='AF_UNIX', authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _llamar(self, mensaje):
+        # Un reintento por si el servidor se reinició y la conexión quedó rota
+        for intento in range(2):
+            try:
+                conn = self._conexion()
+                conn.send(mensaje)
+                estado, respuesta = conn.recv()
+                break
+            except (EOFError, OSError):
+                self._local.conn = None
+                if intento == 1:
+                    raise
+        if estado != 'ok':
+            raise RuntimeError(f"Error en el servidor de inferencia: {respuesta}")
+        return respuesta
+
+    def predict(self, source, conf=0.25, iou=0.45, **kwargs):
+        imagenes = source if isinstance(source, list) else [source]
+        return self._llamar(('predict', imagenes, conf, iou))
+
+    def ping(self):
+        return self._llamar(('ping',))
+
+    def version(self):
+        return self._llamar(('version',))
+
+    def recargar(self, model_path):
+        return self._llamar(('recargar', model_path))
+
+    def estado(self):
+        return self._llamar(('estado',))
+
+class GestorModeloRemoto:
+    """
+    Equivalente a GestorModelo cuando el modelo vive en el servidor de inferencia.
+    La versión se consulta al servidor en cada petición, de modo que una recarga hecha allí
+    llega a todos los workers de la API (y a sus claves de caché) sin reiniciarlos.
+    """
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def actual(self):
+        try:
+            version = self.cliente.version()
+        except Exception as e:
+            print(f"ERROR: Servidor de inferencia no disponible: {e}")
+            return None
+        return ModeloActivo(self.cliente, version, None, None)
+
+    def recargar(self, model_path):
+        return self.cliente.recargar(model_path)
+
+    def estado(self):
+        return self.cliente.estado()
+
+def _atender(conn, gestor, lock):
+    """Atiende a un worker de la API hasta que cierre la conexión."""
+    with conn:
+        while True:
+            try:
+                mensaje = conn.recv()
+            except EOFError:
+                return
+            try:
+                if mensaje[0] == 'predict':
+                    _, imagenes, conf, iou = mensaje
+                    modelo = gestor.actual().modelo
+                    with lock:
+                        results_list = modelo.predict(source=imagenes, conf=conf, iou=iou, save=False, verbose=False)
+                    conn.send(('ok', [extraer_detecciones(r) for r in results_list]))
+                elif mensaje[0] == 'ping':
+                    conn.send(('ok', 'pong'))
+                elif mensaje[0] == 'version':
+                    conn.send(('ok', gestor.actual().version))
+                elif mensaje[0] == 'recargar':
+                    conn.send(('ok', gestor.recargar(mensaje[1])))
+                elif mensaje[0] == 'estado':
+                    conn.send(('ok', gestor.estado()))
+                else:
+                    conn.send(('error', f"Mensaje desconocido: {mensaje[0]}"))
+            except Exception as e:
+                conn.send(('error', str(e)))
+
+def preparar_directorio_socket(socket_path):
+    """
+    Crea el directorio del socket con permisos 0700. Si ya existe, tiene que ser un directorio
+    (no un enlace) de este usuario y sin permisos para nadie más; si no, se aborta el arranque
+    en lugar de exponer el socket.
+    """
+    directorio = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(directorio, mode=0o700, exist_ok=True)
+    st = os.lstat(directorio)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(
+            f"El directorio del socket '{directorio}' debe ser un directorio privado (0700) del usuario actual."
+        )
+
+def servir(socket_path, model_path, authkey, backend='pytorch', export_dir=None, num_hilos=None):
+    """
+    Carga el modelo una vez y atiende peticiones de inferencia por el socket Unix indicado.
+    Cada conexión se atiende en su propio hilo; las predicciones se serializan con un lock.
+    El modelo se puede sustituir en caliente con el mensaje ('recargar', ruta).
+    """
+    if not authkey:
+        raise ValueError("El servidor de inferencia necesita una clave (INFERENCE_AUTHKEY).")
+    preparar_directorio_socket(socket_path)
+    gestor = GestorModelo(backend=backend, export_dir=export_dir, num_hilos=num_hilos)
+    gestor.cargar(model_path)
+    lock = threading.Lock()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    with Listener(socket_path, family='AF_UNIX', authkey=authkey) as listener:
+        print(f"INFO: Servidor de inferencia escuchando en '{socket_path}' (backend: {backend}).")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"ERROR: Conexión rechazada en el servidor de inferencia: {e}")
+                continue
+            threading.Thread(target=_atender, args=(conn, gestor, lock), daemon=True).start()
+
+if __name__ == '__main__':
+    from ..config import Config
+
+    parser = argparse.ArgumentParser(description="Servidor de inferencia YOLO compartido por los workers de la API.")
+    parser.add_argument('--socket', default=Config.INFERENCE_SOCKET)
+    parser.add_argument('--model', default=Config.MODEL_PATH)
+    parser.add_argument('--backend', default=Config.INFERENCE_BACKEND)
+    parser.add_argument('--export-dir', default=Config.MODEL_EXPORT_DIR)
+    parser.add_argument('--torch-threads', type=int, default=Config.TORCH_THREADS)
+    args = parser.parse_args()
+    if not Config.INFERENCE_AUTHKEY:
+        parser.error("define INFERENCE_AUTHKEY en el entorno (la misma que usan los workers de la API).")
+
+    servir(
+        args.socket, args.model, Config.INFERENCE_AUTHKEY.encode(),
+        backend=args.backend, export_dir=args.export_dir, num_hilos=args.torch_threads
+    )
@@ -0,0 +1,107 @@
+import time
+import numpy as np
+
+from .recursos import extraer_detecciones
+
+def generar_teselas(alto, ancho, tam, solape):
+    """
+    Divide una imagen en teselas cuadradas que se solapan.
+    Devuelve una lista de (x0, y0, x1, y1) en píxeles; la última fila/columna se alinea al borde.
+    Parámetros:
+    - alto, ancho: Tamaño de la imagen en píxeles.
+    - tam: Lado de cada tesela en píxeles.
+    - solape: Fracción de solape entre teselas vecinas (0 a <1).
+    """
+    tam = int(tam)
+    paso = max(1, int(tam * (1.0 - solape)))
+
+    def inicios(total):
+        if total <= tam:
+            return [0]
+        posiciones = list(range(0, total - tam, paso))
+        posiciones.append(total - tam)
+        return posiciones
+
+    return [
+        (x0, y0, min(x0 + tam, ancho), min(y0 + tam, alto))
+        for y0 in inicios(alto)
+        for x0 in inicios(ancho)
+    ]
+
+def nms_vectorizado(xyxy, conf, cls, iou_umbral):
+    """
+    NMS por clase con NumPy: desplaza las cajas de cada clase a una región distinta
+    para que nunca se supriman entre clases, y calcula el IoU contra todas las
+    restantes en cada paso. Devuelve los índices conservados, ordenados por confianza.
+    """
+    if len(conf) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    desplazamiento = cls.astype(np.float64)[:, None] * (float(xyxy.max()) + 1.0)
+    cajas = xyxy.astype(np.float64) + desplazamiento
+    areas = (cajas[:, 2] - cajas[:, 0]) * (cajas[:, 3] - cajas[:, 1])
+    orden = np.argsort(-conf, kind='stable')
+
+    conservados = []
+    while orden.size:
+        i = orden[0]
+        conservados.append(i)
+        resto = orden[1:]
+        ix1 = np.maximum(cajas[i, 0], cajas[resto, 0])
+        iy1 = np.maximum(cajas[i, 1], cajas[resto, 1])
+        ix2 = np.minimum(cajas[i, 2], cajas[resto, 2])
+        iy2 = np.minimum(cajas[i, 3], cajas[resto, 3])
+        inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+        iou = inter / (areas[i] + areas[resto] - inter + 1e-9)
+        orden = resto[iou <= iou_umbral]
+
+    return np.asarray(conservados, dtype=np.int64)
+
+def detectar_por_teselas(model, img, tam, solape, batch_size, conf=0.25, iou=0.45):
+    """
+    Inferencia por teselas para planos muy grandes: evita que el reescalado a la entrada
+    del modelo haga desaparecer las sillas. Las teselas se predicen por lotes, las cajas
+    se llevan a coordenadas globales y los duplicados de las zonas solapadas se fusionan con NMS.
+    Devuelve (detecciones, tiempos_ms, num_teselas); las detecciones tienen el formato de extraer_detecciones.
+    Parámetros:
+    - model: Modelo YOLO cargado (o cliente del servidor de inferencia).
+    - img: Arreglo NumPy BGR del plano completo.
+    - tam, solape: Lado de la tesela en píxeles y fracción de solape.
+    - batch_size: Teselas por llamada al modelo.
+    - conf, iou: Umbrales de confianza y NMS.
+    """
+    tiempos = {}
+    alto, ancho = img.shape[:2]
+
+    t0 = time.perf_counter()
+    teselas = generar_teselas(alto, ancho, tam, solape)
+    recortes = [img[y0:y1, x0:x1] for (x0, y0, x1, y1) in teselas]
+    tiempos['teselado'] = (time.perf_counter() - t0) * 1000.0
+
+    t0 = time.perf_counter()
+    batch_size = max(1, int(batch_size))
+    parciales = []
+    for inicio in range(0, len(recortes), batch_size):
+        lote = recortes[inicio:inicio + batch_size]
+        parciales.extend(extraer_detecciones(r) for r in model.predict(source=lote, conf=conf, iou=iou, save=False, verbose=False))
+    tiempos['inferencia'] = (time.perf_counter() - t0) * 1000.0
+
+    t0 = time.perf_counter()
+    desplazamientos = np.array([[x0, y0, x0, y0] for (x0, y0, _, _) in teselas], dtype=np.float32)
+    xyxy = np.concatenate(
+        [p['xyxy'] + desplazamientos[i] for i, p in enumerate(parciales)] or [np.zeros((0, 4), np.float32)]
+    )
+    confs = np.concatenate([p['conf'] for p in parciales] or [np.zeros(0, np.float32)])
+    clases = np.concatenate([p['cls'] for p in parciales] or [np.zeros(0, np.int32)])
+    keep = nms_vectorizado(xyxy, confs, clases, iou)
+    tiempos['fusion'] = (time.perf_counter() - t0) * 1000.0
+
+    names = parciales[0]['names'] if parciales else {}
+    detecciones = {
+        'xyxy': xyxy[keep].astype(np.float32),
+        'conf': confs[keep].astype(np.float32),
+        'cls': clases[keep].astype(np.int32),
+        'orig_shape': (int(alto), int(ancho)),
+        'names': names,
+    }
+    return detecciones, tiempos, len(teselas)
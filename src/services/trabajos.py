@@ -0,0 +1,213 @@
+import json
+import multiprocessing
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .deteccion import parsear_config, parsear_agrupacion, detectar_planos, construir_layout
+from .cache_detecciones import CacheDetecciones
+from .gestor_modelo import GestorModelo
+from .servidor_inferencia import ClienteInferencia, GestorModeloRemoto
+
+ESTADO_PENDIENTE = 'pendiente'
+ESTADO_PROCESANDO = 'procesando'
+ESTADO_COMPLETADO = 'completado'
+ESTADO_ERROR = 'error'
+
+class AlmacenTrabajos:
+    """
+    Estado de los trabajos de detección en un archivo SQLite local.
+    Cada operación abre su propia conexión, así que lo pueden compartir los workers
+    de gunicorn y los procesos del pool de detección.
+    """
+
+    def __init__(self, db_path, ttl_s=24 * 3600):
+        self.db_path = db_path
+        self.ttl_s = ttl_s
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS trabajos ("
+                " id TEXT PRIMARY KEY, estado TEXT NOT NULL, creado REAL NOT NULL,"
+                " actualizado REAL NOT NULL, resultado TEXT, error TEXT)"
+            )
+
+    def _conectar(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def crear(self):
+        job_id = uuid.uuid4().hex
+        ahora = time.time()
+        with self._conectar() as conn:
+            # Aprovechar la inserción para purgar trabajos viejos
+            conn.execute("DELETE FROM trabajos WHERE actualizado < ?", (ahora - self.ttl_s,))
+            conn.execute(
+                "INSERT INTO trabajos (id, estado, creado, actualizado) VALUES (?, ?, ?, ?)",
+                (job_id, ESTADO_PENDIENTE, ahora, ahora)
+            )
+        return job_id
+
+    def actualizar(self, job_id, estado, resultado=None, error=None):
+        with self._conectar() as conn:
+            conn.execute(
+                "UPDATE trabajos SET estado = ?, actualizado = ?, resultado = ?, error = ? WHERE id = ?",
+                (estado, time.time(), json.dumps(resultado) if resultado is not None else None, error, job_id)
+            )
+
+    def obtener(self, job_id):
+        with self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT id, estado, creado, actualizado, resultado, error FROM trabajos WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if fila is None:
+            return None
+        return {
+            'job_id': fila[0],
+            'status': fila[1],
+            'created_at': fila[2],
+            'updated_at': fila[3],
+            'layout': json.loads(fila[4]) if fila[4] else None,
+            'error': fila[5],
+        }
+
+# --- Estado de cada proceso del pool (el modelo y el almacén se abren una sola vez por proceso) ---
+_gestor_worker = None
+_cache_worker = None
+_executor_worker = None
+_almacen_worker = None
+
+def _inicializar_worker(db_path, model_path, backend, export_dir, socket_inferencia, authkey, num_hilos_torch):
+    global _gestor_worker, _cache_worker, _executor_worker, _almacen_worker
+    _almacen_worker = AlmacenTrabajos(db_path)
+    if socket_inferencia:
+        # Con servidor de inferencia compartido, el worker del pool tampoco carga el modelo
+        _gestor_worker = GestorModeloRemoto(ClienteInferencia(socket_inferencia, authkey))
+    else:
+        _gestor_worker = GestorModelo(backend=backend, export_dir=export_dir, num_hilos=num_hilos_torch)
+        _gestor_worker.cargar(model_path)
+    _executor_worker = ThreadPoolExecutor(max_workers=1)
+    _cache_worker = CacheDetecciones(max_entradas=32)
+    print(f"INFO: Worker de detección listo (modelo '{model_path}').")
+
+def _ejecutar_trabajo(job_id, datos_imagen, config_data, conf, iou, teselado, opciones_perimetro,
+                      max_pixeles=None, tam_lote_teselas=None):
+    """Se ejecuta dentro del pool: detecta, construye el layout y deja el resultado en el almacén."""
+    almacen = _almacen_worker
+    almacen.actualizar(job_id, ESTADO_PROCESANDO)
+    try:
+        local_ancho_m, local_alto_m, filtros_m = parsear_config(config_data)
+        activo = _gestor_worker.actual()
+        if activo is None:
+            raise RuntimeError("Modelo YOLO no disponible en el worker.")
+        plano = detectar_planos(
+            activo.modelo, [datos_imagen], 1, conf=conf, iou=iou,
+            cache=_cache_worker, id_modelo=activo.version,
+            teselado=teselado, opciones_perimetro=opciones_perimetro, executor=_executor_worker,
+            max_pixeles=max_pixeles, tam_lote_teselas=tam_lote_teselas
+        )[0]
+        layout_data = construir_layout(
+            plano['detecciones'], plano['perimetro'], local_ancho_m, local_alto_m, filtros_m,
+            agrupacion=parsear_agrupacion(config_data.get('agrupacion'))
+        )
+        layout_data['model_version'] = activo.version
+        almacen.actualizar(job_id, ESTADO_COMPLETADO, resultado=layout_data)
+    except Exception as e:
+        almacen.actualizar(job_id, ESTADO_ERROR, error=str(e))
+
+class GestorTrabajos:
+    """
+    Envía trabajos de detección a un pool de procesos dedicado, separado de los workers HTTP.
+    El pool se crea perezosamente en el primer envío (después del fork de gunicorn)
+    y sus procesos se arrancan con 'spawn' para no heredar el estado de torch del padre.
+    Cada worker de la API tiene su propio pool, y con INFERENCE_MODE=local cada proceso del pool
+    carga su copia del modelo: en total, workers de gunicorn × num_workers copias (ver DETECTION_WORKERS).
+    """
+
+    def __init__(self, almacen, model_path, backend='pytorch', export_dir=None,
+                 socket_inferencia=None, authkey=b'', num_workers=1, conf=0.25, iou=0.45, num_hilos_torch=None,
+                 max_pixeles=None, tam_lote_teselas=None):
+        self.almacen = almacen
+        self.model_path = model_path
+        self.backend = backend
+        self.export_dir = export_dir
+        self.socket_inferencia = socket_inferencia
+        self.authkey = authkey
+        self.num_hilos_torch = num_hilos_torch
+        self.num_workers = max(1, int(num_workers))
+        self.conf = conf
+        self.iou = iou
+        self.max_pixeles = max_pixeles
+        self.tam_lote_teselas = tam_lote_teselas
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _obtener_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_inicializar_worker,
+                    initargs=(self.almacen.db_path, self.model_path, self.backend, self.export_dir,
+                              self.socket_inferencia, self.authkey, self.num_hilos_torch)
+                )
+            return self._pool
+
+    def _descartar_pool(self, pool):
+        """Olvida 'pool' si sigue siendo el actual (el siguiente envío crea otro) y lo cierra."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def actualizar_modelo(self, model_path):
+        """
+        Tras una recarga en caliente: los trabajos nuevos van a un pool nuevo con los pesos nuevos,
+        y el pool anterior termina los que ya tenía encolados y se cierra solo.
+        """
+        with self._lock:
+            self.model_path = model_path
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def enviar(self, datos_imagen, config_data, teselado=None, opciones_perimetro=None):
+        job_id = self.almacen.crear()
+        pool = self._obtener_pool()
+        try:
+            futuro = pool.submit(
+                _ejecutar_trabajo, job_id, datos_imagen, config_data,
+                self.conf, self.iou, teselado, opciones_perimetro, self.max_pixeles, self.tam_lote_teselas
+            )
+        except Exception as e:
+            # Pool roto (p. ej. un worker murió): se recrea en el siguiente envío
+            self._descartar_pool(pool)
+            self.almacen.actualizar(job_id, ESTADO_ERROR, error=f"No se pudo encolar el trabajo: {e}")
+        else:
+            futuro.add_done_callback(lambda f: self._al_terminar(job_id, pool, f))
+        return job_id
+
+    def _al_terminar(self, job_id, pool, futuro):
+        """
+        _ejecutar_trabajo guarda sus propios errores en el almacén; aquí solo llegan los que ocurren
+        fuera de él (el proceso murió, los argumentos no se pudieron enviar, el trabajo se canceló),
+        que de otro modo dejarían el trabajo 'pendiente' o 'procesando' para siempre.
+        """
+        if futuro.cancelled():
+            error = "El trabajo se canceló antes de ejecutarse."
+        else:
+            excepcion = futuro.exception()
+            if excepcion is None:
+                return
+            error = f"El trabajo falló en el pool de detección: {excepcion}"
+            if isinstance(excepcion, BrokenProcessPool):
+                # Un proceso del pool murió: el siguiente envío crea un pool nuevo
+                self._descartar_pool(pool)
+        try:
+            self.almacen.actualizar(job_id, ESTADO_ERROR, error=error)
+        except Exception as e:
+            print(f"ERROR: No se pudo marcar el trabajo {job_id} como fallido: {e}")